@@ -0,0 +1,35 @@
+"""
+Migration: Add position_state and last_signal_type columns to signal_bots table
+Para que los bots recuerden sus posiciones abiertas al reiniciar el servidor.
+La migración también corre sola al importar database (init_database); este
+script solo la fuerza y muestra el esquema resultante
+"""
+
+from database import get_db_connection, migrate_signal_bots
+
+def migrate_database():
+    """Agregar columnas position_state y last_signal_type a signal_bots"""
+
+    conn = get_db_connection()
+    cursor = conn.cursor()
+
+    try:
+        migrate_signal_bots(conn)
+
+        # Mostrar esquema actualizado
+        print("\n📋 Esquema actual de signal_bots:")
+        cursor.execute("PRAGMA table_info(signal_bots)")
+        for col in cursor.fetchall():
+            print(f"   - {col[1]} ({col[2]})")
+
+    except Exception as e:
+        print(f"❌ Error durante la migración: {e}")
+        conn.rollback()
+
+    finally:
+        conn.close()
+
+if __name__ == '__main__':
+    print("🚀 Iniciando migración de base de datos...")
+    migrate_database()
+    print("\n✅ Migración completada")
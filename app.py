@@ -17,7 +17,6 @@ import hashlib
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from functools import wraps
-import requests
 
 # Cargar variables de entorno
 load_dotenv()
@@ -29,6 +28,8 @@ from admin_routes import admin_bp
 from payments_routes import payments_bp
 from signal_bot_routes import signal_bot_bp
 from subscription_routes import subscription_bp
+from http_client import http_client
+from ohlcv_store import ohlcv_store
 
 # Configurar Flask
 app = Flask(__name__)
@@ -179,7 +180,7 @@ def download_from_coingecko(symbol, pair, days=365):
         if not coin_id:
             # Intentar buscar por símbolo
             search_url = f"https://api.coingecko.com/api/v3/search?query={symbol}"
-            response = requests.get(search_url, timeout=10)
+            response = http_client.get(search_url)
             if response.status_code == 200:
                 coins = response.json().get('coins', [])
                 if coins:
@@ -202,7 +203,7 @@ def download_from_coingecko(symbol, pair, days=365):
             'interval': 'daily'
         }
         
-        response = requests.get(url, params=params, timeout=30)
+        response = http_client.get(url, params=params)
         
         if response.status_code != 200:
             raise Exception(f"Error CoinGecko API: {response.status_code}")
@@ -436,6 +437,7 @@ def download_data():
     try:
         # Lazy import de ccxt solo cuando se necesita
         import ccxt
+        from binance_rate_limiter import binance_rate_limiter, endpoint_weight, PRIORITY_BACKTEST
         
         symbol = request.json.get('symbol', 'BTC/USDT')
         timeframe = request.json.get('timeframe', '1d')
@@ -443,28 +445,46 @@ def download_data():
         
         # Inicializar exchange
         exchange = ccxt.binance()
-        since = exchange.parse8601(f"{start_date}T00:00:00Z")
+        start = exchange.parse8601(f"{start_date}T00:00:00Z")
+        
+        # Velas ya guardadas (descargas anteriores o bots con MARKET_DATA_PERSIST): bajar solo lo que falta
+        bounds = ohlcv_store.bounds(symbol, timeframe)
+        since = bounds[1] if bounds and bounds[0] <= start else start
         
         # Descargar datos en batches
         all_bars = []
         total_requests = 0
         
         while True:
-            bars = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=1000)
+            # Presupuesto compartido con los bots: la descarga cede ante ellos
+            binance_rate_limiter.acquire(endpoint_weight('klines'), PRIORITY_BACKTEST)
+            try:
+                bars = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=1000)
+            except ccxt.DDoSProtection:
+                # 429/418: detener también a los bots hasta Retry-After
+                binance_rate_limiter.update_from_headers(exchange.last_response_headers, 429)
+                raise
+            binance_rate_limiter.update_from_headers(exchange.last_response_headers)
             if not bars:
                 break
             
             all_bars.extend(bars)
             since = bars[-1][0] + 1
             total_requests += 1
-            time.sleep(exchange.rateLimit / 1000)
             
             if total_requests % 5 == 0:
                 print(f"Descargadas {len(all_bars)} velas...")
         
+        if all_bars:
+            # Meses de duración variable: sin control de huecos
+            period_ms = None if timeframe.endswith('M') else exchange.parse_timeframe(timeframe) * 1000
+            ohlcv_store.write(symbol, timeframe, [bar[0] for bar in all_bars], [bar[1:6] for bar in all_bars],
+                              period_ms=period_ms)
+        
         # Crear DataFrame y guardar
-        df = pd.DataFrame(all_bars, columns=["Date", "Open", "High", "Low", "Close", "Volume"])
-        df["Date"] = pd.to_datetime(df["Date"], unit="ms")
+        timestamps, values = ohlcv_store.read(symbol, timeframe, start_time=start)
+        df = pd.DataFrame(values, columns=["Open", "High", "Low", "Close", "Volume"])
+        df.insert(0, "Date", pd.to_datetime(timestamps, unit="ms"))
         
         filename = f"{symbol.replace('/', '')}_{timeframe}.csv"
         filepath = os.path.join(DATA_DIR, filename)
@@ -476,6 +496,7 @@ def download_data():
             'success': True,
             'message': 'Datos descargados exitosamente',
             'rows': len(df),
+            'downloaded': len(all_bars),
             'filename': filename,
             'file_size': f"{file_size / 1024:.2f} KB"
         })
@@ -0,0 +1,205 @@
+"""
+Binance Rate Limiter - Presupuesto global de peso de requests a Binance
+Token bucket compartido por los bots (MarketDataService, MarketDataProvider)
+y las descargas de backtest (/api/download), con prioridad para los bots
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Mapping, Optional
+
+from bot_logging import get_logger
+
+logger = get_logger('binance_rate_limiter')
+
+# Binance spot: 6000 de peso por minuto por IP (X-MBX-USED-WEIGHT-1M)
+BINANCE_WEIGHT_LIMIT = int(os.getenv('BINANCE_WEIGHT_LIMIT', '6000'))
+BINANCE_WEIGHT_SAFETY = float(os.getenv('BINANCE_WEIGHT_SAFETY', '0.8'))  # Fracción del límite que usamos
+BACKTEST_WEIGHT_SHARE = float(os.getenv('BACKTEST_WEIGHT_SHARE', '0.5'))  # Máximo para descargas de backtest
+
+# Peso por endpoint de /api/v3 (https://binance-docs.github.io/apidocs/spot/en/#market-data-endpoints)
+ENDPOINT_WEIGHTS = {
+    'klines': 2,
+    'uiKlines': 2,
+    'ticker/price': 2,
+    'ticker/24hr': 2,
+    'depth': 5,
+    'exchangeInfo': 20,
+}
+
+# Clases de prioridad
+PRIORITY_LIVE = 0       # Datos de los bots
+PRIORITY_BACKTEST = 1   # Descargas para backtest: solo usan BACKTEST_WEIGHT_SHARE y ceden ante los bots
+
+USED_WEIGHT_HEADER = 'x-mbx-used-weight-1m'
+BAN_STATUS_CODES = (418, 429)
+
+
+def endpoint_weight(endpoint: str) -> int:
+    """Peso de un endpoint (ej: 'klines'); 1 si no está en la tabla"""
+    return ENDPOINT_WEIGHTS.get(endpoint.strip('/').split('api/v3/')[-1], 1)
+
+
+class BinanceRateLimiter:
+    """
+    Token bucket con el peso por minuto de Binance
+
+    - Singleton: un presupuesto para todo el proceso (el límite es por IP)
+    - acquire() bloquea hasta que haya peso disponible
+    - Las descargas de backtest no bajan el saldo de la reserva de los bots
+      y esperan mientras algún bot esté esperando
+    - Se sincroniza con X-MBX-USED-WEIGHT-1M y se detiene ante 429/418
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """Implementación Singleton thread-safe"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """Inicializar limitador (solo una vez)"""
+        if hasattr(self, '_initialized'):
+            return
+
+        self._initialized = True
+        self.condition = threading.Condition()
+        self.configure(BINANCE_WEIGHT_LIMIT, BINANCE_WEIGHT_SAFETY, BACKTEST_WEIGHT_SHARE)
+
+    def configure(self, limit: int, safety: float = BINANCE_WEIGHT_SAFETY,
+                  backtest_share: float = BACKTEST_WEIGHT_SHARE):
+        """
+        Reiniciar el presupuesto
+
+        Args:
+            limit: Peso por minuto que permite Binance
+            safety: Fracción del límite a usar
+            backtest_share: Fracción del presupuesto disponible para backtest
+        """
+        with self.condition:
+            self.limit = limit
+            self.capacity = max(1.0, limit * safety)
+            self.rate = self.capacity / 60.0  # Peso que se recupera por segundo
+            self.backtest_floor = self.capacity * (1 - backtest_share)
+            self.tokens = self.capacity
+            self.updated = time.monotonic()
+            self.blocked_until = 0.0
+            self.server_used: Optional[int] = None
+            self.live_waiting = 0
+            self.stats = {'requests': 0, 'weight': 0, 'waits': 0, 'wait_seconds': 0.0, 'bans': 0}
+            self.condition.notify_all()
+
+    def acquire(self, weight: int, priority: int = PRIORITY_LIVE, timeout: Optional[float] = None) -> bool:
+        """
+        Reservar peso para un request (bloquea hasta que haya)
+
+        Args:
+            weight: Peso del request (ver endpoint_weight)
+            priority: PRIORITY_LIVE o PRIORITY_BACKTEST
+            timeout: Segundos máximos de espera (None = sin límite)
+
+        Returns:
+            True si se reservó; False si se agotó el timeout
+        """
+        live = priority == PRIORITY_LIVE
+        weight = min(weight, self.capacity)
+        started = time.monotonic()
+        deadline = None if timeout is None else started + timeout
+        waited = False
+
+        with self.condition:
+            if live:
+                self.live_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    floor = 0.0 if live else self.backtest_floor
+                    if now >= self.blocked_until and (live or self.live_waiting == 0) \
+                            and self.tokens - weight >= floor:
+                        self.tokens -= weight
+                        self.stats['requests'] += 1
+                        self.stats['weight'] += weight
+                        if waited:
+                            self.stats['waits'] += 1
+                            self.stats['wait_seconds'] += now - started
+                        return True
+
+                    if now < self.blocked_until:
+                        pause = self.blocked_until - now
+                    else:
+                        pause = max((weight + floor - self.tokens) / self.rate, 0.01)
+                    if deadline is not None:
+                        if now >= deadline:
+                            return False
+                        pause = min(pause, deadline - now)
+                    waited = True
+                    self.condition.wait(timeout=pause)
+            finally:
+                if live:
+                    self.live_waiting -= 1
+                    self.condition.notify_all()
+
+    def update_from_headers(self, headers: Optional[Mapping], status_code: Optional[int] = None):
+        """
+        Ajustar el saldo con la respuesta de Binance
+
+        Args:
+            headers: Headers de la respuesta (requests o ccxt)
+            status_code: Código HTTP; 429/418 detienen los requests durante Retry-After
+        """
+        values = {str(name).lower(): value for name, value in (headers or {}).items()}
+
+        with self.condition:
+            used = values.get(USED_WEIGHT_HEADER)
+            if used is not None:
+                try:
+                    self.server_used = int(used)
+                except ValueError:
+                    pass
+                else:
+                    # El servidor cuenta también lo que usaron otros procesos con la misma IP
+                    self._refill(time.monotonic())
+                    self.tokens = min(self.tokens, self.capacity - self.server_used)
+
+            if status_code in BAN_STATUS_CODES:
+                try:
+                    retry_after = float(values.get('retry-after', 60))
+                except ValueError:
+                    retry_after = 60.0
+                self.blocked_until = max(self.blocked_until, time.monotonic() + retry_after)
+                self.tokens = min(self.tokens, 0.0)
+                self.stats['bans'] += 1
+                logger.warning("⛔ Binance respondió %s: requests detenidos %.0fs", status_code, retry_after)
+            self.condition.notify_all()
+
+    def get_stats(self) -> Dict:
+        """Uso actual del presupuesto"""
+        with self.condition:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                'limit_per_minute': self.limit,
+                'budget': round(self.capacity),
+                'available': round(self.tokens, 1),
+                'used_percent': round(100 * (1 - self.tokens / self.capacity), 1),
+                'server_used_weight': self.server_used,
+                'blocked_for': round(max(0.0, self.blocked_until - now), 1),
+                'live_waiting': self.live_waiting,
+                **self.stats,
+            }
+
+    def _refill(self, now: float):
+        """Recuperar peso por el tiempo transcurrido (llamar con condition tomado)"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+# Instancia global singleton
+binance_rate_limiter = BinanceRateLimiter()
@@ -5,21 +5,50 @@ Maneja el ciclo de vida de los bots: iniciar, detener, monitorear
 OPTIMIZADO: Usa Market Data Service centralizado para reducir llamadas a Binance
 """
 
+import logging
+import os
 import threading
 import time
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Dict, List, Optional
 import json
+from concurrent.futures import ThreadPoolExecutor
 
-from market_data_service import market_data_service
+from market_data_service import market_data_service, timeframe_to_seconds
+from fetch_scheduler import FetchScheduler, IDLE
 from strategy_evaluator import StrategyEvaluator
+from strategy_compiler import CompiledStrategy, compile_strategy
 from telegram_sender import TelegramSender
 from database import get_db_connection
+from bot_logging import BotLogger, get_logger
+
+logger = get_logger('bot_engine')
+
+# Evaluar los bots al actualizarse los datos de su par en lugar de con un timer por bot
+BOT_BATCH_EVALUATION = os.getenv('BOT_BATCH_EVALUATION', 'false').lower() in ('1', 'true', 'yes')
+
+# Chequeos simultáneos de bots (un pool para todos en lugar de un thread por bot)
+BOT_ENGINE_WORKERS = int(os.getenv('BOT_ENGINE_WORKERS', '8'))
+
+# Programador compartido de los chequeos de los bots
+bot_scheduler = FetchScheduler(BOT_ENGINE_WORKERS, spacing=0)
+
+# Segundos en los que se reparten los primeros chequeos al arrancar muchos bots
+BOT_STARTUP_SPREAD = float(os.getenv('BOT_STARTUP_SPREAD', '10'))
+
+# Mensajes de inicio por Telegram en segundo plano (no retrasan el arranque ni los chequeos)
+BOT_NOTIFY_WORKERS = int(os.getenv('BOT_NOTIFY_WORKERS', '4'))
+startup_notices = ThreadPoolExecutor(max_workers=BOT_NOTIFY_WORKERS, thread_name_prefix="BotNotify")
+
+# Bits de signal_bots.position_state (posiciones abiertas, sobreviven a un reinicio)
+POSITION_LONG = 1
+POSITION_SHORT = 2
 
 class TradingBot:
     """Bot individual de trading"""
     
-    def __init__(self, config: Dict):
+    def __init__(self, config: Dict, batch: bool = False, scheduler: Optional[FetchScheduler] = None,
+                 plan: Optional[CompiledStrategy] = None, subscribe: bool = True):
         """
         Inicializar un bot de trading
         
@@ -31,8 +60,20 @@ class TradingBot:
                 - chat_id: ID del chat de Telegram
                 - symbol: Par de trading (ej: BTCUSDT)
                 - timeframe: Intervalo de tiempo (1m, 5m, 15m, 1h, 4h, 1d)
-                - check_interval: Segundos entre cada verificación
+                - check_interval: Segundos mínimos entre dos evaluaciones (y
+                  espera tras un error); los chequeos se disparan con cada
+                  versión nueva de los datos del par
                 - strategy: Configuración de la estrategia
+                - position_state / last_signal_type: Posiciones guardadas
+                  (opcional, para no repetir señales de entrada al reiniciar)
+            batch: Si es True el bot no tiene chequeo propio: lo evalúa el
+                BotEngine cada vez que se actualizan los datos de su par
+            scheduler: Programador de los chequeos (por defecto bot_scheduler);
+                el bot no tiene thread propio: el programador lo ejecuta cuando
+                el MarketDataService avisa de datos nuevos
+            plan: Estrategia ya compilada (compartida entre bots con la misma estrategia)
+            subscribe: False si la suscripción al MarketDataService la hace el
+                BotEngine agrupada por par (start_bots)
         """
         self.config = config
         self.bot_id = config['id']
@@ -42,120 +83,213 @@ class TradingBot:
         self.check_interval = config['check_interval']
         self.strategy = config['strategy']
         self.ignore_position_tracking = config.get('ignore_position_tracking', False)  # Nuevo campo
+        self.log = BotLogger(self.bot_id, self.name)
+        self.batch = batch
+        self.scheduler = scheduler or bot_scheduler
+        self.check_lock = threading.Lock()  # Serializa chequeos (timer/batch vs force_check)
+        
+        # Compilar la estrategia una sola vez (lanza StrategyCompileError si está mal formada)
+        self.plan = plan if plan is not None else compile_strategy(self.strategy)
         
         # Componentes
         # NO crear MarketDataProvider individual - usar servicio centralizado
         self.evaluator = StrategyEvaluator()
         self.telegram = TelegramSender(config['bot_token'], config['chat_id'])
         
-        # Suscribirse al Market Data Service
-        market_data_service.subscribe(self.bot_id, self.symbol, self.timeframe)
-        
         # Estado
         self.running = False
-        self.thread = None
+        self.iterations = 0
         self.last_check = None
+        self.last_version = 0  # Última versión de datos evaluada
+        self.next_check = 0.0  # Monotónico: antes no se vuelve a evaluar (check_interval)
+        self.check_deferred = False  # Hay un chequeo programado para cuando se cumpla check_interval
+        self.data_delay = 0.0  # Espera del primer chequeo tras los primeros datos (arranque en bloque)
+        
+        # Suscribirse al Market Data Service (avisa por push de cada versión nueva)
+        if subscribe:
+            market_data_service.subscribe(self.bot_id, self.symbol, self.timeframe, callback=self._on_snapshot)
+            market_data_service.track_indicators(self.symbol, self.timeframe, self.plan.roots)
         self.signals_sent = 0
         self.start_time = None
         
-        # Tracking de posiciones
-        self.in_long_position = False
-        self.in_short_position = False
-        self.last_signal_type = None
+        # Tracking de posiciones (restaurado de la base de datos al reiniciar)
+        position_state = config.get('position_state') or 0
+        self.in_long_position = bool(position_state & POSITION_LONG)
+        self.in_short_position = bool(position_state & POSITION_SHORT)
+        self.last_signal_type = config.get('last_signal_type')
     
-    def start(self):
-        """Iniciar el bot"""
+    @property
+    def position_state(self) -> int:
+        """Posiciones abiertas como bits POSITION_LONG | POSITION_SHORT"""
+        return ((POSITION_LONG if self.in_long_position else 0)
+                | (POSITION_SHORT if self.in_short_position else 0))
+    
+    def start(self, first_check: float = 0.0, data_delay: float = 0.0):
+        """
+        Iniciar el bot
+        
+        Args:
+            first_check: Segundos hasta el primer chequeo (IDLE = con los
+                primeros datos del par)
+            data_delay: Con first_check=IDLE, segundos de espera desde que
+                llegan los primeros datos hasta el primer chequeo
+        """
         if self.running:
-            print(f"⚠️ Bot {self.name} already running")
+            self.log.warning("⚠️ Bot already running")
             return
         
         self.running = True
         self.start_time = datetime.now()
-        self.thread = threading.Thread(target=self._run_loop, daemon=True)
-        self.thread.start()
+        self.data_delay = data_delay
+        startup_notices.submit(self._send_start_message)
         
-        print(f"✅ Bot {self.name} started for {self.symbol} on {self.timeframe}")
+        if not self.batch:
+            # En modo batch no hay chequeo propio: lo evalúa el BotEngine
+            self.scheduler.schedule(self.bot_id, self._run_check, first_check)
+            if first_check == IDLE and market_data_service.has_data(self.symbol, self.timeframe):
+                self.scheduler.wake(self.bot_id)  # Los datos llegaron antes de programar el chequeo
+        
+        self.log.info("✅ Bot started for %s on %s%s", self.symbol, self.timeframe,
+                      " (batch evaluation)" if self.batch else "")
     
     def stop(self):
-        """Detener el bot"""
+        """Detener el bot (el chequeo programado se cancela de inmediato)"""
+        # Desuscribirse del Market Data Service
+        market_data_service.unsubscribe(self.bot_id, self.symbol, self.timeframe)
         if not self.running:
-            # Desuscribirse del Market Data Service
-            market_data_service.unsubscribe(self.bot_id, self.symbol, self.timeframe)
             return
 
         self.running = False
-        if self.thread:
-            self.thread.join(timeout=5)
+        if not self.batch:
+            self.scheduler.cancel(self.bot_id)
+        with self.check_lock:
+            pass  # Esperar a que termine un chequeo en curso
 
-        print(f"⏹️ Bot {self.name} stopped")
-    
-    def _run_loop(self):
-        """Loop principal del bot"""
-        print(f"🚀 [THREAD START] Bot '{self.name}' thread initiated")
-        print(f"   Bot ID: {self.bot_id}")
-        print(f"   Symbol: {self.symbol}")
-        print(f"   Timeframe: {self.timeframe}")
-        print(f"   Check Interval: {self.check_interval}s")
-        print(f"   Running: {self.running}")
-        
-        # Mensaje de inicio
-        start_msg = f"🤖 Bot '{self.name}' iniciado\n📊 Monitoreando {self.symbol} en {self.timeframe}\n⏰ Verificará cada {self.check_interval}s"
-        self.telegram.send_message(start_msg, disable_notification=True)
+        self.log.info("⏹️ Bot stopped")
+    
+    def _run_check(self) -> Optional[float]:
+        """
+        Un chequeo del bot (en el pool del programador)
         
-        iteration = 0
-        while self.running:
-            iteration += 1
-            try:
-                print(f"\n{'='*60}")
-                print(f"🔄 [ITERATION #{iteration}] Bot '{self.name}' - {datetime.now().strftime('%H:%M:%S')}")
-                print(f"   Running status: {self.running}")
-                print(f"{'='*60}")
-                
-                self._check_signals()
-                self.last_check = datetime.now()
-                
-                # Actualizar estadísticas en la base de datos
-                self._update_stats()
-                
-                print(f"⏳ Sleeping for {self.check_interval}s before next check...")
-                print(f"   Next check at: {(datetime.now() + timedelta(seconds=self.check_interval)).strftime('%H:%M:%S')}")
-                
-                # Esperar antes del próximo chequeo
-                time.sleep(self.check_interval)
-                
-            except Exception as e:
-                print(f"❌ Error in bot {self.name} loop: {e}")
-                import traceback
-                traceback.print_exc()
-                print(f"⏳ Sleeping {self.check_interval}s after error...")
-                time.sleep(self.check_interval)
+        El primero siempre evalúa; los siguientes solo si el par tiene una
+        versión de datos más nueva que la última evaluada y pasaron al menos
+        check_interval segundos desde la evaluación anterior (los datos que
+        llegan antes se evalúan juntos al cumplirse el intervalo).
+        
+        Returns:
+            IDLE (esperar al próximo aviso de datos), segundos hasta que se
+            cumpla check_interval, check_interval tras un error o None si el
+            bot se detuvo
+        """
+        if not self.running:
+            return None
+        
+        self.check_deferred = False
+        try:
+            if self.iterations == 0 and self.data_delay > 0:
+                # Primeros datos del par en un arranque en bloque: cada bot espera su turno
+                delay, self.data_delay = self.data_delay, 0.0
+                self.check_deferred = True
+                return delay
+            if self.iterations == 0:
+                self.log.info("🚀 Checks scheduled (id=%s, %s/%s, on data updates, at most every %ss)",
+                              self.bot_id, self.symbol, self.timeframe, self.check_interval)
+            elif market_data_service.get_version(self.symbol, self.timeframe) <= self.last_version:
+                return IDLE  # Aviso sin datos nuevos
+            elif time.monotonic() < self.next_check:
+                self.check_deferred = True  # Los avisos siguientes no despiertan el chequeo
+                return self.next_check - time.monotonic()
+            
+            self.next_check = time.monotonic() + self.check_interval
+            
+            self.iterations += 1
+            self.log.sampled('iteration', logging.INFO, "🔄 Iteration #%d", self.iterations)
+            
+            self._check_signals()
+            self.last_check = datetime.now()
+            
+            # Actualizar estadísticas en la base de datos
+            self._update_stats()
+        except Exception as e:
+            self.log.exception("❌ Error in bot check: %s", e)
+            return self.check_interval
+        
+        return IDLE if self.running else None
+    
+    def _candle_aligned(self) -> bool:
+        """Los datos del par solo cambian al cierre de cada vela (solo velas cerradas)"""
+        return market_data_service.is_candle_aligned(self.timeframe)
+    
+    def _on_snapshot(self, event):
+        """
+        Callback del MarketDataService: hay una versión nueva de los datos del par
         
-        print(f"🛑 [THREAD END] Bot '{self.name}' thread terminated (running={self.running})")
+        Llega con cada vela nueva o cambio de la vela en formación (en modo
+        alineado, solo con velas cerradas) y pone el chequeo del bot en la
+        cola del programador, salvo que ya esté programado para cuando se
+        cumpla check_interval.
+        """
+        if self.running and not self.batch and not self.check_deferred:
+            self.scheduler.wake(self.bot_id)
+    
+    def _send_start_message(self):
+        """Mensaje de inicio por Telegram (en startup_notices)"""
+        if not self.running:
+            return
+        aligned = self._candle_aligned()
+        if aligned:
+            schedule = f"al cierre de cada vela de {self.timeframe}"
+        else:
+            schedule = "con cada actualización de datos"
+        if self.check_interval > 0 and not (aligned and self.check_interval <= (timeframe_to_seconds(self.timeframe) or 0)):
+            schedule += f", como máximo una vez cada {self.check_interval}s"
+        start_msg = f"🤖 Bot '{self.name}' iniciado\n📊 Monitoreando {self.symbol} en {self.timeframe}\n⏰ Verificará {schedule}"
+        self.telegram.send_message(start_msg, disable_notification=True)
     
     def _check_signals(self):
         """Verificar señales del mercado"""
-        print(f"🔍 Checking signals for {self.name} ({self.symbol} on {self.timeframe})...")
+        self.log.debug("🔍 Checking signals (%s on %s)", self.symbol, self.timeframe)
         
         # Obtener datos del Market Data Service (NO de Binance directamente)
-        df = market_data_service.get_data(self.symbol, self.timeframe)
+        snapshot = market_data_service.get_snapshot(self.symbol, self.timeframe)
         
-        if df is None or df.empty:
-            print(f"⚠️ No market data available for {self.symbol}/{self.timeframe}")
+        if snapshot is None or snapshot[0].empty:
+            self.log.sampled('no_data', logging.WARNING, "⚠️ No market data available for %s/%s",
+                             self.symbol, self.timeframe)
+            self.last_version = market_data_service.get_version(self.symbol, self.timeframe)
             return
         
+        df, version = snapshot
+        self.last_version = version
+        self.evaluate_snapshot(df, version)
+    
+    def evaluate_snapshot(self, df, version: int):
+        """
+        Evaluar la estrategia sobre un snapshot y enviar las señales
+        
+        Args:
+            df: DataFrame del MarketDataService (solo lectura, puede ser compartido)
+            version: Versión del snapshot (para compartir indicadores entre bots)
+        """
+        with self.check_lock:
+            self._evaluate_snapshot(df, version)
+    
+    def _evaluate_snapshot(self, df, version: int):
+        """Lógica de señales (llamar con check_lock tomado)"""
         current_price = float(df['close'].iloc[-1])
-        print(f"💰 Current price: ${current_price}")
         
         try:
-            # Evaluar estrategias
-            entry_long = self.evaluator.evaluate_strategy(df, self.strategy, 'entry_long')
-            exit_long = self.evaluator.evaluate_strategy(df, self.strategy, 'exit_long')
-            entry_short = self.evaluator.evaluate_strategy(df, self.strategy, 'entry_short')
-            exit_short = self.evaluator.evaluate_strategy(df, self.strategy, 'exit_short')
-            
-            print(f"📊 Strategy results: LONG_ENTRY={entry_long}, LONG_EXIT={exit_long}, SHORT_ENTRY={entry_short}, SHORT_EXIT={exit_short}")
-            print(f"📍 Current positions: in_long={self.in_long_position}, in_short={self.in_short_position}")
-            print(f"🎚️ Position tracking: {'DISABLED (Test Mode)' if self.ignore_position_tracking else 'ENABLED (Professional Mode)'}")
+            # Evaluar estrategias (indicadores compartidos entre las 4 zonas)
+            results = self.evaluator.evaluate_plan(df, self.plan, (self.symbol, self.timeframe, version))
+            entry_long = results['entry_long']
+            exit_long = results['exit_long']
+            entry_short = results['entry_short']
+            exit_short = results['exit_short']
+            
+            self.log.debug("📊 Price=%s LONG_ENTRY=%s LONG_EXIT=%s SHORT_ENTRY=%s SHORT_EXIT=%s "
+                           "in_long=%s in_short=%s ignore_tracking=%s",
+                           current_price, entry_long, exit_long, entry_short, exit_short,
+                           self.in_long_position, self.in_short_position, self.ignore_position_tracking)
             
             # Lógica de señales
             signal_sent = False
@@ -178,7 +312,7 @@ class TradingBot:
                     self.signals_sent += 1
                     signal_sent = True
                     self._save_signal('ENTRY_LONG', message)
-                    print(f"🟢 LONG signal sent for {self.symbol} at ${current_price}")
+                    self.log.info("🟢 LONG signal sent for %s at $%s", self.symbol, current_price)
             
             # Señal de salida LONG
             elif exit_long and (self.ignore_position_tracking or self.in_long_position):
@@ -195,7 +329,7 @@ class TradingBot:
                     self.signals_sent += 1
                     signal_sent = True
                     self._save_signal('EXIT_LONG', message)
-                    print(f"⚪ LONG exit signal sent for {self.symbol} at ${current_price}")
+                    self.log.info("⚪ LONG exit signal sent for %s at $%s", self.symbol, current_price)
             
             # Señal de entrada SHORT
             elif entry_short and (self.ignore_position_tracking or not self.in_short_position):
@@ -213,7 +347,7 @@ class TradingBot:
                     self.signals_sent += 1
                     signal_sent = True
                     self._save_signal('ENTRY_SHORT', message)
-                    print(f"🔴 SHORT signal sent for {self.symbol} at ${current_price}")
+                    self.log.info("🔴 SHORT signal sent for %s at $%s", self.symbol, current_price)
             
             # Señal de salida SHORT
             elif exit_short and (self.ignore_position_tracking or self.in_short_position):
@@ -230,15 +364,45 @@ class TradingBot:
                     self.signals_sent += 1
                     signal_sent = True
                     self._save_signal('EXIT_SHORT', message)
-                    print(f"⚪ SHORT exit signal sent for {self.symbol} at ${current_price}")
+                    self.log.info("⚪ SHORT exit signal sent for %s at $%s", self.symbol, current_price)
             
             if not signal_sent:
-                print(f"ℹ️ No signal conditions met for {self.symbol}")
+                self.log.debug("ℹ️ No signal conditions met for %s", self.symbol)
             
         except Exception as e:
-            print(f"❌ Error checking signals for {self.name}: {e}")
-            import traceback
-            traceback.print_exc()
+            self.log.exception("❌ Error checking signals: %s", e)
+    
+    def preview_signals(self, bars: int = 100) -> Optional[Dict]:
+        """
+        Vista previa de las señales de las últimas velas (sin enviar nada)
+        
+        Evalúa la estrategia sobre toda la serie de una sola vez (modo
+        vectorizado) y lista las velas en las que se cumplió cada zona.
+        
+        Args:
+            bars: Número de velas recientes a incluir
+        
+        Returns:
+            Diccionario con las velas por zona o None si no hay datos
+        """
+        snapshot = market_data_service.get_snapshot(self.symbol, self.timeframe)
+        if snapshot is None or snapshot[0].empty:
+            return None
+        
+        df, version = snapshot
+        signals = self.evaluator.evaluate_plan_series(df, self.plan, (self.symbol, self.timeframe, version))
+        timestamps = df['timestamp'].iloc[-bars:]
+        
+        return {
+            'bars': len(timestamps),
+            'from': timestamps.iloc[0].isoformat(),
+            'to': timestamps.iloc[-1].isoformat(),
+            'current': {zone: bool(values[-1]) for zone, values in signals.items()},
+            'signals': {
+                zone: [ts.isoformat() for ts, fired in zip(timestamps, values[-bars:]) if fired]
+                for zone, values in signals.items()
+            }
+        }
     
     def toggle_position_tracking(self, enabled: bool):
         """
@@ -249,7 +413,7 @@ class TradingBot:
         """
         self.ignore_position_tracking = enabled
         mode = "Test Mode (tracking OFF)" if enabled else "Professional Mode (tracking ON)"
-        print(f"🎚️ Bot '{self.name}' position tracking changed to: {mode}")
+        self.log.info("🎚️ Position tracking changed to: %s", mode)
         
         # Actualizar en la base de datos
         try:
@@ -265,9 +429,9 @@ class TradingBot:
             
             conn.commit()
             conn.close()
-            print(f"✅ Position tracking mode updated in database for bot {self.bot_id}")
+            self.log.debug("✅ Position tracking mode updated in database")
         except Exception as e:
-            print(f"❌ Error updating position tracking in database: {e}")
+            self.log.error("❌ Error updating position tracking in database: %s", e)
     
     def _save_signal(self, signal_type: str, signal_text: str):
         """Guardar señal en la base de datos"""
@@ -283,18 +447,33 @@ class TradingBot:
                 VALUES (?, ?, ?, ?)
             ''', (numeric_id, signal_type, signal_text, datetime.now().isoformat()))
             
-            # Actualizar última señal en la tabla de bots
+            # Actualizar última señal y posiciones en la tabla de bots (las
+            # posiciones solo cambian al enviar una señal: no hay otra escritura)
             cursor.execute('''
                 UPDATE signal_bots
-                SET last_signal = ?, last_signal_text = ?, signals_sent = signals_sent + 1
+                SET last_signal = ?, last_signal_text = ?, signals_sent = signals_sent + 1,
+                    position_state = ?, last_signal_type = ?
                 WHERE id = ?
-            ''', (datetime.now().timestamp() * 1000, signal_text, numeric_id))
+            ''', (datetime.now().timestamp() * 1000, signal_text, self.position_state,
+                  self.last_signal_type, numeric_id))
             
             conn.commit()
             conn.close()
             
         except Exception as e:
-            print(f"❌ Error saving signal: {e}")
+            self.log.error("❌ Error saving signal: %s", e)
+    
+    def _save_position_state(self):
+        """Guardar las posiciones abiertas (cambios sin señal, ej: force_check)"""
+        try:
+            numeric_id = int(self.bot_id.replace('bot_', ''))
+            conn = get_db_connection()
+            conn.execute('UPDATE signal_bots SET position_state = ? WHERE id = ?',
+                         (self.position_state, numeric_id))
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            self.log.error("❌ Error saving position state: %s", e)
     
     def _update_stats(self):
         """Actualizar estadísticas del bot en la base de datos"""
@@ -318,16 +497,29 @@ class TradingBot:
             conn.close()
             
         except Exception as e:
-            print(f"❌ Error updating stats: {e}")
+            self.log.error("❌ Error updating stats: %s", e)
 
 
 class BotEngine:
     """Motor que maneja múltiples bots de trading"""
     
-    def __init__(self):
-        """Inicializar el motor de bots"""
+    def __init__(self, batch_evaluation: Optional[bool] = None):
+        """
+        Inicializar el motor de bots
+        
+        Args:
+            batch_evaluation: Evaluar todos los bots de un par juntos tras cada
+                actualización de datos (por defecto BOT_BATCH_EVALUATION)
+        """
         self.bots: Dict[str, TradingBot] = {}
         self.lock = threading.Lock()
+        self.scheduler = bot_scheduler  # Chequeos de todos los bots: heap + pool acotado
+        self.batch_evaluation = BOT_BATCH_EVALUATION if batch_evaluation is None else batch_evaluation
+        self.batch_snapshots: Dict[tuple, tuple] = {}  # Tarea del par → (df, versión) pendiente de evaluar
+        self.batch_jobs = set()  # Tareas de lote programadas (una por par)
+        
+        if self.batch_evaluation:
+            market_data_service.add_refresh_listener(self._on_refresh)
     
     def start_bot(self, config: Dict) -> bool:
         """
@@ -349,14 +541,77 @@ class BotEngine:
             
             # Crear y arrancar nuevo bot
             try:
-                bot = TradingBot(config)
+                bot = TradingBot(config, batch=self.batch_evaluation, scheduler=self.scheduler)
                 bot.start()
                 self.bots[bot_id] = bot
                 return True
             except Exception as e:
-                print(f"❌ Error starting bot {bot_id}: {e}")
+                logger.error("❌ Error starting bot %s: %s", bot_id, e)
                 return False
     
+    def start_bots(self, configs: List[Dict]) -> int:
+        """
+        Arrancar muchos bots de una vez (arranque del servidor)
+        
+        - Cada estrategia distinta se compila una sola vez
+        - Suscripciones e indicadores agrupados por par: un worker y una
+          descarga inicial por par para todos sus bots
+        - Los primeros chequeos se reparten en BOT_STARTUP_SPREAD segundos:
+          desde ya si el par tiene datos, o desde su primera descarga (en un
+          arranque en frío todos los bots de un par reciben los datos a la vez)
+        - Los mensajes de inicio salen en segundo plano
+        
+        Args:
+            configs: Configuraciones de los bots (como en start_bot)
+        
+        Returns:
+            Número de bots arrancados
+        """
+        plans: Dict[str, CompiledStrategy] = {}
+        pairs: Dict[tuple, List[TradingBot]] = {}
+        for config in configs:
+            try:
+                strategy_key = json.dumps(config['strategy'], sort_keys=True)
+                if strategy_key not in plans:
+                    plans[strategy_key] = compile_strategy(config['strategy'])
+                bot = TradingBot(config, batch=self.batch_evaluation, scheduler=self.scheduler,
+                                 plan=plans[strategy_key], subscribe=False)
+            except Exception as e:
+                logger.error("❌ Error starting bot %s: %s", config.get('id'), e)
+                continue
+            pairs.setdefault((bot.symbol, bot.timeframe), []).append(bot)
+        
+        bots = [bot for group in pairs.values() for bot in group]
+        with self.lock:
+            replaced = [self.bots.pop(bot.bot_id) for bot in bots if bot.bot_id in self.bots]
+        for bot in replaced:
+            bot.stop()  # Antes de suscribir los nuevos: comparten bot_id
+        
+        for (symbol, timeframe), group in pairs.items():
+            market_data_service.subscribe_many(symbol, timeframe, {bot.bot_id: bot._on_snapshot for bot in group})
+            market_data_service.track_indicators(
+                symbol, timeframe, dict.fromkeys(node for bot in group for node in bot.plan.roots))
+        
+        # Turno de cada bot: entre todos si el par ya tiene datos; si no, dentro
+        # de su par (cada par recibe su primera descarga por separado)
+        position = 0
+        for (symbol, timeframe), group in pairs.items():
+            ready = market_data_service.has_data(symbol, timeframe)
+            for i, bot in enumerate(group):
+                spread = min(bot.check_interval, BOT_STARTUP_SPREAD)
+                if ready:
+                    bot.start(spread * (position + i) / len(bots))
+                else:
+                    bot.start(IDLE, data_delay=spread * i / len(group))
+            position += len(group)
+        
+        with self.lock:
+            self.bots.update((bot.bot_id, bot) for bot in bots)
+        
+        logger.info("🚀 %d bots arrancados en %d pares (%d estrategias distintas)",
+                    len(bots), len(pairs), len(plans))
+        return len(bots)
+    
     def stop_bot(self, bot_id: str) -> bool:
         """
         Detener un bot
@@ -374,7 +629,7 @@ class BotEngine:
                     del self.bots[bot_id]
                     return True
                 except Exception as e:
-                    print(f"❌ Error stopping bot {bot_id}: {e}")
+                    logger.error("❌ Error stopping bot %s: %s", bot_id, e)
                     return False
             return False
     
@@ -396,7 +651,8 @@ class BotEngine:
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT name, bot_token, chat_id, symbol, timeframe, check_interval, strategy
+                SELECT name, bot_token, chat_id, symbol, timeframe, check_interval, strategy,
+                       ignore_position_tracking, position_state, last_signal_type
                 FROM signal_bots
                 WHERE id = ?
             ''', (numeric_id,))
@@ -415,7 +671,10 @@ class BotEngine:
                 'symbol': row[3],
                 'timeframe': row[4],
                 'check_interval': row[5],
-                'strategy': json.loads(row[6]) if row[6] else {}
+                'strategy': json.loads(row[6]) if row[6] else {},
+                'ignore_position_tracking': bool(row[7]),
+                'position_state': row[8] or 0,
+                'last_signal_type': row[9]
             }
             
             # Detener y reiniciar
@@ -423,7 +682,7 @@ class BotEngine:
             return self.start_bot(config)
             
         except Exception as e:
-            print(f"❌ Error restarting bot {bot_id}: {e}")
+            logger.error("❌ Error restarting bot %s: %s", bot_id, e)
             return False
     
     def get_bot_status(self, bot_id: str) -> Optional[Dict]:
@@ -445,10 +704,56 @@ class BotEngine:
                     'running': bot.running,
                     'signals_sent': bot.signals_sent,
                     'last_check': bot.last_check.isoformat() if bot.last_check else None,
-                    'uptime': int((datetime.now() - bot.start_time).total_seconds()) if bot.start_time else 0
+                    'uptime': int((datetime.now() - bot.start_time).total_seconds()) if bot.start_time else 0,
+                    'trace_enabled': bot.log.trace_enabled
                 }
             return None
     
+    def get_stats(self) -> Dict:
+        """Bots activos y estado del programador (profundidad de la cola y retraso)"""
+        with self.lock:
+            active_bots = len(self.bots)
+        return {'active_bots': active_bots, 'scheduler': self.scheduler.get_stats()}
+    
+    def set_trace(self, bot_id: str, enabled: bool) -> bool:
+        """
+        Activar o desactivar la traza de depuración de un bot
+        
+        Args:
+            bot_id: ID del bot
+            enabled: True para empezar a registrar, False para descartarla
+        
+        Returns:
+            True si el bot existe
+        """
+        with self.lock:
+            bot = self.bots.get(bot_id)
+        if bot is None:
+            return False
+        bot.log.enable_trace(enabled)
+        logger.info("🔬 Trace %s for bot %s", 'enabled' if enabled else 'disabled', bot_id)
+        return True
+    
+    def set_position_tracking(self, bot_id: str, ignore_tracking: bool) -> bool:
+        """
+        Cambiar el modo de tracking de posiciones de un bot en ejecución
+        
+        Returns:
+            True si el bot existe
+        """
+        with self.lock:
+            bot = self.bots.get(bot_id)
+        if bot is None:
+            return False
+        bot.toggle_position_tracking(ignore_tracking)
+        return True
+    
+    def get_trace(self, bot_id: str) -> Optional[List[Dict]]:
+        """Entradas de la traza de un bot (None si el bot no existe)"""
+        with self.lock:
+            bot = self.bots.get(bot_id)
+        return bot.log.get_trace() if bot is not None else None
+    
     def force_check(self, bot_id: str) -> Optional[Dict]:
         """
         Forzar verificación inmediata del mercado en un bot
@@ -467,14 +772,16 @@ class BotEngine:
         
         # Ejecutar chequeo fuera del lock para no bloquear otros bots
         try:
-            print(f"🔍 Forcing market check for bot {bot.name}...")
-            print(f"📋 Bot status: in_long={bot.in_long_position}, in_short={bot.in_short_position}")
+            bot.log.info("🔍 Forcing market check (in_long=%s, in_short=%s), resetting positions",
+                         bot.in_long_position, bot.in_short_position)
             
             # IMPORTANTE: Resetear posiciones para forzar evaluación limpia
             # Esto permite que el bot envíe señales incluso si ya había enviado antes
-            print(f"🔄 Resetting bot positions for fresh evaluation...")
+            had_positions = bot.position_state
             bot.in_long_position = False
             bot.in_short_position = False
+            if had_positions:
+                bot._save_position_state()
             
             # Realizar la verificación
             bot._check_signals()
@@ -485,18 +792,100 @@ class BotEngine:
                 'symbol': bot.symbol,
                 'timeframe': bot.timeframe,
                 'last_check': datetime.now().isoformat(),
-                'message': 'Market checked successfully. If conditions were met, a signal was sent.'
+                'message': 'Market checked successfully. If conditions were met, a signal was sent.',
+                'preview': bot.preview_signals()
             }
             
         except Exception as e:
-            print(f"❌ Error forcing check for bot {bot_id}: {e}")
-            import traceback
-            traceback.print_exc()
+            logger.exception("❌ Error forcing check for bot %s: %s", bot_id, e)
             return {
                 'success': False,
                 'error': str(e)
             }
     
+    def _on_refresh(self, symbol: str, timeframe: str, df, version: int):
+        """
+        Listener del MarketDataService: pasar el lote del par al pool de chequeos
+        
+        Vuelve de inmediato (el thread de descargas o del stream no espera a
+        las señales ni a Telegram). Una tarea por par en el programador: si
+        llegan versiones mientras evalúa, solo se evalúa la última.
+        """
+        if df is None or df.empty:
+            return
+        key = ('batch', symbol, timeframe)
+        with self.lock:
+            self.batch_snapshots[key] = (df, version)
+            if not self.scheduler.wake(key):
+                self.scheduler.schedule(key, lambda: self._run_batch(key))
+                self.batch_jobs.add(key)
+    
+    def _run_batch(self, key: tuple) -> float:
+        """Tarea del lote de un par (en el pool del programador): evaluar la versión pendiente"""
+        with self.lock:
+            pending = self.batch_snapshots.pop(key, None)
+        if pending is not None:
+            self._evaluate_batch(key[1], key[2], *pending)
+        return IDLE
+    
+    def _evaluate_batch(self, symbol: str, timeframe: str, df, version: int):
+        """
+        Evaluar en lote los bots de un par recién actualizado
+        
+        Todos los bots leen el mismo snapshot (sin copias) y comparten los
+        indicadores calculados a través del IndicatorCache, así que cada
+        indicador se calcula una sola vez por actualización.
+        """
+        with self.lock:
+            bots = [bot for bot in self.bots.values()
+                    if bot.batch and bot.running and bot.symbol == symbol and bot.timeframe == timeframe]
+        
+        if not bots:
+            return
+        
+        started = time.perf_counter()
+        checked = []
+        for bot in bots:
+            try:
+                bot.evaluate_snapshot(df, version)
+                bot.last_check = datetime.now()
+                checked.append(bot)
+            except Exception as e:
+                bot.log.exception("❌ Error in batch evaluation: %s", e)
+        
+        self._update_stats_batch(checked)
+        logger.debug("⚡ Batch %s/%s v%d: %d bots in %.1fms", symbol, timeframe, version,
+                     len(checked), (time.perf_counter() - started) * 1000)
+    
+    def _update_stats_batch(self, bots: List[TradingBot]):
+        """Actualizar las estadísticas de varios bots con una sola conexión"""
+        rows = []
+        now = datetime.now()
+        for bot in bots:
+            if not bot.start_time:
+                continue
+            try:
+                rows.append((int((now - bot.start_time).total_seconds()), bot.signals_sent,
+                             int(bot.bot_id.replace('bot_', ''))))
+            except ValueError:
+                continue
+        
+        if not rows:
+            return
+        
+        try:
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            cursor.executemany('''
+                UPDATE signal_bots
+                SET uptime = ?, signals_sent = ?
+                WHERE id = ?
+            ''', rows)
+            conn.commit()
+            conn.close()
+        except Exception as e:
+            logger.error("❌ Error updating stats: %s", e)
+    
     def stop_all_bots(self):
         """Detener todos los bots"""
         with self.lock:
@@ -504,26 +893,30 @@ class BotEngine:
                 try:
                     self.bots[bot_id].stop()
                 except Exception as e:
-                    print(f"❌ Error stopping bot {bot_id}: {e}")
+                    logger.error("❌ Error stopping bot %s: %s", bot_id, e)
             
             self.bots.clear()
-            print("🛑 All bots stopped")
+            for key in self.batch_jobs:
+                self.scheduler.cancel(key)
+            self.batch_jobs.clear()
+            self.batch_snapshots.clear()
+            logger.info("🛑 All bots stopped")
     
     def load_active_bots(self):
         """
         Cargar y arrancar automáticamente todos los bots con status='active' desde la base de datos
-        Esta función debe llamarse al iniciar el servidor
+        Esta función debe llamarse al iniciar el servidor. Las posiciones abiertas se
+        leen en la misma consulta (columnas agregadas por database.init_database)
         """
-        print("\n" + "="*60)
-        print("🚀 CARGANDO BOTS ACTIVOS DESDE LA BASE DE DATOS...")
-        print("="*60)
+        logger.info("🚀 Cargando bots activos desde la base de datos...")
         
         try:
             conn = get_db_connection()
             cursor = conn.cursor()
             
             cursor.execute('''
-                SELECT id, name, bot_token, chat_id, symbol, timeframe, check_interval, strategy, status, ignore_position_tracking
+                SELECT id, name, bot_token, chat_id, symbol, timeframe, check_interval, strategy, status, ignore_position_tracking,
+                       position_state, last_signal_type
                 FROM signal_bots
                 WHERE status = 'active'
             ''')
@@ -532,19 +925,16 @@ class BotEngine:
             conn.close()
             
             if not active_bots:
-                print("📭 No hay bots activos en la base de datos")
-                print("="*60 + "\n")
+                logger.info("📭 No hay bots activos en la base de datos")
                 return 0
             
-            print(f"📊 Se encontraron {len(active_bots)} bot(s) activo(s)")
-            print("-"*60)
+            logger.info("📊 Se encontraron %d bot(s) activo(s)", len(active_bots))
             
-            started_count = 0
+            configs = []
             for row in active_bots:
                 try:
-                    bot_id = f'bot_{row[0]}'
-                    config = {
-                        'id': bot_id,
+                    configs.append({
+                        'id': f'bot_{row[0]}',
                         'name': row[1],
                         'bot_token': row[2],
                         'chat_id': row[3],
@@ -552,36 +942,21 @@ class BotEngine:
                         'timeframe': row[5],
                         'check_interval': row[6],
                         'strategy': json.loads(row[7]) if row[7] else {},
-                        'ignore_position_tracking': bool(row[9]) if len(row) > 9 else False
-                    }
-                    
-                    print(f"\n🤖 Bot: {config['name']}")
-                    print(f"   ID: {bot_id}")
-                    print(f"   Symbol: {config['symbol']}")
-                    print(f"   Timeframe: {config['timeframe']}")
-                    print(f"   Check Interval: {config['check_interval']}s ({config['check_interval']//60}min)")
-                    
-                    # Arrancar el bot
-                    if self.start_bot(config):
-                        started_count += 1
-                        print(f"   ✅ Bot arrancado exitosamente")
-                    else:
-                        print(f"   ❌ Error al arrancar bot")
-                        
+                        'ignore_position_tracking': bool(row[9]) if len(row) > 9 else False,
+                        # Posiciones de antes del reinicio: sin ráfaga de señales de entrada repetidas
+                        'position_state': row[10] or 0,
+                        'last_signal_type': row[11]
+                    })
                 except Exception as e:
-                    print(f"   ❌ Error procesando bot {row[1]}: {e}")
-                    import traceback
-                    traceback.print_exc()
+                    logger.exception("❌ Error procesando bot %s: %s", row[1], e)
+            
+            # Arranque en bloque: estrategias compiladas una vez, un worker por par
+            started_count = self.start_bots(configs)
             
-            print("-"*60)
-            print(f"✅ {started_count} de {len(active_bots)} bots arrancados exitosamente")
-            print("="*60 + "\n")
+            logger.info("✅ %d de %d bots arrancados exitosamente", started_count, len(active_bots))
             
             return started_count
             
         except Exception as e:
-            print(f"❌ Error cargando bots activos: {e}")
-            import traceback
-            traceback.print_exc()
-            print("="*60 + "\n")
+            logger.exception("❌ Error cargando bots activos: %s", e)
             return 0
@@ -0,0 +1,383 @@
+"""
+Bot Engine Owner - Un solo dueño del motor de bots entre varios procesos web
+Con gunicorn cada worker importa las rutas; para que cada bot corra una sola
+vez, solo el proceso que tiene el lease (una fila en SQLite) ejecuta el
+motor y los demás le mandan los comandos por la tabla bot_engine_commands
+
+Modos (BOT_ENGINE_MODE):
+- local: cada proceso tiene su propio motor (comportamiento original)
+- leader: los workers compiten por el lease; el ganador corre los bots
+- daemon: los workers solo reenvían comandos; los bots corren en
+  `python bot_engine_owner.py`
+"""
+
+import atexit
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional
+
+if __name__ == '__main__':
+    # Demonio: cargar .env antes de que los módulos lean su configuración
+    from dotenv import load_dotenv
+    load_dotenv()
+
+from bot_engine import BotEngine
+from bot_logging import get_logger
+from bot_shards import SHARD_COMMANDS, create_bot_engine
+from database import get_db_connection
+
+logger = get_logger('bot_engine_owner')
+
+BOT_ENGINE_MODE = os.getenv('BOT_ENGINE_MODE', 'local').lower()
+BOT_ENGINE_LEASE_TTL = float(os.getenv('BOT_ENGINE_LEASE_TTL', '15'))  # Segundos sin renovar hasta perder el lease
+BOT_ENGINE_COMMAND_TIMEOUT = float(os.getenv('BOT_ENGINE_COMMAND_TIMEOUT', '30'))  # Espera máxima de un comando
+COMMAND_POLL_INTERVAL = 0.1   # Segundos entre lecturas de la tabla de comandos
+COMMAND_RETENTION = 3600      # Segundos que se guardan los comandos terminados
+
+# Métodos del BotEngine que se pueden pedir al dueño
+ENGINE_COMMANDS = SHARD_COMMANDS | {'restart_bot'}
+
+
+def ensure_tables(conn):
+    """Crear las tablas del lease y de comandos si no existen"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_engine_lease (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            owner TEXT NOT NULL,
+            expires_at REAL NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS bot_engine_commands (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            method TEXT NOT NULL,
+            args TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            result TEXT,
+            created_at REAL NOT NULL,
+            completed_at REAL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_bot_engine_commands_status ON bot_engine_commands(status)')
+    conn.commit()
+
+
+class EngineLease:
+    """
+    Lease del motor de bots: fila única con dueño y vencimiento
+
+    Tomarlo o renovarlo es un solo UPSERT condicional (atómico en SQLite):
+    solo se escribe si el lease está libre, vencido o ya es nuestro.
+    """
+
+    def __init__(self, owner_id: Optional[str] = None, ttl: float = BOT_ENGINE_LEASE_TTL):
+        self.owner_id = owner_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.ttl = ttl
+        conn = get_db_connection()
+        try:
+            ensure_tables(conn)
+        finally:
+            conn.close()
+
+    def acquire(self) -> bool:
+        """Tomar o renovar el lease; False si lo tiene otro proceso"""
+        now = time.time()
+        conn = get_db_connection()
+        try:
+            cursor = conn.execute('''
+                INSERT INTO bot_engine_lease (id, owner, expires_at) VALUES (1, ?, ?)
+                ON CONFLICT(id) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE bot_engine_lease.owner = excluded.owner OR bot_engine_lease.expires_at < ?
+            ''', (self.owner_id, now + self.ttl, now))
+            conn.commit()
+            return cursor.rowcount == 1
+        finally:
+            conn.close()
+
+    def release(self):
+        """Liberar el lease (solo si es nuestro)"""
+        conn = get_db_connection()
+        try:
+            conn.execute('DELETE FROM bot_engine_lease WHERE id = 1 AND owner = ?', (self.owner_id,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def holder(self) -> Optional[str]:
+        """Dueño actual del lease, o None si está libre o vencido"""
+        conn = get_db_connection()
+        try:
+            row = conn.execute('SELECT owner, expires_at FROM bot_engine_lease WHERE id = 1').fetchone()
+        finally:
+            conn.close()
+        return row[0] if row and row[1] > time.time() else None
+
+
+class EngineOwner:
+    """
+    Proceso dueño del motor de bots
+
+    - Un thread propio renueva el lease cada ttl/3, aunque un comando o la
+      carga de los bots al tomarlo tarden más que el ttl
+    - Mientras tiene el lease corre el motor (cargando los bots activos al
+      tomarlo) y ejecuta los comandos pendientes en orden; antes de cada
+      comando verifica que el lease siga vigente
+    - Si no logra renovarlo (otro lo tomó tras un bloqueo largo del proceso)
+      detiene todos sus bots en cuanto lo nota; durante ese bloqueo pudo haber
+      dos dueños a la vez, por eso el ttl debe ser mayor que las pausas esperables
+    """
+
+    def __init__(self, engine_factory: Callable[[], BotEngine] = create_bot_engine,
+                 lease: Optional[EngineLease] = None, poll_interval: float = COMMAND_POLL_INTERVAL):
+        self.engine_factory = engine_factory
+        self.lease = lease or EngineLease()
+        self.poll_interval = poll_interval
+        self.engine: Optional[BotEngine] = None
+        self.engine_lock = threading.Lock()
+        self.lease_expires = 0.0  # Vencimiento local (monotónico) de la última renovación
+        self.stop_event = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """Correr en un thread (modo leader, dentro de un worker web)"""
+        self.thread = threading.Thread(target=self.run, daemon=True, name="BotEngineOwner")
+        self.thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self.stop_event.set()
+        if self.thread and self.thread is not threading.current_thread():
+            self.thread.join(timeout=BOT_ENGINE_COMMAND_TIMEOUT)
+
+    def holds_lease(self) -> bool:
+        """True si la última renovación sigue vigente"""
+        return time.monotonic() < self.lease_expires
+
+    def run(self):
+        """Loop del dueño: tomar el motor cuando hay lease y atender comandos"""
+        logger.info("🗳️ Candidato a dueño del motor de bots: %s", self.lease.owner_id)
+        renewer = threading.Thread(target=self._renew_lease, daemon=True, name="BotEngineLease")
+        renewer.start()
+        try:
+            while not self.stop_event.is_set():
+                if self.engine is None and self.holds_lease():
+                    self._take_over()
+                if self.engine is not None and not self.holds_lease():
+                    self._step_down()
+                if self.engine is not None:
+                    self._process_commands()
+                self.stop_event.wait(self.poll_interval)
+        finally:
+            self.stop_event.set()
+            renewer.join(timeout=BOT_ENGINE_COMMAND_TIMEOUT)
+            if self.engine is not None:
+                self._step_down()
+            self.lease.release()
+
+    def _renew_lease(self):
+        """Thread del lease: renovarlo cada ttl/3 y bajar el motor si se pierde"""
+        while not self.stop_event.is_set():
+            started = time.monotonic()
+            try:
+                if self.lease.acquire():
+                    self.lease_expires = started + self.lease.ttl
+                    if self.engine is not None:
+                        self._purge_commands()
+                else:
+                    # Lo tiene otro proceso: bajar el motor ya, sin esperar al vencimiento local
+                    self.lease_expires = 0.0
+                    if self.engine is not None:
+                        self._step_down()
+            except Exception as e:
+                # Sin base de datos el lease vence solo y el loop principal baja el motor
+                logger.error("❌ Error renovando el lease del motor de bots: %s", e)
+            self.stop_event.wait(self.lease.ttl / 3)
+
+    def _take_over(self):
+        logger.info("👑 %s es el dueño del motor de bots", self.lease.owner_id)
+        conn = get_db_connection()
+        try:
+            # Los comandos sin atender de un dueño anterior ya vencieron: el estado
+            # real de los bots sale de la base de datos (load_active_bots)
+            conn.execute('''
+                UPDATE bot_engine_commands SET status = 'expired', completed_at = ?
+                WHERE status IN ('pending', 'running') AND created_at < ?
+            ''', (time.time(), time.time() - BOT_ENGINE_COMMAND_TIMEOUT))
+            conn.commit()
+        finally:
+            conn.close()
+        engine = self.engine_factory()
+        engine.load_active_bots()
+        with self.engine_lock:
+            self.engine = engine
+        self._purge_commands()
+
+    def _step_down(self):
+        with self.engine_lock:
+            engine, self.engine = self.engine, None
+        if engine is None:
+            return  # El otro thread ya lo bajó
+        logger.warning("⚠️ %s deja de ser el dueño del motor de bots", self.lease.owner_id)
+        getattr(engine, 'shutdown', engine.stop_all_bots)()
+
+    def _process_commands(self):
+        conn = get_db_connection()
+        try:
+            rows = conn.execute('''
+                SELECT id, method, args FROM bot_engine_commands WHERE status = 'pending' ORDER BY id
+            ''').fetchall()
+            for command_id, method, args in rows:
+                engine = self.engine
+                if engine is None or not self.holds_lease():
+                    break  # Quedan pendientes para el próximo dueño
+                claimed = conn.execute('''
+                    UPDATE bot_engine_commands SET status = 'running' WHERE id = ? AND status = 'pending'
+                ''', (command_id,))
+                conn.commit()
+                if claimed.rowcount != 1:
+                    continue  # Vencido mientras esperaba
+                try:
+                    if method not in ENGINE_COMMANDS:
+                        raise ValueError(f"Comando desconocido: {method}")
+                    status, result = 'done', getattr(engine, method)(*json.loads(args))
+                except Exception as e:
+                    logger.exception("❌ Error ejecutando %s: %s", method, e)
+                    status, result = 'error', f"{type(e).__name__}: {e}"
+                conn.execute('''
+                    UPDATE bot_engine_commands SET status = ?, result = ?, completed_at = ? WHERE id = ?
+                ''', (status, json.dumps(result, default=str), time.time(), command_id))
+                conn.commit()
+        finally:
+            conn.close()
+
+    def _purge_commands(self):
+        conn = get_db_connection()
+        try:
+            conn.execute('''
+                DELETE FROM bot_engine_commands WHERE status NOT IN ('pending', 'running') AND completed_at < ?
+            ''', (time.time() - COMMAND_RETENTION,))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class RemoteBotEngine(BotEngine):
+    """
+    BotEngine de un worker web que no corre bots
+
+    Cada método se guarda como comando en bot_engine_commands y espera el
+    resultado del dueño del lease. Sin dueño vivo responde como si el bot no
+    existiera (el dueño carga los bots activos de la base de datos al tomar
+    el lease, así que las activaciones no se pierden).
+    """
+
+    def __init__(self, lease: Optional[EngineLease] = None, timeout: float = BOT_ENGINE_COMMAND_TIMEOUT):
+        # Sin BotEngine.__init__: los bots corren en el proceso dueño
+        self.lease = lease or EngineLease()
+        self.timeout = timeout
+        self.bots = {}
+
+    def start_bot(self, config: Dict) -> bool:
+        return bool(self._call('start_bot', config))
+
+    def start_bots(self, configs: List[Dict]) -> int:
+        return self._call('start_bots', configs) or 0
+
+    def stop_bot(self, bot_id: str) -> bool:
+        return bool(self._call('stop_bot', bot_id))
+
+    def restart_bot(self, bot_id: str) -> bool:
+        return bool(self._call('restart_bot', bot_id))
+
+    def get_bot_status(self, bot_id: str) -> Optional[Dict]:
+        return self._call('get_bot_status', bot_id)
+
+    def force_check(self, bot_id: str) -> Optional[Dict]:
+        return self._call('force_check', bot_id)
+
+    def set_trace(self, bot_id: str, enabled: bool) -> bool:
+        return bool(self._call('set_trace', bot_id, enabled))
+
+    def get_trace(self, bot_id: str) -> Optional[List[Dict]]:
+        return self._call('get_trace', bot_id)
+
+    def set_position_tracking(self, bot_id: str, ignore_tracking: bool) -> bool:
+        return bool(self._call('set_position_tracking', bot_id, ignore_tracking))
+
+    def get_stats(self) -> Dict:
+        """Estadísticas del motor del dueño (active_bots=0 si no hay dueño)"""
+        owner = self.lease.holder()
+        stats = (self._call('get_stats') if owner else None) or {'active_bots': 0}
+        return dict(stats, mode=BOT_ENGINE_MODE, owner=owner)
+
+    def stop_all_bots(self):
+        self._call('stop_all_bots')
+
+    def load_active_bots(self):
+        """El dueño del lease carga los bots activos al tomarlo"""
+        logger.info("📡 Bots a cargo del dueño del motor (%s)", self.lease.holder() or 'sin dueño todavía')
+        return 0
+
+    def _call(self, method: str, *args):
+        """Encolar un comando y esperar su resultado (None si falla o no hay dueño)"""
+        if self.lease.holder() is None:
+            logger.warning("⚠️ Sin dueño del motor de bots: %s no se ejecutó", method)
+            return None
+
+        conn = get_db_connection()
+        try:
+            command_id = conn.execute('''
+                INSERT INTO bot_engine_commands (method, args, created_at) VALUES (?, ?, ?)
+            ''', (method, json.dumps(args), time.time())).lastrowid
+            conn.commit()
+
+            deadline = time.monotonic() + self.timeout
+            while time.monotonic() < deadline:
+                row = conn.execute('SELECT status, result FROM bot_engine_commands WHERE id = ?',
+                                   (command_id,)).fetchone()
+                if row[0] == 'done':
+                    return json.loads(row[1])
+                if row[0] == 'error':
+                    logger.error("❌ %s falló en el dueño del motor: %s", method, json.loads(row[1]))
+                    return None
+                time.sleep(COMMAND_POLL_INTERVAL / 2)
+
+            conn.execute('''
+                UPDATE bot_engine_commands SET status = 'expired', completed_at = ?
+                WHERE id = ? AND status = 'pending'
+            ''', (time.time(), command_id))
+            conn.commit()
+            logger.error("❌ %s sin respuesta del dueño del motor en %.0fs", method, self.timeout)
+            return None
+        finally:
+            conn.close()
+
+
+def get_bot_engine() -> BotEngine:
+    """
+    Motor de bots para las rutas según BOT_ENGINE_MODE
+
+    Dentro de un proceso shard (que importa de nuevo el módulo principal)
+    siempre se usa un motor local.
+    """
+    if BOT_ENGINE_MODE == 'local' or multiprocessing.parent_process() is not None:
+        return create_bot_engine()
+    if BOT_ENGINE_MODE == 'leader':
+        EngineOwner().start()
+    return RemoteBotEngine()
+
+
+if __name__ == '__main__':
+    # Demonio del motor de bots (BOT_ENGINE_MODE=daemon): python bot_engine_owner.py
+    owner = EngineOwner()
+    signal.signal(signal.SIGTERM, lambda signum, frame: owner.stop_event.set())
+    try:
+        owner.run()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,118 @@
+"""
+Bot Logging - Logging con niveles para el motor de bots
+Reemplaza los print() del loop de los bots: formateo perezoso, muestreo
+por bot y traza de depuración en memoria activable por bot desde la API
+"""
+
+import logging
+import os
+import threading
+from collections import deque
+from datetime import datetime
+from typing import Dict, List, Optional
+
+# Configuración por variables de entorno
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+BOT_LOG_SAMPLE_EVERY = int(os.getenv('BOT_LOG_SAMPLE_EVERY', '20'))  # 1 de cada N chequeos rutinarios
+BOT_TRACE_SIZE = int(os.getenv('BOT_TRACE_SIZE', '500'))  # Entradas de la traza por bot
+
+LOG_FORMAT = '%(asctime)s %(levelname)s [%(name)s] %(message)s'
+
+_configure_lock = threading.Lock()
+
+
+def configure_logging(level: Optional[str] = None):
+    """
+    Configurar el logger raíz de la aplicación ('draglab') una sola vez
+
+    Args:
+        level: Nivel (DEBUG, INFO, WARNING...); por defecto LOG_LEVEL
+    """
+    root = logging.getLogger('draglab')
+    with _configure_lock:
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+            root.addHandler(handler)
+        root.setLevel(level or LOG_LEVEL)
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Logger de un módulo (draglab.<name>)"""
+    if not logging.getLogger('draglab').handlers:
+        configure_logging()
+    return logging.getLogger(f'draglab.{name}')
+
+
+class BotLogger:
+    """
+    Logger de un bot
+
+    - Los mensajes llevan el nombre del bot y se formatean solo si el nivel
+      está activo (argumentos al estilo %s, nunca f-strings)
+    - sampled(): mensajes rutinarios de cada chequeo, se emite 1 de cada N
+    - Traza: si está activa, guarda todos los mensajes del bot (incluidos
+      DEBUG y los descartados por muestreo) en un buffer circular
+    """
+
+    def __init__(self, bot_id: str, name: str, sample_every: int = BOT_LOG_SAMPLE_EVERY):
+        self.logger = get_logger('bot')
+        self.bot_id = bot_id
+        self.name = name
+        self.sample_every = max(1, sample_every)
+        self.trace: Optional[deque] = None
+        self._counters: Dict[str, int] = {}
+
+    def enable_trace(self, enabled: bool = True, size: int = BOT_TRACE_SIZE):
+        """Activar o desactivar la traza de depuración (al desactivarla se descarta)"""
+        if not enabled:
+            self.trace = None
+        elif self.trace is None or self.trace.maxlen != size:
+            self.trace = deque(self.trace or (), maxlen=size)
+
+    @property
+    def trace_enabled(self) -> bool:
+        return self.trace is not None
+
+    def get_trace(self) -> List[Dict]:
+        """Entradas de la traza (vacía si no está activa)"""
+        trace = self.trace
+        return list(trace) if trace is not None else []
+
+    def debug(self, msg: str, *args):
+        self._log(logging.DEBUG, msg, args)
+
+    def info(self, msg: str, *args):
+        self._log(logging.INFO, msg, args)
+
+    def warning(self, msg: str, *args):
+        self._log(logging.WARNING, msg, args)
+
+    def error(self, msg: str, *args, exc_info: bool = False):
+        self._log(logging.ERROR, msg, args, exc_info=exc_info)
+
+    def exception(self, msg: str, *args):
+        self._log(logging.ERROR, msg, args, exc_info=True)
+
+    def sampled(self, key: str, level: int, msg: str, *args):
+        """
+        Mensaje rutinario: se emite la primera vez y luego 1 de cada sample_every
+
+        Args:
+            key: Identificador del mensaje (contador independiente por clave)
+            level: Nivel de logging
+        """
+        count = self._counters.get(key, 0)
+        self._counters[key] = count + 1
+        self._log(level, msg, args, emit=count % self.sample_every == 0)
+
+    def _log(self, level: int, msg: str, args: tuple, exc_info: bool = False, emit: bool = True):
+        trace = self.trace
+        if trace is not None:
+            trace.append({
+                'time': datetime.now().isoformat(timespec='milliseconds'),
+                'level': logging.getLevelName(level),
+                'message': msg % args if args else msg
+            })
+        if emit and self.logger.isEnabledFor(level):
+            self.logger.log(level, '[%s] ' + msg, self.name, *args, exc_info=exc_info)
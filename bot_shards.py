@@ -0,0 +1,385 @@
+"""
+Bot Shards - Motor de bots repartido en varios procesos
+Cada proceso corre un BotEngine con los bots de algunos pares, asignados por
+hashing consistente de (símbolo, timeframe): cada par vive en un solo proceso
+junto con sus datos de mercado (con MARKET_DATA_RESAMPLE, todos los timeframes
+de un símbolo van al mismo proceso). El supervisor controla los procesos por
+un Pipe y reinicia los bots de un proceso que muere
+"""
+
+import bisect
+import hashlib
+import itertools
+import multiprocessing
+import os
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import Dict, List, Optional
+
+from bot_engine import BotEngine
+from bot_logging import get_logger
+from market_data_service import MARKET_DATA_RESAMPLE
+from strategy_compiler import compile_strategy
+
+logger = get_logger('bot_shards')
+
+# Procesos del motor de bots (1 = todo en el proceso del servidor, sin supervisor)
+BOT_ENGINE_PROCESSES = int(os.getenv('BOT_ENGINE_PROCESSES', '1'))
+SHARD_REPLY_TIMEOUT = float(os.getenv('SHARD_REPLY_TIMEOUT', '60'))  # Segundos máximos por comando
+HASH_RING_REPLICAS = 64  # Nodos virtuales por proceso (reparto parejo de los pares)
+
+# Métodos del BotEngine que el supervisor puede invocar en un shard
+SHARD_COMMANDS = {'start_bot', 'start_bots', 'stop_bot', 'get_bot_status', 'force_check', 'set_trace', 'get_trace',
+                  'set_position_tracking', 'get_stats', 'stop_all_bots'}
+
+
+class ShardError(Exception):
+    """El proceso de un shard no respondió o el comando falló"""
+    pass
+
+
+def shard_key(symbol: str, timeframe: str, resample: bool = MARKET_DATA_RESAMPLE) -> str:
+    """
+    Clave de hashing de un par: todos sus bots van al mismo proceso
+
+    Con resampling los timeframes mayores se agregan desde el menor suscrito
+    del símbolo dentro del mismo MarketDataService: la clave es el símbolo
+    """
+    return symbol if resample else f"{symbol}/{timeframe}"
+
+
+class HashRing:
+    """
+    Anillo de hashing consistente
+
+    Cada nodo ocupa HASH_RING_REPLICAS puntos del anillo; una clave va al
+    primer punto siguiente a su hash. Al quitar un nodo solo se mueven las
+    claves que tenía ese nodo.
+    """
+
+    def __init__(self, nodes=(), replicas: int = HASH_RING_REPLICAS):
+        self.replicas = replicas
+        self.points: List[int] = []
+        self.owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    @staticmethod
+    def _hash(value: str) -> int:
+        return int(hashlib.md5(value.encode()).hexdigest()[:16], 16)
+
+    @property
+    def nodes(self) -> List[str]:
+        return sorted(set(self.owners.values()))
+
+    def add(self, node: str):
+        for i in range(self.replicas):
+            point = self._hash(f"{node}#{i}")
+            if point not in self.owners:
+                bisect.insort(self.points, point)
+                self.owners[point] = node
+
+    def remove(self, node: str):
+        self.points = [point for point in self.points if self.owners[point] != node]
+        self.owners = {point: owner for point, owner in self.owners.items() if owner != node}
+
+    def get_node(self, key: str) -> Optional[str]:
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, self._hash(key)) % len(self.points)
+        return self.owners[self.points[index]]
+
+
+def _shard_main(conn, processes: int):
+    """Proceso shard: ejecutar en su BotEngine los comandos del supervisor"""
+    from binance_rate_limiter import BINANCE_WEIGHT_LIMIT, binance_rate_limiter
+
+    # El límite de peso de Binance es por IP: se reparte entre los procesos
+    binance_rate_limiter.configure(max(1, BINANCE_WEIGHT_LIMIT // processes))
+    engine = BotEngine()
+
+    while True:
+        try:
+            request_id, method, args = conn.recv()
+        except (EOFError, OSError):
+            break
+        if method == 'shutdown':
+            engine.stop_all_bots()
+            conn.send((request_id, 'ok', None))
+            break
+        try:
+            if method not in SHARD_COMMANDS:
+                raise ValueError(f"Comando desconocido: {method}")
+            result = getattr(engine, method)(*args)
+            if method == 'start_bots':
+                # Ids de los bots que arrancaron: el supervisor registra solo esos
+                result = [config['id'] for config in args[0]
+                          if getattr(engine.bots.get(config['id']), 'config', None) is config]
+            conn.send((request_id, 'ok', result))
+        except Exception as e:
+            conn.send((request_id, 'error', f"{type(e).__name__}: {e}"))
+
+
+class _Shard:
+    """
+    Proceso shard y su canal de comandos
+
+    Cada comando lleva un id que vuelve en la respuesta: la respuesta tardía
+    de un comando que ya venció se descarta en lugar de tomarse como la del
+    siguiente.
+    """
+
+    def __init__(self, name: str, process, conn):
+        self.name = name
+        self.process = process
+        self.conn = conn
+        self.lock = threading.Lock()  # Un comando a la vez por Pipe
+        self.request_ids = itertools.count(1)
+
+    def call(self, method: str, *args, timeout: float = SHARD_REPLY_TIMEOUT):
+        """Ejecutar un método del BotEngine del shard y devolver el resultado"""
+        with self.lock:
+            request_id = next(self.request_ids)
+            deadline = time.monotonic() + timeout
+            try:
+                self.conn.send((request_id, method, args))
+                while True:
+                    if not self.conn.poll(max(0.0, deadline - time.monotonic())):
+                        raise ShardError(f"{self.name}: sin respuesta a {method} en {timeout:.0f}s")
+                    reply_id, status, result = self.conn.recv()
+                    if reply_id == request_id:
+                        break
+                    logger.warning("⚠️ %s: respuesta tardía descartada (comando %s)", self.name, reply_id)
+            except (EOFError, OSError) as e:
+                raise ShardError(f"{self.name}: proceso no disponible ({e})") from e
+        if status != 'ok':
+            raise ShardError(f"{self.name}: {result}")
+        return result
+
+
+class ShardedBotEngine(BotEngine):
+    """
+    Supervisor de varios procesos BotEngine
+
+    - Misma interfaz que BotEngine: las rutas no cambian
+    - Los bots de un par van al proceso que indica el HashRing; cada proceso
+      tiene su propio MarketDataService con solo sus pares
+    - Si un proceso muere se lanza uno nuevo con el mismo nombre (el anillo
+      no cambia) y se vuelven a arrancar sus bots; si no se puede, el
+      proceso sale del anillo y sus bots pasan a los demás
+    """
+
+    def __init__(self, processes: int = BOT_ENGINE_PROCESSES):
+        # Sin BotEngine.__init__: los bots corren en los procesos shard
+        self.processes = max(1, processes)
+        self.lock = threading.Lock()
+        self.bots: Dict[str, str] = {}          # bot_id → shard
+        self.configs: Dict[str, Dict] = {}      # bot_id → configuración (para reiniciar)
+        self.shards: Dict[str, _Shard] = {}
+        self.ring = HashRing()
+        self.context = multiprocessing.get_context('spawn')  # Sin fork de un proceso con threads
+        self.closed = False
+
+        for i in range(self.processes):
+            name = f"shard-{i}"
+            self.shards[name] = self._spawn(name)
+            self.ring.add(name)
+
+        self.monitor = threading.Thread(target=self._monitor, daemon=True, name="BotShardMonitor")
+        self.monitor.start()
+        logger.info("🧩 Motor de bots en %d procesos", self.processes)
+
+    def start_bot(self, config: Dict) -> bool:
+        bot_id = config['id']
+        with self.lock:
+            name = self.ring.get_node(shard_key(config['symbol'], config['timeframe']))
+            shard = self.shards[name]
+            previous = self.bots.get(bot_id)
+
+        try:
+            if previous is not None and previous != name:
+                # Cambió el par del bot: se va del proceso anterior
+                self._call(previous, 'stop_bot', bot_id)
+            started = shard.call('start_bot', config)
+        except ShardError as e:
+            logger.error("❌ Error starting bot %s in %s: %s", bot_id, name, e)
+            return False
+
+        with self.lock:
+            if started:
+                self.bots[bot_id] = name
+                self.configs[bot_id] = config
+            else:
+                self.bots.pop(bot_id, None)
+                self.configs.pop(bot_id, None)
+        return started
+
+    def start_bots(self, configs: List[Dict]) -> int:
+        """Arranque en bloque: cada proceso recibe sus bots en un solo comando, en paralelo"""
+        groups: Dict[str, List[Dict]] = {}
+        with self.lock:
+            for config in configs:
+                try:
+                    compile_strategy(config['strategy'])  # Los inválidos no llegan al proceso
+                except Exception as e:
+                    logger.error("❌ Error starting bot %s: %s", config.get('id'), e)
+                    continue
+                name = self.ring.get_node(shard_key(config['symbol'], config['timeframe']))
+                groups.setdefault(name, []).append(config)
+
+        started = {}
+
+        def start_group(name: str, group: List[Dict]):
+            # El shard devuelve los ids que arrancó: los que fallaron no se registran
+            started[name] = set(self._call(name, 'start_bots', group) or ())
+            with self.lock:
+                for config in group:
+                    if config['id'] in started[name]:
+                        self.bots[config['id']] = name
+                        self.configs[config['id']] = config
+
+        threads = [threading.Thread(target=start_group, args=item, daemon=True) for item in groups.items()]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return sum(len(ids) for ids in started.values())
+
+    def stop_bot(self, bot_id: str) -> bool:
+        with self.lock:
+            name = self.bots.pop(bot_id, None)
+            self.configs.pop(bot_id, None)
+        return bool(name and self._call(name, 'stop_bot', bot_id))
+
+    def get_bot_status(self, bot_id: str) -> Optional[Dict]:
+        return self._call_bot(bot_id, 'get_bot_status')
+
+    def force_check(self, bot_id: str) -> Optional[Dict]:
+        return self._call_bot(bot_id, 'force_check')
+
+    def set_trace(self, bot_id: str, enabled: bool) -> bool:
+        return bool(self._call_bot(bot_id, 'set_trace', enabled))
+
+    def get_trace(self, bot_id: str) -> Optional[List[Dict]]:
+        return self._call_bot(bot_id, 'get_trace')
+
+    def set_position_tracking(self, bot_id: str, ignore_tracking: bool) -> bool:
+        with self.lock:
+            if bot_id in self.configs:
+                # Un reinicio tras la caída del proceso conserva el modo elegido
+                self.configs[bot_id] = dict(self.configs[bot_id], ignore_position_tracking=ignore_tracking)
+        return bool(self._call_bot(bot_id, 'set_position_tracking', ignore_tracking))
+
+    def get_stats(self) -> Dict:
+        """Bots activos y estado de cada proceso"""
+        with self.lock:
+            shards = dict(self.shards)
+            counts = {name: 0 for name in shards}
+            for name in self.bots.values():
+                counts[name] = counts.get(name, 0) + 1
+            active_bots = len(self.bots)
+
+        stats = {'active_bots': active_bots, 'processes': len(shards), 'shards': {}}
+        for name, shard in shards.items():
+            entry = {'pid': shard.process.pid, 'alive': shard.process.is_alive(), 'bots': counts.get(name, 0)}
+            engine_stats = self._call(name, 'get_stats')
+            if engine_stats:
+                entry['scheduler'] = engine_stats['scheduler']
+            stats['shards'][name] = entry
+        return stats
+
+    def stop_all_bots(self):
+        with self.lock:
+            names = list(self.shards)
+            self.bots.clear()
+            self.configs.clear()
+        for name in names:
+            self._call(name, 'stop_all_bots')
+        logger.info("🛑 All bots stopped")
+
+    def shutdown(self):
+        """Detener los bots y terminar los procesos"""
+        with self.lock:
+            self.closed = True
+            shards = list(self.shards.values())
+            self.bots.clear()
+            self.configs.clear()
+        for shard in shards:
+            try:
+                shard.call('shutdown', timeout=10)
+            except ShardError:
+                pass
+            shard.process.join(timeout=5)
+            if shard.process.is_alive():
+                shard.process.terminate()
+        logger.info("🛑 Procesos del motor de bots detenidos")
+
+    def _spawn(self, name: str) -> _Shard:
+        parent_conn, child_conn = self.context.Pipe()
+        process = self.context.Process(target=_shard_main, args=(child_conn, self.processes),
+                                       daemon=True, name=f"BotEngine-{name}")
+        process.start()
+        child_conn.close()
+        logger.info("🟢 Proceso %s iniciado (pid %s)", name, process.pid)
+        return _Shard(name, process, parent_conn)
+
+    def _call(self, name: str, method: str, *args):
+        """Comando a un shard; None si falló (se registra el error)"""
+        with self.lock:
+            shard = self.shards.get(name)
+        if shard is None:
+            return None
+        try:
+            return shard.call(method, *args)
+        except ShardError as e:
+            logger.error("❌ %s", e)
+            return None
+
+    def _call_bot(self, bot_id: str, method: str, *args):
+        with self.lock:
+            name = self.bots.get(bot_id)
+        return None if name is None else self._call(name, method, bot_id, *args)
+
+    def _monitor(self):
+        """Detectar procesos muertos (sentinel del proceso) y recuperarlos"""
+        while not self.closed:
+            with self.lock:
+                sentinels = {shard.process.sentinel: shard for shard in self.shards.values()}
+            for sentinel in wait(list(sentinels), timeout=1):
+                if not self.closed:
+                    self._recover(sentinels[sentinel])
+
+    def _recover(self, dead: _Shard):
+        """Relanzar un proceso muerto y volver a arrancar sus bots"""
+        logger.error("💥 Proceso %s (pid %s) terminó con código %s", dead.name, dead.process.pid,
+                     dead.process.exitcode)
+        with self.lock:
+            if self.shards.get(dead.name) is not dead:
+                return
+            configs = [self.configs[bot_id] for bot_id, name in self.bots.items() if name == dead.name]
+            try:
+                self.shards[dead.name] = self._spawn(dead.name)
+            except Exception as e:
+                # Sin reemplazo: sus pares pasan a los demás procesos
+                logger.error("❌ No se pudo relanzar %s: %s", dead.name, e)
+                del self.shards[dead.name]
+                self.ring.remove(dead.name)
+            for config in configs:
+                del self.bots[config['id']]
+
+        # Configuración y posiciones actuales de la base de datos (la guardada si el bot no está)
+        restarted = sum(1 for config in configs if self.restart_bot(config['id']) or self.start_bot(config))
+        logger.info("♻️ %d de %d bots de %s arrancados de nuevo", restarted, len(configs), dead.name)
+
+
+def create_bot_engine():
+    """
+    Motor de bots según BOT_ENGINE_PROCESSES
+
+    Dentro de un proceso shard (que importa de nuevo el módulo principal)
+    siempre se usa un BotEngine local.
+    """
+    if BOT_ENGINE_PROCESSES > 1 and multiprocessing.parent_process() is None:
+        return ShardedBotEngine(BOT_ENGINE_PROCESSES)
+    return BotEngine()
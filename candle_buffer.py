@@ -0,0 +1,196 @@
+"""
+Candle Buffer - Almacenamiento columnar de velas por par
+Buffer circular de capacidad fija sobre arrays NumPy contiguos (OHLCV)
+"""
+
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+def _readonly(values: np.ndarray) -> np.ndarray:
+    values.flags.writeable = False
+    return values
+
+
+class FrozenFrame(pd.DataFrame):
+    """
+    DataFrame de solo lectura compartido entre lectores
+
+    Sus columnas son arrays NumPy no escribibles (modificar valores lanza
+    ValueError) y agregar, quitar o reemplazar columnas lanza TypeError.
+    Las operaciones que generan un DataFrame nuevo (copy(), slices,
+    cálculos) devuelven DataFrames normales.
+    """
+
+    @property
+    def _constructor(self):
+        return pd.DataFrame
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("Snapshot de solo lectura: usar .copy() para modificarlo")
+
+    __setitem__ = __delitem__ = insert = pop = _update_inplace = _read_only
+
+    def __setattr__(self, name, value):
+        # Bloquea reemplazar los datos (inplace=True, agregar filas) y asignar columnas por atributo
+        if name in ('_mgr', 'index', 'columns') or name in self.columns:
+            self._read_only()
+        super().__setattr__(name, value)
+
+
+class CandleBuffer:
+    """
+    Buffer circular de velas con columnas NumPy
+
+    - timestamp: int64 (apertura en ms); open/high/low/close/volume: float64
+    - Cada vela se escribe dos veces (posición i e i + capacidad), así que
+      la ventana de las últimas N velas siempre es un slice contiguo: leer
+      no requiere reordenar ni copiar
+    - append/update en O(1); version aumenta con cada modificación para que
+      los lectores detecten cambios sin comparar datos
+    """
+
+    def __init__(self, capacity: int = 500):
+        if capacity < 1:
+            raise ValueError("capacity debe ser >= 1")
+        self.capacity = capacity
+        self.timestamps = np.zeros(2 * capacity, dtype=np.int64)
+        self.columns: Dict[str, np.ndarray] = {name: np.zeros(2 * capacity) for name in COLUMNS}
+        self.count = 0      # Velas escritas desde el último reset
+        self.version = 0
+        self._snapshot = None   # (versión, FrozenFrame)
+
+    def __len__(self) -> int:
+        return min(self.count, self.capacity)
+
+    @property
+    def last_timestamp(self) -> Optional[int]:
+        """Apertura (ms) de la última vela o None si está vacío"""
+        if self.count == 0:
+            return None
+        return int(self.timestamps[(self.count - 1) % self.capacity])
+
+    def clear(self):
+        """Vaciar el buffer"""
+        self.count = 0
+        self.version += 1
+
+    def append(self, timestamp: int, open_: float, high: float, low: float, close: float, volume: float):
+        """Agregar una vela nueva al final (descarta la más vieja si está lleno)"""
+        self._write(self.count % self.capacity, timestamp, (open_, high, low, close, volume))
+        self.count += 1
+        self.version += 1
+
+    def update_last(self, open_: float, high: float, low: float, close: float, volume: float):
+        """Reemplazar los valores de la última vela (vela en formación)"""
+        if self.count == 0:
+            raise IndexError("CandleBuffer vacío")
+        position = (self.count - 1) % self.capacity
+        self._write(position, self.timestamps[position], (open_, high, low, close, volume))
+        self.version += 1
+
+    def upsert(self, timestamps: np.ndarray, values: np.ndarray) -> int:
+        """
+        Aplicar velas ordenadas: la que coincide con la última se reemplaza
+        (si cambió), las posteriores se agregan y las anteriores se ignoran.
+
+        Args:
+            timestamps: Aperturas en ms (int64)
+            values: Array (n, 5) con open, high, low, close, volume
+
+        Returns:
+            Número de velas escritas (0 si no cambió nada; la versión no aumenta)
+        """
+        written = 0
+        last = self.last_timestamp
+        for timestamp, row in zip(timestamps, values):
+            timestamp = int(timestamp)
+            if last is not None and timestamp < last:
+                continue
+            if timestamp == last:
+                position = (self.count - 1) % self.capacity
+                if all(self.columns[name][position] == value for name, value in zip(COLUMNS, row)):
+                    continue
+            else:
+                position = self.count % self.capacity
+                self.count += 1
+                last = timestamp
+            self._write(position, timestamp, row)
+            written += 1
+        if written:
+            self.version += 1
+        return written
+
+    def load(self, timestamps: np.ndarray, values: np.ndarray):
+        """Reemplazar todo el contenido (se conservan las últimas `capacity` velas)"""
+        timestamps = np.asarray(timestamps, dtype=np.int64)[-self.capacity:]
+        values = np.asarray(values, dtype=float)[-self.capacity:]
+        n = len(timestamps)
+        self.timestamps[:n] = timestamps
+        self.timestamps[self.capacity:self.capacity + n] = timestamps
+        for i, name in enumerate(COLUMNS):
+            column = self.columns[name]
+            column[:n] = values[:, i]
+            column[self.capacity:self.capacity + n] = values[:, i]
+        self.count = n
+        self.version += 1
+
+    def _write(self, position: int, timestamp: int, row):
+        mirror = position + self.capacity
+        self.timestamps[position] = self.timestamps[mirror] = timestamp
+        for name, value in zip(COLUMNS, row):
+            column = self.columns[name]
+            column[position] = column[mirror] = value
+
+    def _window(self) -> slice:
+        size = len(self)
+        start = (self.count - size) % self.capacity
+        return slice(start, start + size)
+
+    def view(self, name: str) -> np.ndarray:
+        """
+        Vista contigua (sin copia) de una columna, de la vela más vieja a la más nueva
+
+        La vista refleja las escrituras posteriores: usarla solo mientras no
+        se modifique el buffer (o copiarla).
+        """
+        window = self._window()
+        if name == 'timestamp':
+            return self.timestamps[window]
+        return self.columns[name][window]
+
+    def to_frame(self) -> pd.DataFrame:
+        """DataFrame OHLCV (copia) con el mismo formato que la API de Binance"""
+        window = self._window()
+        frame = {'timestamp': pd.to_datetime(self.timestamps[window], unit='ms')}
+        for name in COLUMNS:
+            frame[name] = self.columns[name][window].copy()
+        return pd.DataFrame(frame)
+
+    def snapshot(self) -> FrozenFrame:
+        """
+        Snapshot inmutable de la versión actual
+
+        Se genera una sola vez por versión (una copia de la ventana) y se
+        devuelve el mismo objeto a todos los lectores: leer no copia y las
+        escrituras posteriores del buffer no lo afectan.
+        """
+        if self._snapshot is None or self._snapshot[0] != self.version:
+            window = self._window()
+            frame = {'timestamp': _readonly(self.timestamps[window].astype('datetime64[ms]'))}
+            for name in COLUMNS:
+                frame[name] = _readonly(self.columns[name][window].copy())
+            self._snapshot = (self.version, FrozenFrame(frame, copy=False))
+        return self._snapshot[1]
+
+    @staticmethod
+    def frame_arrays(df: pd.DataFrame):
+        """Convertir un DataFrame OHLCV a (timestamps en ms, valores (n, 5))"""
+        timestamps = df['timestamp'].to_numpy().astype('datetime64[ms]').astype(np.int64)
+        values = np.column_stack([df[name].to_numpy(dtype=float) for name in COLUMNS]) if len(df) else \
+            np.empty((0, len(COLUMNS)))
+        return timestamps, values
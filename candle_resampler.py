@@ -0,0 +1,70 @@
+"""
+Candle Resampler - Velas de timeframes mayores a partir de un timeframe base
+Agrega las velas base vela a vela (ej: 1m → 5m, 15m, 1h) con los mismos
+límites de vela que Binance
+"""
+
+from typing import List, Optional
+
+
+class CandleResampler:
+    """
+    Agregación OHLCV incremental
+
+    - Guarda el acumulado de las velas base ya cerradas de la vela mayor en
+      formación más la vela base en formación: cada vela base nueva o
+      modificada cuesta O(1), sin recorrer el historial
+    - Límites alineados como en Binance: aperturas múltiplo del período
+      desde epoch (+ offset: las semanas abren los lunes)
+    """
+
+    def __init__(self, period_ms: int, offset_ms: int = 0):
+        self.period_ms = period_ms
+        self.offset_ms = offset_ms
+        self.bucket: Optional[int] = None       # Apertura de la vela mayor en formación
+        self.closed: Optional[list] = None      # [o, h, l, c, v] de las velas base cerradas del bucket
+        self.current: Optional[tuple] = None    # (apertura, [o, h, l, c, v]) de la vela base en formación
+
+    def bucket_open(self, timestamp: int) -> int:
+        """Apertura (ms) de la vela mayor que contiene una vela base"""
+        return (timestamp - self.offset_ms) // self.period_ms * self.period_ms + self.offset_ms
+
+    def apply(self, timestamps, values) -> List[list]:
+        """
+        Agregar velas base ordenadas
+
+        La vela base que coincide con la última recibida la reemplaza (vela en
+        formación), las posteriores se agregan y las anteriores se ignoran,
+        igual que CandleBuffer.upsert.
+
+        Args:
+            timestamps: Aperturas en ms
+            values: Filas [open, high, low, close, volume]
+
+        Returns:
+            Velas mayores modificadas, [apertura, o, h, l, c, v] en orden
+        """
+        changed = {}
+        for timestamp, row in zip(timestamps, values):
+            timestamp = int(timestamp)
+            row = [float(value) for value in row]
+            bucket = self.bucket_open(timestamp)
+
+            if self.bucket is None or bucket > self.bucket:
+                self.bucket, self.closed, self.current = bucket, None, (timestamp, row)
+            elif bucket < self.bucket or timestamp < self.current[0]:
+                continue
+            elif timestamp == self.current[0]:
+                self.current = (timestamp, row)
+            else:
+                self.closed = self._merge(self.closed, self.current[1])
+                self.current = (timestamp, row)
+
+            changed[self.bucket] = [self.bucket, *self._merge(self.closed, self.current[1])]
+        return list(changed.values())
+
+    @staticmethod
+    def _merge(first: Optional[list], second: list) -> list:
+        if first is None:
+            return list(second)
+        return [first[0], max(first[1], second[1]), min(first[2], second[2]), second[3], first[4] + second[4]]
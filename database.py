@@ -16,6 +16,12 @@ DB_DIR = Path(__file__).parent / "database"
 DB_DIR.mkdir(exist_ok=True)
 DB_FILE = DB_DIR / "draglab.db"
 
+# Columnas agregadas a signal_bots después de su creación (nombre, definición)
+SIGNAL_BOT_COLUMNS = [
+    ('position_state', 'INTEGER DEFAULT 0'),  # Bits: 1 = LONG abierta, 2 = SHORT abierta
+    ('last_signal_type', 'TEXT'),
+]
+
 def get_db_connection():
     """Crear conexión a la base de datos"""
     conn = sqlite3.connect(str(DB_FILE), timeout=30.0, check_same_thread=False)
@@ -170,10 +176,30 @@ def init_database():
         )
     ''')
     
+    # Bases existentes: el motor de bots lee y guarda position_state/last_signal_type
+    migrate_signal_bots(conn)
+    
     conn.commit()
     conn.close()
     print("[OK] Base de datos inicializada correctamente")
 
+def migrate_signal_bots(conn):
+    """Agregar a signal_bots las columnas que falten (idempotente; sin tabla no hace nada)"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(signal_bots)")}
+    if not columns:
+        return
+    for name, definition in SIGNAL_BOT_COLUMNS:
+        if name in columns:
+            continue
+        try:
+            conn.execute(f"ALTER TABLE signal_bots ADD COLUMN {name} {definition}")
+            print(f"[OK] Columna signal_bots.{name} agregada")
+        except sqlite3.OperationalError as e:
+            # Otro worker la agregó al mismo tiempo
+            if 'duplicate column' not in str(e):
+                raise
+    conn.commit()
+
 def hash_password(password):
     """Hash de contraseña con werkzeug (scrypt)"""
     return generate_password_hash(password)
@@ -0,0 +1,204 @@
+"""
+Fake Kline Server - Servidor WebSocket local que imita los combined streams de Binance
+Permite probar KlineStream y el modo streaming del MarketDataService sin red
+"""
+
+import json
+import socket
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+from kline_stream import OP_CLOSE, OP_PING, OP_PONG, OP_TEXT, accept_key, read_frame, stream_name, write_frame
+
+
+class _Client:
+    """Conexión aceptada por el servidor"""
+
+    def __init__(self, sock: socket.socket, streams: Iterable[str]):
+        self.sock = sock
+        self.streams = set(streams)
+        self.send_lock = threading.Lock()
+        self.pongs: List[bytes] = []
+
+    def send(self, opcode: int, payload: bytes = b''):
+        with self.send_lock:
+            write_frame(self.sock, opcode, payload, mask=False)
+
+
+class FakeKlineServer:
+    """
+    Servidor WebSocket en un thread local (127.0.0.1, puerto libre)
+
+    - /stream?streams=a/b: combined streams como wss://stream.binance.com:9443/stream
+    - Responde a SUBSCRIBE/UNSUBSCRIBE y a los pings del cliente
+    - send_kline() publica una vela a los clientes suscritos a su stream
+    - drop_connections() corta las conexiones (para probar la reconexión)
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen()
+        self.host, self.port = self.server.getsockname()
+        self.clients: List[_Client] = []
+        self.connections = 0
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        return f"ws://{self.host}:{self.port}/stream"
+
+    def start(self) -> 'FakeKlineServer':
+        self.thread = threading.Thread(target=self._accept_loop, daemon=True, name="FakeKlineServer")
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.drop_connections()
+        self.server.close()
+
+    def wait_for_streams(self, names: Iterable[str], timeout: float = 5) -> bool:
+        """Esperar a que algún cliente esté suscrito a todos los streams indicados"""
+        names = set(names)
+        with self.condition:
+            return self.condition.wait_for(
+                lambda: any(names <= client.streams for client in self.clients), timeout=timeout)
+
+    def wait_for_connections(self, count: int, timeout: float = 5) -> bool:
+        """Esperar a que se hayan aceptado `count` conexiones en total"""
+        with self.condition:
+            return self.condition.wait_for(lambda: self.connections >= count, timeout=timeout)
+
+    def send_kline(self, symbol: str, timeframe: str, open_ms: int, values, closed: bool = False,
+                   period_ms: int = 60000) -> int:
+        """
+        Publicar una vela en el formato de Binance
+
+        Returns:
+            Número de clientes que la recibieron
+        """
+        name = stream_name(symbol, timeframe)
+        open_, high, low, close, volume = values
+        message = json.dumps({
+            'stream': name,
+            'data': {
+                'e': 'kline', 'E': int(time.time() * 1000), 's': symbol.upper(),
+                'k': {
+                    't': open_ms, 'T': open_ms + period_ms - 1, 's': symbol.upper(), 'i': timeframe,
+                    'o': str(open_), 'h': str(high), 'l': str(low), 'c': str(close), 'v': str(volume),
+                    'x': closed,
+                },
+            },
+        }).encode()
+        sent = 0
+        for client in self._clients():
+            if name in client.streams:
+                try:
+                    client.send(OP_TEXT, message)
+                    sent += 1
+                except OSError:
+                    pass
+        return sent
+
+    def ping(self, payload: bytes = b'ping'):
+        """Enviar un ping a todos los clientes"""
+        for client in self._clients():
+            client.send(OP_PING, payload)
+
+    def pongs(self) -> List[bytes]:
+        """Pongs recibidos de todos los clientes"""
+        return [pong for client in self._clients() for pong in client.pongs]
+
+    def drop_connections(self):
+        """Cortar todas las conexiones sin handshake de cierre"""
+        for client in self._clients():
+            try:
+                client.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            client.sock.close()
+        with self.condition:
+            self.clients.clear()
+
+    def _clients(self) -> List[_Client]:
+        with self.condition:
+            return list(self.clients)
+
+    def _accept_loop(self):
+        while True:
+            try:
+                sock, _ = self.server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._serve, args=(sock,), daemon=True).start()
+
+    def _serve(self, sock: socket.socket):
+        reader = sock.makefile('rb')
+        try:
+            client = self._handshake(sock, reader)
+        except (OSError, ValueError, KeyError, IndexError):
+            sock.close()
+            return
+
+        with self.condition:
+            self.clients.append(client)
+            self.connections += 1
+            self.condition.notify_all()
+
+        try:
+            while True:
+                _, opcode, payload = read_frame(reader)
+                if opcode == OP_PING:
+                    client.send(OP_PONG, payload)
+                elif opcode == OP_PONG:
+                    client.pongs.append(payload)
+                elif opcode == OP_CLOSE:
+                    client.send(OP_CLOSE, payload[:2])
+                    break
+                elif opcode == OP_TEXT:
+                    self._handle_request(client, json.loads(payload))
+        except Exception:
+            pass
+        finally:
+            with self.condition:
+                if client in self.clients:
+                    self.clients.remove(client)
+            sock.close()
+
+    def _handshake(self, sock: socket.socket, reader) -> _Client:
+        request_line = reader.readline().decode('latin-1')
+        headers: Dict[str, str] = {}
+        while True:
+            line = reader.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        path = request_line.split()[1]
+        key = headers['sec-websocket-key']
+        query = parse_qs(urlparse(path).query)
+        streams = [name for value in query.get('streams', []) for name in value.split('/') if name]
+
+        sock.sendall((
+            "HTTP/1.1 101 Switching Protocols\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept_key(key)}\r\n\r\n"
+        ).encode())
+        return _Client(sock, streams)
+
+    def _handle_request(self, client: _Client, request: dict):
+        method = request.get('method')
+        params = set(request.get('params', []))
+        with self.condition:
+            if method == 'SUBSCRIBE':
+                client.streams |= params
+            elif method == 'UNSUBSCRIBE':
+                client.streams -= params
+            self.condition.notify_all()
+        client.send(OP_TEXT, json.dumps({'result': None, 'id': request.get('id')}).encode())
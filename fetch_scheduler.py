@@ -0,0 +1,229 @@
+"""
+Fetch Scheduler - Programador único de descargas de datos de mercado
+Reemplaza el thread por par: cola de prioridad con la próxima descarga de
+cada par y un pool acotado de threads que las ejecuta. El BotEngine usa
+otra instancia para los chequeos de los bots
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional
+
+from bot_logging import get_logger
+
+logger = get_logger('fetch_scheduler')
+
+
+# Valor de retorno de task(): no reprogramar hasta el próximo wake()
+IDLE = math.inf
+
+
+class ScheduledJob:
+    """
+    Tarea periódica de un par: task() devuelve los segundos hasta la próxima
+    ejecución (None = terminar, IDLE = esperar a wake())
+    """
+
+    __slots__ = ('key', 'task', 'due', 'cancelled', 'running', 'woken')
+
+    def __init__(self, key: Hashable, task: Callable[[], Optional[float]], due: float):
+        self.key = key
+        self.task = task
+        self.due = due
+        self.cancelled = False
+        self.running = False
+        self.woken = False  # wake() mientras corría: se vuelve a ejecutar al terminar
+
+    def is_alive(self) -> bool:
+        return not self.cancelled
+
+
+class FetchScheduler:
+    """
+    Programador de descargas periódicas
+
+    - Un solo thread despachador con un heap ordenado por próxima ejecución
+    - Como mucho max_workers tareas a la vez (pool de threads acotado); una
+      tarea nunca corre dos veces en paralelo
+    - Entre dos despachos pasan al menos `spacing` segundos: los pares que
+      vencen juntos (p. ej. al cierre de vela) se reparten en lugar de
+      salir todos en ráfaga
+    """
+
+    def __init__(self, max_workers: int = 4, spacing: float = 0.05, error_delay: float = 60.0):
+        self.max_workers = max(1, max_workers)
+        self.spacing = spacing
+        self.error_delay = error_delay
+        self.jobs: Dict[Hashable, ScheduledJob] = {}
+        self.heap: List[tuple] = []
+        self.condition = threading.Condition()
+        self.thread: Optional[threading.Thread] = None
+        self.executor: Optional[ThreadPoolExecutor] = None
+        self.running = 0
+        self.last_dispatch = 0.0
+        self.generation = 0  # Aumenta con cada stop(): el despachador anterior termina
+        self.stats = {'executed': 0, 'errors': 0, 'total_lag': 0.0, 'max_lag': 0.0}
+        self._sequence = itertools.count()
+
+    def schedule(self, key: Hashable, task: Callable[[], Optional[float]], delay: float = 0.0) -> ScheduledJob:
+        """
+        Programar una tarea periódica (reemplaza la que tuviera la misma clave)
+
+        Args:
+            key: Identificador de la tarea (ej: (símbolo, timeframe))
+            task: Función a ejecutar; devuelve la espera hasta la siguiente vez o None
+            delay: Segundos hasta la primera ejecución (IDLE = esperar a wake())
+        """
+        with self.condition:
+            previous = self.jobs.get(key)
+            if previous is not None:
+                previous.cancelled = True
+            job = ScheduledJob(key, task, time.monotonic() + delay)
+            self.jobs[key] = job
+            if delay != IDLE:
+                heapq.heappush(self.heap, (job.due, next(self._sequence), job))
+            self._ensure_started()
+            self.condition.notify_all()
+        return job
+
+    def wake(self, key: Hashable) -> bool:
+        """
+        Ejecutar una tarea cuanto antes (si está corriendo, otra vez al terminar)
+
+        Varios wake() antes de que se ejecute cuentan como uno.
+
+        Returns:
+            False si no hay una tarea con esa clave
+        """
+        with self.condition:
+            job = self.jobs.get(key)
+            if job is None or job.cancelled:
+                return False
+            now = time.monotonic()
+            if job.running:
+                job.woken = True
+            elif job.due > now:
+                job.due = now
+                heapq.heappush(self.heap, (job.due, next(self._sequence), job))
+                self.condition.notify_all()
+            return True
+
+    def cancel(self, key: Hashable):
+        """Cancelar una tarea (si está corriendo termina y no se reprograma)"""
+        with self.condition:
+            job = self.jobs.pop(key, None)
+            if job is not None:
+                job.cancelled = True
+                self.condition.notify_all()
+
+    def stop(self):
+        """Cancelar todo y detener el despachador (schedule() lo vuelve a iniciar)"""
+        with self.condition:
+            for job in self.jobs.values():
+                job.cancelled = True
+            self.jobs.clear()
+            self.heap.clear()
+            self.generation += 1
+            self.condition.notify_all()
+            thread, executor = self.thread, self.executor
+            self.thread = self.executor = None
+        if thread is not None:
+            thread.join(timeout=5)
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def get_stats(self) -> Dict:
+        """Tareas programadas, en ejecución, vencidas en espera (profundidad de la cola) y retraso de despacho"""
+        with self.condition:
+            now = time.monotonic()
+            executed = self.stats['executed']
+            return {
+                'jobs': len(self.jobs),
+                'running': self.running,
+                'waiting': sum(1 for due, _, job in self.heap if due <= now and self._is_current(due, job)),
+                'idle': sum(1 for job in self.jobs.values() if job.due == IDLE and not job.running),
+                'max_workers': self.max_workers,
+                'executed': executed,
+                'errors': self.stats['errors'],
+                'avg_lag': self.stats['total_lag'] / executed if executed else 0.0,
+                'max_lag': self.stats['max_lag'],
+            }
+
+    def _ensure_started(self):
+        """Iniciar el despachador (llamar con condition tomado)"""
+        if self.thread is not None and self.thread.is_alive():
+            return
+        self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="Fetch")
+        self.thread = threading.Thread(target=self._dispatch_loop, args=(self.generation, self.executor),
+                                       daemon=True, name="FetchScheduler")
+        self.thread.start()
+
+    def _dispatch_loop(self, generation: int, executor: ThreadPoolExecutor):
+        while True:
+            with self.condition:
+                job = self._next_job(generation)
+            if job is None:
+                return
+            executor.submit(self._execute, job)
+
+    def _next_job(self, generation: int) -> Optional[ScheduledJob]:
+        """Esperar la próxima tarea vencida con un hueco libre en el pool (None = detenido)"""
+        while self.generation == generation:
+            while self.heap and not self._is_current(*self.heap[0][::2]):
+                heapq.heappop(self.heap)
+
+            now = time.monotonic()
+            if not self.heap or self.running >= self.max_workers:
+                self.condition.wait()
+                continue
+
+            due = self.heap[0][0]
+            start = max(due, self.last_dispatch + self.spacing)
+            if start > now:
+                self.condition.wait(timeout=start - now)
+                continue
+
+            _, _, job = heapq.heappop(self.heap)
+            lag = now - due
+            self.stats['total_lag'] += lag
+            self.stats['max_lag'] = max(self.stats['max_lag'], lag)
+            self.running += 1
+            job.running = True
+            self.last_dispatch = now
+            return job
+        return None
+
+    def _execute(self, job: ScheduledJob):
+        try:
+            delay = job.task()
+        except Exception as e:
+            logger.exception("❌ Error en tarea programada %s: %s", job.key, e)
+            with self.condition:
+                self.stats['errors'] += 1
+            delay = self.error_delay
+
+        with self.condition:
+            self.running -= 1
+            job.running = False
+            self.stats['executed'] += 1
+            if delay is None:
+                job.cancelled = True
+                if self.jobs.get(job.key) is job:
+                    del self.jobs[job.key]
+            elif not job.cancelled:
+                if job.woken:
+                    delay = 0.0
+                job.due = time.monotonic() + delay
+                if delay != IDLE:
+                    heapq.heappush(self.heap, (job.due, next(self._sequence), job))
+            job.woken = False
+            self.condition.notify_all()
+
+    @staticmethod
+    def _is_current(due: float, job: ScheduledJob) -> bool:
+        """Entrada del heap vigente (no cancelada ni reemplazada por un wake/reprogramación)"""
+        return not job.cancelled and not job.running and due == job.due
@@ -0,0 +1,128 @@
+"""
+HTTP Client - Sesiones HTTP compartidas para todas las llamadas salientes
+Una sesión keep-alive por host (Binance, Telegram, CoinGecko) con pool de
+conexiones, reintentos con backoff y timeout por host
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from bot_logging import get_logger
+
+logger = get_logger('http_client')
+
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))  # Conexiones abiertas por host
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '3'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.5'))  # Espera 0.5s, 1s, 2s... entre reintentos
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', '10'))  # Timeout de hosts sin entrada en HOST_TIMEOUTS
+
+# Timeout (segundos) por host
+HOST_TIMEOUTS = {
+    'api.binance.com': float(os.getenv('BINANCE_HTTP_TIMEOUT', '10')),
+    'api.telegram.org': float(os.getenv('TELEGRAM_HTTP_TIMEOUT', '10')),
+    'api.coingecko.com': float(os.getenv('COINGECKO_HTTP_TIMEOUT', '30')),
+}
+
+# Errores temporales del servidor que se reintentan. 429/418 no: los maneja binance_rate_limiter
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+class HttpClient:
+    """
+    Sesiones HTTP por host
+
+    - Singleton: todas las llamadas a un host reusan las mismas conexiones
+      (sin handshake TCP+TLS por request)
+    - Los errores de conexión se reintentan siempre; los de lectura y los
+      5xx solo en GET (un POST a Telegram no se envía dos veces)
+    - get()/post() aceptan los mismos argumentos que requests
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """Implementación Singleton thread-safe"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """Inicializar cliente (solo una vez)"""
+        if hasattr(self, '_initialized'):
+            return
+
+        self._initialized = True
+        self.sessions: Dict[str, requests.Session] = {}
+        self.stats: Dict[str, Dict[str, int]] = {}
+        self.lock = threading.Lock()
+
+    def session(self, host: str) -> requests.Session:
+        """Sesión keep-alive de un host (se crea la primera vez)"""
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                retry = Retry(total=HTTP_RETRIES, backoff_factor=HTTP_BACKOFF,
+                              status_forcelist=RETRY_STATUS_CODES, allowed_methods=frozenset({'GET'}),
+                              raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_POOL_MAXSIZE, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self.sessions[host] = session
+                self.stats[host] = {'requests': 0, 'errors': 0}
+                logger.debug("🔌 Sesión HTTP creada para %s (pool %d)", host, HTTP_POOL_MAXSIZE)
+            return session
+
+    def request(self, method: str, url: str, timeout: Optional[float] = None, **kwargs) -> requests.Response:
+        """
+        Hacer un request con la sesión del host de la URL
+
+        Args:
+            method: 'GET', 'POST'...
+            url: URL completa
+            timeout: Segundos; por defecto el del host (HOST_TIMEOUTS)
+        """
+        host = urlsplit(url).hostname or ''
+        session = self.session(host)
+        if timeout is None:
+            timeout = HOST_TIMEOUTS.get(host, HTTP_TIMEOUT)
+        try:
+            return session.request(method, url, timeout=timeout, **kwargs)
+        except requests.exceptions.RequestException:
+            with self.lock:
+                self.stats[host]['errors'] += 1
+            raise
+        finally:
+            with self.lock:
+                self.stats[host]['requests'] += 1
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """Requests y errores por host"""
+        with self.lock:
+            return {host: dict(stats) for host, stats in self.stats.items()}
+
+    def close(self):
+        """Cerrar todas las conexiones"""
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+
+# Instancia global singleton
+http_client = HttpClient()
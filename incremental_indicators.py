@@ -0,0 +1,511 @@
+"""
+Incremental Indicators
+Indicadores técnicos con estado que se actualizan en O(1) por vela nueva o modificada
+Equivalentes numéricamente a los cálculos de MarketDataProvider (pandas)
+"""
+
+import math
+from collections import deque
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Valores recientes que conserva cada indicador
+DEFAULT_HISTORY = 50
+
+NAN = float('nan')
+
+
+class _Ema:
+    """EMA con adjust=False (igual que pandas ewm(span, adjust=False))"""
+
+    __slots__ = ('alpha', 'prev', 'current')
+
+    def __init__(self, span: int):
+        self.alpha = 2.0 / (span + 1.0)
+        self.prev = None      # EMA confirmada hasta la vela anterior
+        self.current = None   # EMA incluyendo la vela actual
+
+    def push(self, x: float) -> float:
+        self.prev = self.current
+        return self.amend(x)
+
+    def amend(self, x: float) -> float:
+        if self.prev is None or math.isnan(self.prev):
+            self.current = x
+        elif math.isnan(x):
+            # pandas ignora los NaN y mantiene el último valor
+            self.current = self.prev
+        else:
+            self.current = self.alpha * x + (1.0 - self.alpha) * self.prev
+        return self.current
+
+
+class _RollingWindow:
+    """
+    Ventana móvil con sumas acumuladas (media y varianza en O(1))
+
+    Las sumas se desplazan por un valor de referencia para no perder
+    precisión con precios grandes, y se recalculan cada `period` velas
+    para evitar la deriva del punto flotante.
+    """
+
+    __slots__ = ('period', 'values', 'shift', 'total', 'total_sq', 'pushes')
+
+    def __init__(self, period: int):
+        self.period = period
+        self.values = deque(maxlen=period)
+        self.shift = None
+        self.total = 0.0
+        self.total_sq = 0.0
+        self.pushes = 0
+
+    def push(self, x: float):
+        if self.shift is None:
+            self.shift = x
+        if len(self.values) == self.period:
+            self._remove(self.values[0])
+        self.values.append(x)
+        self._add(x)
+        self.pushes += 1
+        if self.pushes % self.period == 0:
+            self._resync()
+
+    def amend(self, x: float):
+        if not self.values:
+            self.push(x)
+            return
+        self._remove(self.values[-1])
+        self.values[-1] = x
+        self._add(x)
+
+    def _add(self, x: float):
+        d = x - self.shift
+        self.total += d
+        self.total_sq += d * d
+
+    def _remove(self, x: float):
+        d = x - self.shift
+        self.total -= d
+        self.total_sq -= d * d
+
+    def _resync(self):
+        self.shift = self.values[-1]
+        self.total = 0.0
+        self.total_sq = 0.0
+        for x in self.values:
+            self._add(x)
+
+    @property
+    def full(self) -> bool:
+        return len(self.values) == self.period
+
+    def mean(self) -> float:
+        if not self.full:
+            return NAN
+        return self.shift + self.total / self.period
+
+    def std(self) -> float:
+        """Desviación estándar muestral (ddof=1, igual que pandas)"""
+        n = self.period
+        if not self.full or n < 2:
+            return NAN
+        variance = (self.total_sq - self.total * self.total / n) / (n - 1)
+        return math.sqrt(variance) if variance > 0 else 0.0
+
+
+class IncrementalIndicator:
+    """
+    Base de los indicadores incrementales
+
+    - update(candle, is_new=True): agrega una vela nueva
+    - update(candle, is_new=False): modifica la última vela (vela en formación)
+    - value: último valor; history: valores recientes (el último es la vela actual)
+    """
+
+    components: Tuple[str, ...] = ()
+
+    def __init__(self, history_size: int = DEFAULT_HISTORY):
+        self.history = deque(maxlen=history_size)
+        self.count = 0
+
+    def update(self, candle: Dict[str, float], is_new: bool = True) -> Any:
+        """
+        Procesar una vela
+
+        Args:
+            candle: Diccionario con open, high, low, close
+            is_new: True si es una vela nueva, False si modifica la última
+        """
+        if is_new or self.count == 0:
+            self.count += 1
+            value = self._push(candle)
+            self.history.append(value)
+        else:
+            value = self._amend(candle)
+            self.history[-1] = value
+        return value
+
+    @property
+    def value(self) -> Any:
+        return self.history[-1] if self.history else None
+
+    def series(self, component: Optional[str] = None) -> np.ndarray:
+        """Historial como array (alineado a la última vela)"""
+        if component is None:
+            return np.array(self.history, dtype=float)
+        return np.array([value[component] for value in self.history], dtype=float)
+
+    def result(self) -> Any:
+        """Historial en el mismo formato que StrategyEvaluator.compute_indicators"""
+        if self.components:
+            return {component: self.series(component) for component in self.components}
+        return self.series()
+
+    def _push(self, candle: Dict[str, float]) -> Any:
+        raise NotImplementedError
+
+    def _amend(self, candle: Dict[str, float]) -> Any:
+        raise NotImplementedError
+
+
+class IncrementalEMA(IncrementalIndicator):
+    """EMA incremental"""
+
+    def __init__(self, period: int, history_size: int = DEFAULT_HISTORY):
+        super().__init__(history_size)
+        self.ema = _Ema(period)
+
+    def _push(self, candle):
+        return self.ema.push(candle['close'])
+
+    def _amend(self, candle):
+        return self.ema.amend(candle['close'])
+
+
+class IncrementalSMA(IncrementalIndicator):
+    """SMA incremental"""
+
+    def __init__(self, period: int, history_size: int = DEFAULT_HISTORY):
+        super().__init__(history_size)
+        self.window = _RollingWindow(period)
+
+    def _push(self, candle):
+        self.window.push(candle['close'])
+        return self.window.mean()
+
+    def _amend(self, candle):
+        self.window.amend(candle['close'])
+        return self.window.mean()
+
+
+class IncrementalRSI(IncrementalIndicator):
+    """RSI incremental (medias simples de ganancias y pérdidas, como calculate_rsi)"""
+
+    def __init__(self, period: int = 14, history_size: int = DEFAULT_HISTORY):
+        super().__init__(history_size)
+        self.gains = _RollingWindow(period)
+        self.losses = _RollingWindow(period)
+        self.prev_close = None
+        self.close = None
+
+    def _push(self, candle):
+        self.prev_close = self.close
+        self.close = candle['close']
+        gain, loss = self._delta()
+        self.gains.push(gain)
+        self.losses.push(loss)
+        return self._rsi()
+
+    def _amend(self, candle):
+        self.close = candle['close']
+        gain, loss = self._delta()
+        self.gains.amend(gain)
+        self.losses.amend(loss)
+        return self._rsi()
+
+    def _delta(self) -> Tuple[float, float]:
+        if self.prev_close is None:
+            return 0.0, 0.0
+        delta = self.close - self.prev_close
+        return (delta if delta > 0 else 0.0), (-delta if delta < 0 else 0.0)
+
+    def _rsi(self) -> float:
+        gain = self.gains.mean()
+        loss = self.losses.mean()
+        if math.isnan(gain) or math.isnan(loss):
+            return NAN
+        if loss == 0:
+            return NAN if gain == 0 else 100.0
+        return 100.0 - (100.0 / (1.0 + gain / loss))
+
+
+class IncrementalMACD(IncrementalIndicator):
+    """MACD incremental (línea, señal e histograma)"""
+
+    components = ('macd', 'signal', 'histogram')
+
+    def __init__(self, fast: int = 12, slow: int = 26, signal: int = 9, history_size: int = DEFAULT_HISTORY):
+        super().__init__(history_size)
+        self.fast = _Ema(fast)
+        self.slow = _Ema(slow)
+        self.signal = _Ema(signal)
+
+    def _push(self, candle):
+        macd = self.fast.push(candle['close']) - self.slow.push(candle['close'])
+        return self._output(macd, self.signal.push(macd))
+
+    def _amend(self, candle):
+        macd = self.fast.amend(candle['close']) - self.slow.amend(candle['close'])
+        return self._output(macd, self.signal.amend(macd))
+
+    @staticmethod
+    def _output(macd: float, signal: float) -> Dict[str, float]:
+        return {'macd': macd, 'signal': signal, 'histogram': macd - signal}
+
+
+class IncrementalBollinger(IncrementalIndicator):
+    """Bandas de Bollinger incrementales"""
+
+    components = ('upper', 'middle', 'lower')
+
+    def __init__(self, period: int = 20, std_dev: float = 2, history_size: int = DEFAULT_HISTORY):
+        super().__init__(history_size)
+        self.std_dev = std_dev
+        self.window = _RollingWindow(period)
+
+    def _push(self, candle):
+        self.window.push(candle['close'])
+        return self._output()
+
+    def _amend(self, candle):
+        self.window.amend(candle['close'])
+        return self._output()
+
+    def _output(self) -> Dict[str, float]:
+        middle = self.window.mean()
+        band = self.window.std() * self.std_dev
+        return {'upper': middle + band, 'middle': middle, 'lower': middle - band}
+
+
+class IncrementalATR(IncrementalIndicator):
+    """ATR incremental (media simple del rango verdadero, como calculate_atr)"""
+
+    def __init__(self, period: int = 14, history_size: int = DEFAULT_HISTORY):
+        super().__init__(history_size)
+        self.window = _RollingWindow(period)
+        self.prev_close = None
+        self.close = None
+
+    def _push(self, candle):
+        self.prev_close = self.close
+        self.close = candle['close']
+        self.window.push(self._true_range(candle))
+        return self.window.mean()
+
+    def _amend(self, candle):
+        self.close = candle['close']
+        self.window.amend(self._true_range(candle))
+        return self.window.mean()
+
+    def _true_range(self, candle) -> float:
+        high_low = candle['high'] - candle['low']
+        if self.prev_close is None:
+            return high_low
+        return max(high_low, abs(candle['high'] - self.prev_close), abs(candle['low'] - self.prev_close))
+
+
+class IncrementalSwing(IncrementalIndicator):
+    """
+    Swing high/low incremental (mismo resultado que find_swing_points)
+
+    Una vela solo se confirma como swing cuando llegan las `lookback` velas
+    siguientes, así que cada vela nueva o modificada re-examina únicamente
+    la ventana de las últimas 2 * lookback + 1 velas.
+    """
+
+    def __init__(self, lookback: int = 5, swing_type: str = 'high', history_size: int = DEFAULT_HISTORY):
+        super().__init__(max(history_size, lookback + 1))
+        self.lookback = lookback
+        self.is_high = swing_type == 'high'
+        self.field = 'high' if self.is_high else 'low'
+        self.window = deque(maxlen=2 * lookback + 1)
+        self.previous_swing = NAN  # Último swing que salió del historial
+
+    def update(self, candle: Dict[str, float], is_new: bool = True) -> Any:
+        if is_new or self.count == 0:
+            if len(self.history) == self.history.maxlen and not math.isnan(self.history[0]):
+                self.previous_swing = self.history[0]
+            self.count += 1
+            self.window.append(candle[self.field])
+            self.history.append(self._current(candle))
+        else:
+            self.window[-1] = candle[self.field]
+            self.history[-1] = self._current(candle)
+        self._confirm_candidate()
+        return self.value
+
+    def _current(self, candle: Dict[str, float]) -> float:
+        # Con lookback 0 cada vela es su propio swing
+        return candle[self.field] if self.lookback < 1 else NAN
+
+    def _confirm_candidate(self):
+        """Evaluar la vela que acaba de completar sus `lookback` velas posteriores"""
+        if self.lookback < 1 or len(self.window) < self.window.maxlen:
+            return
+        center = self.window[self.lookback]
+        neighbors = [v for i, v in enumerate(self.window) if i != self.lookback and not math.isnan(v)]
+        if self.is_high:
+            is_swing = not neighbors or center > max(neighbors)
+        else:
+            is_swing = not neighbors or center < min(neighbors)
+        self.history[-self.lookback - 1] = center if is_swing else NAN
+
+    def series(self, component: Optional[str] = None) -> np.ndarray:
+        """Historial de swings; antepone el último swing anterior si ya salió del historial"""
+        values = np.array(self.history, dtype=float)
+        if not math.isnan(self.previous_swing):
+            values = np.concatenate(([self.previous_swing], values))
+        return values
+
+
+def create_incremental(node: tuple, history_size: int = DEFAULT_HISTORY) -> Optional[IncrementalIndicator]:
+    """
+    Crear el indicador incremental de un nodo del grafo de indicadores
+
+    Returns:
+        Indicador incremental o None si el nodo no tiene versión incremental
+    """
+    kind = node[0]
+    if kind == 'EMA':
+        return IncrementalEMA(node[1], history_size)
+    if kind == 'SMA':
+        return IncrementalSMA(node[1], history_size)
+    if kind == 'RSI':
+        return IncrementalRSI(node[1], history_size)
+    if kind == 'MACD':
+        return IncrementalMACD(node[1], node[2], node[3], history_size)
+    if kind == 'BBands':
+        return IncrementalBollinger(node[1], node[2], history_size)
+    if kind == 'ATR':
+        return IncrementalATR(node[1], history_size)
+    if kind == 'Swing':
+        return IncrementalSwing(node[1], node[2], history_size)
+    return None
+
+
+def _candles(df: pd.DataFrame, start: int = 0) -> Iterable[Tuple[int, Dict[str, float]]]:
+    """Recorrer las velas de un DataFrame desde la posición indicada"""
+    timestamps = df['timestamp'].to_numpy()
+    columns = {name: df[name].to_numpy(dtype=float) for name in ('open', 'high', 'low', 'close')}
+    for i in range(start, len(df)):
+        yield timestamps[i], {name: float(values[i]) for name, values in columns.items()}
+
+
+class IndicatorStreamSet:
+    """
+    Indicadores incrementales de un par (símbolo, timeframe)
+
+    MarketDataService llama a apply() con cada actualización (historial
+    completo o solo las velas descargadas): las velas posteriores a la última
+    procesada se agregan y la vela en formación se modifica en lugar de
+    recalcular toda la serie. Solo se reconstruye si hay un hueco (faltan
+    velas) o el snapshot reescribe velas anteriores.
+    """
+
+    def __init__(self, history_size: int = DEFAULT_HISTORY, period: Optional[int] = None):
+        """
+        Args:
+            history_size: Valores recientes guardados por indicador
+            period: Duración de una vela en segundos (None = sin detección de
+                huecos: cualquier vela posterior se agrega)
+        """
+        self.history_size = history_size
+        self.period = None if period is None else np.timedelta64(int(period), 's')
+        self.indicators: Dict[tuple, IncrementalIndicator] = {}
+        self.last_timestamp = None
+        self.df = None
+
+    def track(self, nodes: Iterable[tuple], history: Optional[pd.DataFrame] = None) -> bool:
+        """
+        Agregar indicadores a seguir (los ya existentes se mantienen)
+
+        Args:
+            nodes: Nodos del grafo de indicadores
+            history: Historial completo para inicializar los indicadores nuevos
+                (por defecto el último DataFrame pasado a apply(), que puede
+                ser solo las velas nuevas); debe terminar en la última vela
+                procesada
+
+        Returns:
+            True si se agregó algún indicador nuevo
+        """
+        history = self.df if history is None else history
+        added = False
+        for node in nodes:
+            if node in self.indicators:
+                continue
+            indicator = create_incremental(node, self.history_size)
+            if indicator is None:
+                continue
+            self.indicators[node] = indicator
+            added = True
+            # Inicializar con el historial ya disponible
+            if history is not None:
+                for _, candle in _candles(history):
+                    indicator.update(candle)
+        return added
+
+    def apply(self, df: pd.DataFrame):
+        """
+        Procesar un snapshot nuevo del par
+
+        Args:
+            df: DataFrame OHLCV ordenado por timestamp
+        """
+        if df is None or df.empty:
+            return
+
+        if not self.indicators:
+            self.df = df
+            self.last_timestamp = df['timestamp'].to_numpy()[-1]
+            return
+
+        start = self._first_changed_row(df)
+        if start is None:
+            # Sin continuidad con el snapshot anterior: reconstruir desde cero
+            for node in list(self.indicators):
+                self.indicators[node] = create_incremental(node, self.history_size)
+            start = 0
+            self.last_timestamp = None
+
+        for timestamp, candle in _candles(df, start):
+            is_new = self.last_timestamp is None or timestamp > self.last_timestamp
+            for indicator in self.indicators.values():
+                indicator.update(candle, is_new)
+            self.last_timestamp = timestamp
+
+        self.df = df
+
+    def _first_changed_row(self, df: pd.DataFrame) -> Optional[int]:
+        """Posición de la vela en formación anterior dentro del snapshot nuevo"""
+        if self.last_timestamp is None:
+            return None
+        timestamps = df['timestamp'].to_numpy()
+        position = int(np.searchsorted(timestamps, self.last_timestamp))
+        if position < len(timestamps) and timestamps[position] == self.last_timestamp:
+            return position
+        if position == 0 and self._follows(timestamps[0]):
+            return 0  # Solo velas nuevas (ej: la vela que abre el stream)
+        return None
+
+    def _follows(self, timestamp) -> bool:
+        """La vela abre justo después de la última procesada (sin velas faltantes)"""
+        if self.period is None:
+            return True
+        return timestamp - self.last_timestamp < 2 * self.period
+
+    def results(self) -> Dict[tuple, Any]:
+        """Historial reciente de cada indicador seguido"""
+        return {node: indicator.result() for node, indicator in self.indicators.items()}
@@ -0,0 +1,161 @@
+"""
+Indicator Cache - Cache de indicadores compartido entre bots
+Evita recalcular el mismo indicador para cada bot que opera el mismo par
+"""
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+
+def snapshot_timestamp(df: pd.DataFrame) -> Optional[int]:
+    """Timestamp (ms) de la última vela de un snapshot"""
+    if df is None or df.empty:
+        return None
+    return int(pd.Timestamp(df['timestamp'].iloc[-1]).value // 1_000_000)
+
+
+class _PairEntry:
+    """Indicadores calculados sobre el snapshot vigente de un par"""
+
+    __slots__ = ('version', 'last_timestamp', 'results', 'live')
+
+    def __init__(self, version: int, last_timestamp: Optional[int]):
+        self.version = version
+        self.last_timestamp = last_timestamp
+        self.results: Dict[tuple, Any] = {}
+        self.live: Dict[tuple, Any] = {}  # Historial corto de indicadores incrementales
+
+
+class IndicatorCache:
+    """
+    Cache de indicadores para todo el proceso.
+
+    - Singleton: compartido por todos los StrategyEvaluator
+    - Thread-safe: los bots leen y escriben desde sus propios threads
+    - Clave: (símbolo, timeframe, timestamp de la última vela, nodo del indicador)
+    - Cada snapshot nuevo del MarketDataService reemplaza al anterior y
+      descarta sus indicadores (la vela en formación cambia sin cambiar de
+      timestamp, por eso también se compara la versión del snapshot)
+    """
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        """Implementación Singleton thread-safe"""
+        if cls._instance is None:
+            with cls._lock:
+                if cls._instance is None:
+                    cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """Inicializar cache (solo una vez)"""
+        if hasattr(self, '_initialized'):
+            return
+
+        self._initialized = True
+        self.pairs: Dict[Tuple[str, str], _PairEntry] = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def on_snapshot(self, symbol: str, timeframe: str, version: int, last_timestamp: Optional[int]):
+        """
+        Registrar un snapshot nuevo de un par y descartar los indicadores del anterior.
+
+        Args:
+            symbol: Par de trading
+            timeframe: Marco temporal
+            version: Versión del snapshot en MarketDataService
+            last_timestamp: Timestamp (ms) de la última vela del snapshot
+        """
+        with self.lock:
+            self.pairs[(symbol, timeframe)] = _PairEntry(version, last_timestamp)
+
+    def evict(self, symbol: str, timeframe: str):
+        """Descartar todos los indicadores de un par (p. ej. al detener su worker)"""
+        with self.lock:
+            self.pairs.pop((symbol, timeframe), None)
+
+    def get(self, symbol: str, timeframe: str, version: int, last_timestamp: Optional[int], node: tuple) -> Any:
+        """
+        Obtener un indicador calculado sobre el snapshot indicado.
+
+        Returns:
+            Resultado cacheado o None si no existe (o el snapshot ya no es el vigente)
+        """
+        with self.lock:
+            entry = self.pairs.get((symbol, timeframe))
+            if entry is not None and entry.version == version and entry.last_timestamp == last_timestamp:
+                result = entry.results.get(node)
+                if result is not None:
+                    self.hits += 1
+                    return result
+            self.misses += 1
+            return None
+
+    def put(self, symbol: str, timeframe: str, version: int, last_timestamp: Optional[int], node: tuple, result: Any):
+        """
+        Guardar un indicador calculado.
+
+        Se ignora si el snapshot usado para calcularlo ya fue reemplazado,
+        para que un bot lento no contamine el cache del snapshot nuevo.
+        """
+        if result is None:
+            return
+
+        with self.lock:
+            entry = self.pairs.get((symbol, timeframe))
+            if entry is not None and entry.version == version and entry.last_timestamp == last_timestamp:
+                entry.results[node] = result
+
+    def publish_live(self, symbol: str, timeframe: str, version: int, last_timestamp: Optional[int],
+                     results: Dict[tuple, Any]):
+        """
+        Publicar los valores recientes de los indicadores incrementales del snapshot.
+
+        Son historiales cortos (ver incremental_indicators), no series completas:
+        solo sirven para leer los últimos valores, nunca como dependencia de otro nodo.
+        """
+        with self.lock:
+            entry = self.pairs.get((symbol, timeframe))
+            if entry is not None and entry.version == version and entry.last_timestamp == last_timestamp:
+                entry.live.update(results)
+
+    def get_live(self, symbol: str, timeframe: str, version: int, last_timestamp: Optional[int], node: tuple) -> Any:
+        """Valores recientes de un indicador incremental (None si no se sigue o el snapshot cambió)"""
+        with self.lock:
+            entry = self.pairs.get((symbol, timeframe))
+            if entry is not None and entry.version == version and entry.last_timestamp == last_timestamp:
+                result = entry.live.get(node)
+                if result is not None:
+                    self.hits += 1
+                    return result
+            return None
+
+    def get_stats(self) -> Dict:
+        """Obtener estadísticas del cache"""
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'pairs': len(self.pairs),
+                'entries': sum(len(entry.results) for entry in self.pairs.values()),
+                'live_entries': sum(len(entry.live) for entry in self.pairs.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+    def clear(self):
+        """Vaciar el cache"""
+        with self.lock:
+            self.pairs.clear()
+            self.hits = 0
+            self.misses = 0
+
+
+# Instancia global singleton
+indicator_cache = IndicatorCache()
@@ -0,0 +1,347 @@
+"""
+Kline Stream - Velas en tiempo real por WebSocket (Binance combined streams)
+Una sola conexión para todos los pares; cliente RFC 6455 mínimo sin dependencias
+"""
+
+import base64
+import hashlib
+import json
+import os
+import socket
+import ssl
+import struct
+import threading
+from typing import Callable, Optional, Set, Tuple
+from urllib.parse import urlparse
+
+from bot_logging import get_logger
+
+logger = get_logger('kline_stream')
+
+WS_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+# Opcodes RFC 6455
+OP_CONTINUATION = 0x0
+OP_TEXT = 0x1
+OP_BINARY = 0x2
+OP_CLOSE = 0x8
+OP_PING = 0x9
+OP_PONG = 0xA
+
+STREAM_READ_TIMEOUT = 60       # Binance envía ping cada ~20s: sin datos en 60s la conexión está caída
+RECONNECT_DELAY_MAX = 60       # Espera máxima entre reconexiones (backoff exponencial)
+
+
+class WebSocketError(Exception):
+    """Error de protocolo o conexión WebSocket"""
+
+
+def accept_key(key: str) -> str:
+    """Valor de Sec-WebSocket-Accept para una Sec-WebSocket-Key"""
+    return base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+
+
+def write_frame(sock: socket.socket, opcode: int, payload: bytes = b'', mask: bool = True):
+    """
+    Enviar un frame completo (FIN=1)
+
+    Args:
+        mask: Los clientes deben enmascarar sus frames; los servidores no
+    """
+    header = bytearray([0x80 | opcode])
+    length = len(payload)
+    mask_bit = 0x80 if mask else 0
+    if length < 126:
+        header.append(mask_bit | length)
+    elif length < 1 << 16:
+        header.append(mask_bit | 126)
+        header += struct.pack('!H', length)
+    else:
+        header.append(mask_bit | 127)
+        header += struct.pack('!Q', length)
+    if mask:
+        key = os.urandom(4)
+        header += key
+        payload = bytes(b ^ key[i & 3] for i, b in enumerate(payload))
+    sock.sendall(bytes(header) + payload)
+
+
+def _read_exact(reader, n: int) -> bytes:
+    data = reader.read(n)
+    if len(data) < n:
+        raise WebSocketError("Conexión cerrada")
+    return data
+
+
+def read_frame(reader) -> Tuple[bool, int, bytes]:
+    """
+    Leer un frame
+
+    Args:
+        reader: Archivo binario del socket (socket.makefile('rb'))
+
+    Returns:
+        Tupla (fin, opcode, payload) con el payload ya desenmascarado
+    """
+    first, second = _read_exact(reader, 2)
+    length = second & 0x7F
+    if length == 126:
+        length = struct.unpack('!H', _read_exact(reader, 2))[0]
+    elif length == 127:
+        length = struct.unpack('!Q', _read_exact(reader, 8))[0]
+    key = _read_exact(reader, 4) if second & 0x80 else None
+    payload = _read_exact(reader, length) if length else b''
+    if key is not None:
+        payload = bytes(b ^ key[i & 3] for i, b in enumerate(payload))
+    return bool(first & 0x80), first & 0x0F, payload
+
+
+def stream_name(symbol: str, timeframe: str) -> str:
+    """Nombre del stream de velas de Binance (ej: btcusdt@kline_1m)"""
+    return f"{symbol.lower()}@kline_{timeframe}"
+
+
+class WebSocketConnection:
+    """Conexión cliente WebSocket (ws:// o wss://) bloqueante"""
+
+    def __init__(self, url: str, timeout: float = 10):
+        parsed = urlparse(url)
+        if parsed.scheme not in ('ws', 'wss'):
+            raise WebSocketError(f"URL no soportada: {url}")
+        host = parsed.hostname
+        port = parsed.port or (443 if parsed.scheme == 'wss' else 80)
+        path = parsed.path or '/'
+        if parsed.query:
+            path += '?' + parsed.query
+
+        sock = socket.create_connection((host, port), timeout=timeout)
+        if parsed.scheme == 'wss':
+            sock = ssl.create_default_context().wrap_socket(sock, server_hostname=host)
+        self.sock = sock
+        self.reader = sock.makefile('rb')
+        self.send_lock = threading.Lock()  # Pongs (thread lector) y SUBSCRIBE (otros threads)
+        self._handshake(host, port, path)
+
+    def _handshake(self, host: str, port: int, path: str):
+        key = base64.b64encode(os.urandom(16)).decode()
+        request = (
+            f"GET {path} HTTP/1.1\r\n"
+            f"Host: {host}:{port}\r\n"
+            "Upgrade: websocket\r\n"
+            "Connection: Upgrade\r\n"
+            f"Sec-WebSocket-Key: {key}\r\n"
+            "Sec-WebSocket-Version: 13\r\n\r\n"
+        )
+        self.sock.sendall(request.encode())
+
+        status = self.reader.readline().decode('latin-1')
+        headers = {}
+        while True:
+            line = self.reader.readline().decode('latin-1').strip()
+            if not line:
+                break
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        if status.split()[1:2] != ['101']:
+            raise WebSocketError(f"Handshake rechazado: {status.strip()}")
+        if headers.get('sec-websocket-accept') != accept_key(key):
+            raise WebSocketError("Sec-WebSocket-Accept inválido")
+
+    def settimeout(self, timeout: Optional[float]):
+        self.sock.settimeout(timeout)
+
+    def send_text(self, text: str):
+        with self.send_lock:
+            write_frame(self.sock, OP_TEXT, text.encode())
+
+    def recv(self) -> Optional[str]:
+        """
+        Siguiente mensaje de texto (responde pings y une fragmentos)
+
+        Returns:
+            Texto del mensaje o None si el servidor cerró la conexión
+        """
+        fragments = []
+        while True:
+            fin, opcode, payload = read_frame(self.reader)
+            if opcode == OP_PING:
+                with self.send_lock:
+                    write_frame(self.sock, OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                try:
+                    with self.send_lock:
+                        write_frame(self.sock, OP_CLOSE, payload[:2])
+                except OSError:
+                    pass
+                return None
+            fragments.append(payload)
+            if fin:
+                return b''.join(fragments).decode()
+
+    def close(self):
+        """Cerrar el socket (desbloquea un recv() en curso)"""
+        try:
+            self.sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        self.sock.close()
+
+
+class KlineStream:
+    """
+    Velas de muchos pares por una sola conexión WebSocket
+
+    - Pares agregados/quitados en caliente con SUBSCRIBE/UNSUBSCRIBE
+    - Reconexión automática con backoff exponencial
+    - on_kline(symbol, timeframe, open_ms, (open, high, low, close, volume), closed)
+      se llama desde el thread del stream por cada mensaje de vela
+    - on_connect / on_disconnect permiten al MarketDataService volver a REST
+      mientras no hay conexión y rellenar el hueco al reconectar
+    """
+
+    def __init__(self, url: str, on_kline: Callable,
+                 on_connect: Optional[Callable[[], None]] = None,
+                 on_disconnect: Optional[Callable[[], None]] = None,
+                 reconnect_delay: float = 1.0):
+        self.url = url
+        self.on_kline = on_kline
+        self.on_connect = on_connect
+        self.on_disconnect = on_disconnect
+        self.reconnect_delay = reconnect_delay
+        self.streams: Set[str] = set()
+        self.connection: Optional[WebSocketConnection] = None
+        self.thread: Optional[threading.Thread] = None
+        self.stop_flag = threading.Event()
+        self.changed = threading.Event()  # Hay pares nuevos (despierta al thread si estaba sin pares)
+        self.lock = threading.Lock()
+        self.stats = {'messages': 0, 'connects': 0, 'disconnects': 0}
+        self._request_id = 0
+
+    @property
+    def connected(self) -> bool:
+        return self.connection is not None
+
+    def add(self, symbol: str, timeframe: str):
+        """Recibir las velas de un par (inicia el thread del stream si hace falta)"""
+        name = stream_name(symbol, timeframe)
+        with self.lock:
+            if name in self.streams:
+                return
+            self.streams.add(name)
+            connection = self.connection
+            if self.thread is None or not self.thread.is_alive():
+                self.stop_flag.clear()
+                self.thread = threading.Thread(target=self._run, daemon=True, name="KlineStream")
+                self.thread.start()
+        if connection is not None:
+            self._send_method(connection, 'SUBSCRIBE', [name])
+        self.changed.set()
+
+    def remove(self, symbol: str, timeframe: str):
+        """Dejar de recibir las velas de un par"""
+        name = stream_name(symbol, timeframe)
+        with self.lock:
+            if name not in self.streams:
+                return
+            self.streams.discard(name)
+            connection = self.connection
+        if connection is not None:
+            self._send_method(connection, 'UNSUBSCRIBE', [name])
+
+    def stop(self):
+        """Cerrar la conexión y detener el thread"""
+        self.stop_flag.set()
+        self.changed.set()
+        connection = self.connection
+        if connection is not None:
+            connection.close()
+        if self.thread is not None:
+            self.thread.join(timeout=5)
+
+    def _send_method(self, connection: WebSocketConnection, method: str, params: list):
+        with self.lock:
+            self._request_id += 1
+            request_id = self._request_id
+        try:
+            connection.send_text(json.dumps({'method': method, 'params': params, 'id': request_id}))
+        except OSError as e:
+            # La conexión se cayó: al reconectar se suscriben todos los pares vigentes
+            logger.warning("⚠️ No se pudo enviar %s: %s", method, e)
+
+    def _run(self):
+        delay = self.reconnect_delay
+        while not self.stop_flag.is_set():
+            with self.lock:
+                streams = sorted(self.streams)
+            if not streams:
+                self.changed.wait(timeout=5)
+                self.changed.clear()
+                continue
+
+            try:
+                connection = WebSocketConnection(f"{self.url}?streams={'/'.join(streams)}")
+            except (OSError, WebSocketError) as e:
+                logger.warning("⚠️ Stream de velas no disponible (%s); reintento en %.0fs", e, delay)
+                self.stop_flag.wait(timeout=delay)
+                delay = min(delay * 2, RECONNECT_DELAY_MAX)
+                continue
+
+            connection.settimeout(STREAM_READ_TIMEOUT)
+            with self.lock:
+                self.connection = connection
+                missing = sorted(self.streams - set(streams))
+            if missing:
+                # Pares agregados mientras se conectaba
+                self._send_method(connection, 'SUBSCRIBE', missing)
+            self.stats['connects'] += 1
+            delay = self.reconnect_delay
+            logger.info("🔌 Stream de velas conectado (%d pares)", len(streams))
+            self._callback(self.on_connect)
+
+            try:
+                self._read_loop(connection)
+            except (OSError, WebSocketError) as e:
+                if not self.stop_flag.is_set():
+                    logger.warning("⚠️ Stream de velas desconectado: %s", e)
+            finally:
+                with self.lock:
+                    self.connection = None
+                connection.close()
+
+            if not self.stop_flag.is_set():
+                self.stats['disconnects'] += 1
+                self._callback(self.on_disconnect)
+                self.stop_flag.wait(timeout=delay)
+
+    def _read_loop(self, connection: WebSocketConnection):
+        while not self.stop_flag.is_set():
+            text = connection.recv()
+            if text is None:
+                raise WebSocketError("Cerrado por el servidor")
+            self.stats['messages'] += 1
+            self._handle_message(text)
+
+    def _handle_message(self, text: str):
+        """Procesar un mensaje del combined stream ({"stream": ..., "data": {"e": "kline", ...}})"""
+        try:
+            message = json.loads(text)
+            data = message.get('data', message)
+            if data.get('e') != 'kline':
+                return  # Respuestas a SUBSCRIBE/UNSUBSCRIBE u otros eventos
+            k = data['k']
+            values = (float(k['o']), float(k['h']), float(k['l']), float(k['c']), float(k['v']))
+            self.on_kline(k['s'], k['i'], int(k['t']), values, bool(k['x']))
+        except Exception as e:
+            logger.exception("❌ Error procesando mensaje del stream: %s", e)
+
+    def _callback(self, callback: Optional[Callable[[], None]]):
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            logger.exception("❌ Error en callback del stream: %s", e)
@@ -3,12 +3,50 @@ Market Data Provider
 Obtiene datos del mercado de Binance y calcula indicadores técnicos
 """
 
-import requests
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 from typing import Dict, List, Optional
 
+from binance_rate_limiter import binance_rate_limiter, endpoint_weight, PRIORITY_LIVE
+from http_client import http_client
+
+def find_swing_points(values: np.ndarray, lookback: int, swing_type: str) -> np.ndarray:
+    """
+    Swings de una serie (vectorizado con ventanas deslizantes)
+    
+    Una vela es swing high si su máximo es estrictamente mayor que el de las
+    `lookback` velas a cada lado (swing low: estrictamente menor). Los
+    vecinos NaN no invalidan el swing, igual que la comparación escalar.
+    
+    Returns:
+        Array con el valor en las velas swing y NaN en el resto
+    """
+    values = np.asarray(values, dtype=float)
+    swings = np.full(len(values), np.nan)
+    if lookback < 1:
+        return values.copy()
+    
+    window = 2 * lookback + 1
+    if len(values) < window:
+        return swings
+    
+    is_high = swing_type == 'high'
+    filled = np.where(np.isnan(values), -np.inf if is_high else np.inf, values)
+    windows = np.lib.stride_tricks.sliding_window_view(filled, window)
+    center = values[lookback:len(values) - lookback]
+    
+    if is_high:
+        neighbors = np.maximum(windows[:, :lookback].max(axis=1), windows[:, lookback + 1:].max(axis=1))
+        mask = center > neighbors
+    else:
+        neighbors = np.minimum(windows[:, :lookback].min(axis=1), windows[:, lookback + 1:].min(axis=1))
+        mask = center < neighbors
+    
+    swings[lookback:len(values) - lookback] = np.where(mask, center, np.nan)
+    return swings
+
+
 class MarketDataProvider:
     """Proveedor de datos de mercado desde Binance"""
     
@@ -46,7 +84,9 @@ class MarketDataProvider:
                 'limit': limit
             }
             
-            response = requests.get(url, params=params, timeout=10)
+            binance_rate_limiter.acquire(endpoint_weight('klines'), PRIORITY_LIVE)
+            response = http_client.get(url, params=params)
+            binance_rate_limiter.update_from_headers(response.headers, response.status_code)
             response.raise_for_status()
             data = response.json()
             
@@ -86,6 +126,10 @@ class MarketDataProvider:
         """Calcular SMA (Simple Moving Average)"""
         return df['close'].rolling(window=period).mean()
     
+    def calculate_std(self, df: pd.DataFrame, period: int) -> pd.Series:
+        """Calcular desviación estándar móvil del cierre"""
+        return df['close'].rolling(window=period).std()
+    
     def calculate_rsi(self, df: pd.DataFrame, period: int = 14) -> pd.Series:
         """Calcular RSI (Relative Strength Index)"""
         delta = df['close'].diff()
@@ -113,8 +157,8 @@ class MarketDataProvider:
     
     def calculate_bollinger_bands(self, df: pd.DataFrame, period: int = 20, std_dev: float = 2) -> Dict[str, pd.Series]:
         """Calcular Bollinger Bands"""
-        sma = df['close'].rolling(window=period).mean()
-        std = df['close'].rolling(window=period).std()
+        sma = self.calculate_sma(df, period)
+        std = self.calculate_std(df, period)
         
         return {
             'upper': sma + (std * std_dev),
@@ -136,35 +180,11 @@ class MarketDataProvider:
     
     def find_swing_high(self, df: pd.DataFrame, lookback: int = 5) -> pd.Series:
         """Encontrar máximos locales (Swing Highs)"""
-        swing_highs = pd.Series(index=df.index, dtype=float)
-        
-        for i in range(lookback, len(df) - lookback):
-            is_swing_high = True
-            for j in range(1, lookback + 1):
-                if df['high'].iloc[i] <= df['high'].iloc[i - j] or df['high'].iloc[i] <= df['high'].iloc[i + j]:
-                    is_swing_high = False
-                    break
-            
-            if is_swing_high:
-                swing_highs.iloc[i] = df['high'].iloc[i]
-        
-        return swing_highs
+        return pd.Series(find_swing_points(df['high'].to_numpy(dtype=float), lookback, 'high'), index=df.index)
     
     def find_swing_low(self, df: pd.DataFrame, lookback: int = 5) -> pd.Series:
         """Encontrar mínimos locales (Swing Lows)"""
-        swing_lows = pd.Series(index=df.index, dtype=float)
-        
-        for i in range(lookback, len(df) - lookback):
-            is_swing_low = True
-            for j in range(1, lookback + 1):
-                if df['low'].iloc[i] >= df['low'].iloc[i - j] or df['low'].iloc[i] >= df['low'].iloc[i + j]:
-                    is_swing_low = False
-                    break
-            
-            if is_swing_low:
-                swing_lows.iloc[i] = df['low'].iloc[i]
-        
-        return swing_lows
+        return pd.Series(find_swing_points(df['low'].to_numpy(dtype=float), lookback, 'low'), index=df.index)
     
     def get_current_price(self, symbol: str) -> float:
         """Obtener precio actual de un símbolo"""
@@ -172,7 +192,9 @@ class MarketDataProvider:
             url = f"{self.base_url}/ticker/price"
             params = {'symbol': symbol}
             
-            response = requests.get(url, params=params, timeout=5)
+            binance_rate_limiter.acquire(endpoint_weight('ticker/price'), PRIORITY_LIVE)
+            response = http_client.get(url, params=params, timeout=5)
+            binance_rate_limiter.update_from_headers(response.headers, response.status_code)
             response.raise_for_status()
             data = response.json()
             
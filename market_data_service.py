@@ -3,13 +3,100 @@ Market Data Service - Sistema centralizado de datos de mercado
 Reduce llamadas a Binance API compartiendo datos entre múltiples bots
 """
 
+import os
+import queue
 import threading
 import time
 from datetime import datetime, timedelta
-from typing import Dict, Optional, List, Tuple
-import requests
+from typing import Callable, Dict, Iterable, NamedTuple, Optional, List, Tuple, Union
+import numpy as np
 import pandas as pd
 
+from indicator_cache import indicator_cache, snapshot_timestamp
+from incremental_indicators import IndicatorStreamSet
+from candle_buffer import CandleBuffer
+from candle_resampler import CandleResampler
+from ohlcv_store import OHLCVStore, ohlcv_store
+from kline_stream import KlineStream
+from fetch_scheduler import FetchScheduler, ScheduledJob
+from binance_rate_limiter import binance_rate_limiter, endpoint_weight, PRIORITY_LIVE
+from http_client import http_client
+from bot_logging import get_logger
+
+logger = get_logger('market_data_service')
+
+# Programación alineada al cierre de vela: descargar justo después de cada cierre
+CANDLE_ALIGNED_SCHEDULING = os.getenv('CANDLE_ALIGNED_SCHEDULING', 'false').lower() in ('1', 'true', 'yes')
+CANDLE_CLOSE_DELAY = float(os.getenv('CANDLE_CLOSE_DELAY', '2'))  # Segundos tras el cierre
+CANDLE_CLOSE_RETRIES = 3  # Reintentos si Binance aún no publica la vela cerrada
+
+# Historial por par y descarga incremental
+MARKET_DATA_HISTORY = int(os.getenv('MARKET_DATA_HISTORY', '500'))  # Velas guardadas por par
+BINANCE_KLINES_LIMIT = 1000  # Máximo de velas por request de /klines
+INCREMENTAL_FETCH_LIMIT = 100  # Si faltan más velas se recarga el historial completo
+
+# Descargas REST: un solo programador con concurrencia acotada (sin thread por par)
+MARKET_DATA_FETCH_CONCURRENCY = int(os.getenv('MARKET_DATA_FETCH_CONCURRENCY', '4'))
+MARKET_DATA_FETCH_SPACING = float(os.getenv('MARKET_DATA_FETCH_SPACING', '0.05'))  # Segundos entre descargas
+
+# Velas por WebSocket: una conexión para todos los pares, REST solo como respaldo
+MARKET_DATA_STREAMING = os.getenv('MARKET_DATA_STREAMING', 'false').lower() in ('1', 'true', 'yes')
+BINANCE_STREAM_URL = os.getenv('BINANCE_STREAM_URL', 'wss://stream.binance.com:9443/stream')
+STREAM_UPDATE_THROTTLE = float(os.getenv('STREAM_UPDATE_THROTTLE', '1'))  # Segundos entre cambios de la vela en formación
+
+# Timeframes mayores agregados localmente desde el timeframe más chico suscrito del símbolo
+MARKET_DATA_RESAMPLE = os.getenv('MARKET_DATA_RESAMPLE', 'false').lower() in ('1', 'true', 'yes')
+
+# Velas guardadas en disco (data/ohlcv): al reiniciar solo se descarga el hueco desde el apagado
+MARKET_DATA_PERSIST = os.getenv('MARKET_DATA_PERSIST', 'false').lower() in ('1', 'true', 'yes')
+# Velas en disco por par en vivo: el archivo se recorta a este tamaño cuando lo duplica
+MARKET_DATA_PERSIST_MAX = int(os.getenv('MARKET_DATA_PERSIST_MAX', '50000'))
+
+TIMEFRAME_SECONDS = {
+    '1m': 60, '3m': 180, '5m': 300, '15m': 900, '30m': 1800,
+    '1h': 3600, '2h': 7200, '4h': 14400, '6h': 21600, '8h': 28800, '12h': 43200,
+    '1d': 86400, '3d': 259200, '1w': 604800,
+}
+
+# 1970-01-01 fue jueves: las velas semanales de Binance abren los lunes
+_WEEK_OFFSET = 4 * 86400
+
+
+def timeframe_to_seconds(timeframe: str) -> Optional[int]:
+    """Duración de una vela en segundos (None si el timeframe no tiene duración fija, ej: 1M)"""
+    return TIMEFRAME_SECONDS.get(timeframe)
+
+
+def candle_open_time(timeframe: str, now: Optional[float] = None) -> Optional[float]:
+    """
+    Apertura (epoch en segundos, UTC) de la vela en formación
+    
+    Args:
+        timeframe: Marco temporal
+        now: Momento de referencia (por defecto time.time())
+    """
+    period = timeframe_to_seconds(timeframe)
+    if period is None:
+        return None
+    now = time.time() if now is None else now
+    offset = _WEEK_OFFSET if timeframe == '1w' else 0
+    return ((now - offset) // period) * period + offset
+
+
+def next_candle_close(timeframe: str, now: Optional[float] = None) -> Optional[float]:
+    """Cierre (epoch en segundos, UTC) de la vela en formación"""
+    open_time = candle_open_time(timeframe, now)
+    return None if open_time is None else open_time + timeframe_to_seconds(timeframe)
+
+
+class SnapshotEvent(NamedTuple):
+    """Aviso de que el snapshot de un par cambió"""
+    symbol: str
+    timeframe: str
+    version: int
+    data: pd.DataFrame      # Snapshot de solo lectura de la versión
+    new_candle: bool        # True si llegó una vela nueva; False si solo cambió la vela en formación
+
 
 class MarketDataService:
     """
@@ -17,7 +104,13 @@ class MarketDataService:
     
     - Singleton: Una sola instancia para toda la aplicación
     - Thread-safe: Múltiples bots pueden acceder simultáneamente
-    - Workers inteligentes: Un worker por cada par (símbolo, timeframe)
+    - Workers inteligentes: Una descarga periódica por cada par (símbolo, timeframe),
+      todas en un solo FetchScheduler con pocas conexiones HTTP reutilizadas
+    - Resampling (MARKET_DATA_RESAMPLE): los timeframes mayores de un símbolo
+      se agregan desde el más chico suscrito; solo se descargan una vez
+    - Persistencia (MARKET_DATA_PERSIST): las velas cerradas se guardan en
+      el OHLCVStore (como mucho MARKET_DATA_PERSIST_MAX por par) y al
+      reiniciar se cargan de disco + el hueco por REST
     - Auto-gestión: Inicia/detiene workers según demanda
     """
     
@@ -38,15 +131,33 @@ class MarketDataService:
             return
         
         self._initialized = True
-        self.cache: Dict[Tuple[str, str], Tuple[pd.DataFrame, datetime]] = {}
-        self.workers: Dict[Tuple[str, str], threading.Thread] = {}
+        self.cache: Dict[Tuple[str, str], Tuple[CandleBuffer, datetime]] = {}  # Velas por par + última actualización
+        self.workers: Dict[Tuple[str, str], ScheduledJob] = {}  # Descarga periódica por par
         self.subscribers: Dict[Tuple[str, str], List[str]] = {}
+        self.subscriber_callbacks: Dict[Tuple[str, str], Dict[str, Callable]] = {}  # Push por bot
+        self.notified_opens: Dict[Tuple[str, str], Optional[int]] = {}  # Última vela avisada por par
         self.worker_stop_flags: Dict[Tuple[str, str], threading.Event] = {}
+        self.versions: Dict[Tuple[str, str], int] = {}  # Versión del snapshot por par
+        self.streams: Dict[Tuple[str, str], IndicatorStreamSet] = {}  # Indicadores incrementales por par
+        self.refresh_listeners: List[Callable] = []  # Callbacks tras cada actualización de un par
+        self.candle_aligned = CANDLE_ALIGNED_SCHEDULING
+        self.resample = MARKET_DATA_RESAMPLE
+        self.resamplers: Dict[Tuple[str, str], Tuple[Tuple[str, str], CandleResampler]] = {}  # Par → (base, agregador)
+        self.resample_lock = threading.Lock()  # Serializa la agregación (se toma antes que self.lock)
+        self.fetch_stats = {'full': 0, 'incremental': 0, 'rows': 0, 'resampled': 0, 'restored': 0}  # Descargas a Binance
+        self.store: Optional[OHLCVStore] = ohlcv_store if MARKET_DATA_PERSIST else None  # Velas en disco
         self.lock = threading.Lock()
+        self.update_condition = threading.Condition(self.lock)  # Avisa de versiones nuevas
+        self.scheduler = FetchScheduler(MARKET_DATA_FETCH_CONCURRENCY, MARKET_DATA_FETCH_SPACING)
+        self.stream: Optional[KlineStream] = None  # Velas por WebSocket (MARKET_DATA_STREAMING)
+        self.stream_updates: Dict[Tuple[str, str], float] = {}  # Último cambio de vela en formación guardado
+        if MARKET_DATA_STREAMING:
+            self.enable_streaming()
         
-        print("🚀 Market Data Service inicializado")
+        logger.info("🚀 Market Data Service inicializado")
     
-    def subscribe(self, bot_id: str, symbol: str, timeframe: str):
+    def subscribe(self, bot_id: str, symbol: str, timeframe: str,
+                  callback: Optional[Union[Callable[[SnapshotEvent], None], queue.Queue]] = None):
         """
         Suscribir un bot a datos de mercado.
         Si es el primer suscriptor, inicia un worker.
@@ -55,17 +166,38 @@ class MarketDataService:
             bot_id: ID único del bot
             symbol: Par de trading (ej: BTCUSDT)
             timeframe: Marco temporal (ej: 15m, 1h)
+            callback: Función o Queue que recibe un SnapshotEvent cada vez que
+                cambian los datos del par (vela nueva o vela en formación
+                modificada). Se llama desde el thread del worker: debe ser rápida.
+        """
+        self.subscribe_many(symbol, timeframe, {bot_id: callback})
+    
+    def subscribe_many(self, symbol: str, timeframe: str,
+                       callbacks: Dict[str, Optional[Union[Callable[[SnapshotEvent], None], queue.Queue]]]):
+        """
+        Suscribir varios bots a un mismo par (un solo paso por el lock y un
+        solo worker, para el arranque de muchos bots)
+        
+        Args:
+            symbol: Par de trading
+            timeframe: Marco temporal
+            callbacks: bot_id → callback (como en subscribe(); None = sin aviso)
         """
         key = (symbol, timeframe)
         
         with self.lock:
             # Agregar a lista de suscriptores
-            if key not in self.subscribers:
-                self.subscribers[key] = []
-            
-            if bot_id not in self.subscribers[key]:
-                self.subscribers[key].append(bot_id)
-                print(f"📊 Bot {bot_id} suscrito a {symbol}/{timeframe}")
+            subscribers = self.subscribers.setdefault(key, [])
+            known = set(subscribers)
+            for bot_id, callback in callbacks.items():
+                if bot_id not in known:
+                    subscribers.append(bot_id)
+                    known.add(bot_id)
+                    logger.debug("📊 Bot %s suscrito a %s/%s", bot_id, symbol, timeframe)
+                
+                if callback is not None:
+                    deliver = callback.put if isinstance(callback, queue.Queue) else callback
+                    self.subscriber_callbacks.setdefault(key, {})[bot_id] = deliver
             
             # Iniciar worker si no existe
             if key not in self.workers or not self.workers[key].is_alive():
@@ -86,12 +218,126 @@ class MarketDataService:
         with self.lock:
             if key in self.subscribers and bot_id in self.subscribers[key]:
                 self.subscribers[key].remove(bot_id)
-                print(f"📉 Bot {bot_id} desuscrito de {symbol}/{timeframe}")
+                logger.debug("📉 Bot %s desuscrito de %s/%s", bot_id, symbol, timeframe)
+            self.subscriber_callbacks.get(key, {}).pop(bot_id, None)
             
             # Detener worker si no hay suscriptores
             if key in self.subscribers and len(self.subscribers[key]) == 0:
                 self._stop_worker(symbol, timeframe)
     
+    def track_indicators(self, symbol: str, timeframe: str, nodes: Iterable[tuple]):
+        """
+        Mantener indicadores incrementales para un par.
+        
+        Los indicadores se actualizan en O(1) con cada vela nueva o modificada
+        y sus valores recientes se publican en el IndicatorCache junto con
+        cada snapshot. Los nodos sin versión incremental se ignoran.
+        
+        Args:
+            symbol: Par de trading
+            timeframe: Marco temporal
+            nodes: Nodos del grafo de indicadores (CompiledStrategy.roots)
+        """
+        key = (symbol, timeframe)
+        
+        with self.lock:
+            data = self.cache[key][0].snapshot() if key in self.cache else None
+            streams = self.streams.get(key)
+            if streams is None:
+                streams = self.streams[key] = IndicatorStreamSet(period=timeframe_to_seconds(timeframe))
+                if data is not None:
+                    streams.apply(data)
+            
+            if streams.track(nodes, data) and data is not None:
+                # Publicar de inmediato para el snapshot vigente
+                indicator_cache.publish_live(symbol, timeframe, self.versions.get(key, 0),
+                                             snapshot_timestamp(data), streams.results())
+    
+    def enable_streaming(self, url: str = BINANCE_STREAM_URL) -> KlineStream:
+        """
+        Recibir las velas por WebSocket en lugar de consultar REST periódicamente.
+        
+        Todos los pares comparten una conexión. Mientras está conectada los
+        workers no descargan nada; si se cae vuelven a REST y al reconectar se
+        rellena el hueco con una descarga incremental de cada par.
+        
+        Args:
+            url: Endpoint de combined streams (por defecto el de Binance)
+        
+        Returns:
+            KlineStream activo
+        """
+        with self.lock:
+            if self.stream is None:
+                self.stream = KlineStream(url, self._on_stream_kline, on_connect=self._on_stream_connect,
+                                          on_disconnect=self._on_stream_disconnect)
+            stream = self.stream
+            pairs = list(self.workers)
+        
+        for symbol, timeframe in pairs:
+            stream.add(symbol, timeframe)
+        return stream
+    
+    def disable_streaming(self):
+        """Cerrar el WebSocket y volver a la descarga periódica por REST"""
+        with self.lock:
+            stream, self.stream = self.stream, None
+        if stream is not None:
+            stream.stop()
+    
+    def add_refresh_listener(self, callback: Callable[[str, str, pd.DataFrame, int], None]):
+        """
+        Registrar un callback que se ejecuta cada vez que un worker actualiza un par.
+        
+        Se llama como callback(symbol, timeframe, data, version) desde el thread
+        del worker, fuera del lock. `data` es el snapshot de solo lectura de la
+        versión (el mismo que devuelve get_snapshot).
+        
+        Args:
+            callback: Función a ejecutar tras cada actualización
+        """
+        with self.lock:
+            if callback not in self.refresh_listeners:
+                self.refresh_listeners.append(callback)
+    
+    def remove_refresh_listener(self, callback: Callable):
+        """Quitar un callback registrado con add_refresh_listener"""
+        with self.lock:
+            if callback in self.refresh_listeners:
+                self.refresh_listeners.remove(callback)
+    
+    def is_candle_aligned(self, timeframe: str) -> bool:
+        """Modo alineado al cierre de vela activo para el timeframe (requiere duración fija)"""
+        return self.candle_aligned and timeframe_to_seconds(timeframe) is not None
+    
+    def has_data(self, symbol: str, timeframe: str) -> bool:
+        """El par tiene velas en cache (la versión no vuelve a 0 al dejar de seguirlo)"""
+        with self.lock:
+            return (symbol, timeframe) in self.cache
+    
+    def get_version(self, symbol: str, timeframe: str) -> int:
+        """Versión del último snapshot guardado de un par (0 si no hay)"""
+        with self.lock:
+            return self.versions.get((symbol, timeframe), 0)
+    
+    def wait_for_update(self, symbol: str, timeframe: str, version: int, timeout: float) -> int:
+        """
+        Esperar a que el par tenga un snapshot más nuevo que `version`.
+        
+        Args:
+            symbol: Par de trading
+            timeframe: Marco temporal
+            version: Última versión procesada
+            timeout: Segundos máximos de espera
+        
+        Returns:
+            Versión vigente (igual a `version` si se agotó el tiempo)
+        """
+        key = (symbol, timeframe)
+        with self.update_condition:
+            self.update_condition.wait_for(lambda: self.versions.get(key, 0) > version, timeout=timeout)
+            return self.versions.get(key, 0)
+    
     def get_data(self, symbol: str, timeframe: str) -> Optional[pd.DataFrame]:
         """
         Obtener datos del cache (thread-safe).
@@ -101,28 +347,49 @@ class MarketDataService:
             timeframe: Marco temporal
             
         Returns:
-            DataFrame con datos OHLCV o None si no hay datos
+            DataFrame OHLCV de solo lectura o None si no hay datos
+        """
+        snapshot = self.get_snapshot(symbol, timeframe)
+        return snapshot[0] if snapshot else None
+    
+    def get_snapshot(self, symbol: str, timeframe: str) -> Optional[Tuple[pd.DataFrame, int]]:
+        """
+        Obtener datos del cache junto con la versión del snapshot (thread-safe).
+        
+        Todos los lectores de una versión reciben el mismo DataFrame sin copiar:
+        es de solo lectura (FrozenFrame) y modificarlo lanza un error; usar
+        .copy() si se necesita un DataFrame modificable. La versión crece cada
+        vez que el worker guarda datos nuevos y permite compartir indicadores
+        calculados entre bots (ver IndicatorCache).
+        
+        Args:
+            symbol: Par de trading
+            timeframe: Marco temporal
+            
+        Returns:
+            Tupla (FrozenFrame, versión) o None si no hay datos
         """
         key = (symbol, timeframe)
         
         with self.lock:
             if key in self.cache:
-                data, timestamp = self.cache[key]
+                buffer, timestamp = self.cache[key]
                 age = (datetime.now() - timestamp).total_seconds()
                 
                 # Verificar que los datos no sean muy viejos
                 max_age = self._get_max_cache_age(timeframe)
                 if age <= max_age:
-                    return data.copy()  # Retornar copia para evitar modificaciones
+                    # Snapshot compartido de solo lectura (se genera una vez por versión)
+                    return buffer.snapshot(), self.versions.get(key, 0)
                 else:
-                    print(f"⚠️ Datos de {symbol}/{timeframe} obsoletos ({age:.0f}s)")
+                    logger.warning("⚠️ Datos de %s/%s obsoletos (%.0fs)", symbol, timeframe, age)
         
         return None
     
     def get_stats(self) -> Dict:
         """Obtener estadísticas del servicio"""
         with self.lock:
-            active_workers = sum(1 for t in self.workers.values() if t.is_alive())
+            active_workers = sum(1 for job in self.workers.values() if job.is_alive())
             total_subscribers = sum(len(subs) for subs in self.subscribers.values())
             
             stats = {
@@ -130,21 +397,34 @@ class MarketDataService:
                 'active_workers': active_workers,
                 'total_subscribers': total_subscribers,
                 'cached_datasets': len(self.cache),
+                'indicator_cache': indicator_cache.get_stats(),
+                'fetches': dict(self.fetch_stats),
+                'scheduler': self.scheduler.get_stats(),
+                'rate_limit': binance_rate_limiter.get_stats(),
+                'http': http_client.get_stats(),
                 'pairs': {}
             }
             
+            if self.stream is not None:
+                stats['stream'] = dict(self.stream.stats, connected=self.stream.connected,
+                                       streams=len(self.stream.streams))
+            
             for key, subs in self.subscribers.items():
                 symbol, timeframe = key
+                base = self._resample_base(key)
                 stats['pairs'][f"{symbol}/{timeframe}"] = {
                     'subscribers': len(subs),
-                    'cached': key in self.cache
+                    'cached': key in self.cache,
+                    'version': self.versions.get(key, 0),
+                    'resampled_from': base[1] if base else None,
+                    'incremental_indicators': len(self.streams[key].indicators) if key in self.streams else 0
                 }
             
             return stats
     
     def _start_worker(self, symbol: str, timeframe: str):
         """
-        Iniciar worker para actualizar datos periódicamente.
+        Programar la descarga periódica de un par (la primera, de inmediato).
         
         Args:
             symbol: Par de trading
@@ -156,52 +436,391 @@ class MarketDataService:
         stop_flag = threading.Event()
         self.worker_stop_flags[key] = stop_flag
         
-        def worker_loop():
-            """Loop del worker que actualiza datos"""
-            print(f"🟢 Worker iniciado para {symbol}/{timeframe}")
-            
-            # Hacer primera descarga inmediatamente
+        if self.stream is not None:
+            self.stream.add(symbol, timeframe)
+        
+        logger.info("🟢 Worker iniciado para %s/%s%s", symbol, timeframe,
+                    " (alineado al cierre de vela)" if self.is_candle_aligned(timeframe) else "")
+        self.workers[key] = self.scheduler.schedule(key, lambda: self._run_worker(key, stop_flag))
+    
+    def _run_worker(self, key: Tuple[str, str], stop_flag: threading.Event) -> Optional[float]:
+        """
+        Una ejecución del worker de un par (en el pool del FetchScheduler).
+        
+        Returns:
+            Segundos hasta la próxima descarga o None si el par ya no tiene suscriptores
+        """
+        symbol, timeframe = key
+        with self.lock:
+            if stop_flag.is_set() or not self.subscribers.get(key):
+                return None
+            subscriber_count = len(self.subscribers[key])
+            initial = key not in self.cache
+            resampled = self._resample_base(key) is not None
+        
+        if not initial and (resampled or (self.stream is not None and self.stream.connected)):
+            return self._seconds_until_refresh(timeframe)  # Los datos llegan por WebSocket o del timeframe base
+        
+        try:
+            # Descargar, guardar y evaluar los bots del par
+            data = self._refresh(key, stop_flag)
+            if initial:
+                logger.info("✅ Datos iniciales cargados: %s/%s", symbol, timeframe)
+            else:
+                logger.debug("🔄 %s/%s actualizado → $%s (%d bots)", symbol, timeframe,
+                             data['close'].iloc[-1], subscriber_count)
+        except Exception as e:
+            logger.error("❌ Error en worker %s/%s: %s", symbol, timeframe, e)
+        
+        return self._seconds_until_refresh(timeframe)
+    
+    def _refresh(self, key: Tuple[str, str], stop_flag: Optional[threading.Event] = None) -> pd.DataFrame:
+        """
+        Descargar un par, guardarlo en el cache y avisar a los listeners.
+        
+        En modo alineado solo se guardan velas cerradas y, si Binance aún no
+        publicó la vela que acaba de cerrar, se reintenta unos segundos después.
+        
+        Args:
+            key: (símbolo, timeframe)
+            stop_flag: Flag de parada del worker (interrumpe los reintentos)
+        
+        Returns:
+            DataFrame guardado
+        """
+        symbol, timeframe = key
+        update, replace = self._fetch_update(key)
+        
+        if self.is_candle_aligned(timeframe):
+            expected_open = (candle_open_time(timeframe) - timeframe_to_seconds(timeframe)) * 1000
+            for _ in range(CANDLE_CLOSE_RETRIES):
+                update = self._closed_candles(update, timeframe)
+                latest = self._latest_open(key, update, replace)
+                if latest is not None and latest >= expected_open:
+                    break
+                if stop_flag is not None and stop_flag.wait(timeout=CANDLE_CLOSE_DELAY):
+                    break
+                update, replace = self._fetch_update(key)
+            else:
+                update = self._closed_candles(update, timeframe)
+        
+        return self._publish(key, update, replace)
+    
+    def _publish(self, key: Tuple[str, str], update: pd.DataFrame, replace: bool) -> pd.DataFrame:
+        """Guardar velas y avisar a listeners y suscriptores si cambió algo"""
+        previous = self.get_version(*key)
+        version = self._store(key, update, replace=replace)
+        with self.lock:
+            data = self.cache[key][0].snapshot()
+        if version != previous:
+            self._persist(key, update)
+            self._notify_refresh(key, data, version)
+            self._resample_from(key, update, replace)
+        return data
+    
+    def _persist(self, key: Tuple[str, str], update: pd.DataFrame):
+        """
+        Guardar en disco las velas cerradas nuevas o modificadas de un par
+        
+        La vela en formación no se guarda (cambia con cada actualización del
+        stream); al reiniciar, _restore la descarga junto con el hueco.
+        """
+        if self.store is None or update.empty:
+            return
+        period = timeframe_to_seconds(key[1])
+        if period is not None:
+            update = self._closed_candles(update, key[1])
+            if update.empty:
+                return
+        try:
+            self.store.write(key[0], key[1], *CandleBuffer.frame_arrays(update),
+                             period_ms=None if period is None else period * 1000,
+                             max_records=MARKET_DATA_PERSIST_MAX)
+        except OSError as e:
+            logger.error("❌ Error guardando velas de %s/%s en disco: %s", key[0], key[1], e)
+    
+    def _restore(self, key: Tuple[str, str]) -> Optional[pd.DataFrame]:
+        """
+        Historial de un par desde disco + las velas que faltan desde la última guardada
+        
+        Returns:
+            Historial completo o None si no hay velas en disco o el hueco es
+            mayor que INCREMENTAL_FETCH_LIMIT (conviene descargar todo)
+        """
+        if self.store is None:
+            return None
+        symbol, timeframe = key
+        stored = self.store.read_frame(symbol, timeframe, limit=MARKET_DATA_HISTORY)
+        if stored.empty:
+            return None
+        
+        last_open = int(stored['timestamp'].iloc[-1].value // 1_000_000)
+        period = timeframe_to_seconds(timeframe)
+        if period is None or (time.time() * 1000 - last_open) / (period * 1000) >= INCREMENTAL_FETCH_LIMIT:
+            return None
+        
+        update = self._fetch_from_binance(symbol, timeframe, limit=INCREMENTAL_FETCH_LIMIT, start_time=last_open)
+        if len(update) >= INCREMENTAL_FETCH_LIMIT:
+            return None
+        
+        self._count_fetch('restored', len(update))
+        logger.info("💾 %s/%s cargado de disco (%d velas) + %d descargadas", symbol, timeframe,
+                    len(stored), len(update))
+        if update.empty:
+            return stored
+        kept = stored[stored['timestamp'] < update['timestamp'].iloc[0]]
+        return pd.concat([kept, update], ignore_index=True).tail(MARKET_DATA_HISTORY).reset_index(drop=True)
+    
+    def _resample_base(self, key: Tuple[str, str]) -> Optional[Tuple[str, str]]:
+        """
+        Par del que se agrega `key` en modo resampling (llamar con self.lock tomado)
+        
+        Es el timeframe suscrito más chico del símbolo cuyas velas caben
+        enteras en las de `key` (ej: 1m para 5m/1h/4h; 3m no sirve para 5m).
+        
+        Returns:
+            (símbolo, timeframe base) o None si `key` se descarga por su cuenta
+        """
+        if not self.resample:
+            return None
+        symbol, timeframe = key
+        period = timeframe_to_seconds(timeframe)
+        if period is None:
+            return None
+        offset = _WEEK_OFFSET if timeframe == '1w' else 0
+        
+        base = None
+        for other_symbol, other in self.subscribers:
+            other_period = timeframe_to_seconds(other)
+            if other_symbol != symbol or other_period is None or other_period >= period \
+                    or period % other_period or offset % other_period \
+                    or not self.subscribers[(other_symbol, other)]:
+                continue
+            if base is None or other_period < timeframe_to_seconds(base):
+                base = other
+        return None if base is None else (symbol, base)
+    
+    def _resample_from(self, base_key: Tuple[str, str], update: pd.DataFrame, replace: bool):
+        """Actualizar los timeframes mayores que se agregan de `base_key` con sus velas nuevas"""
+        with self.lock:
+            targets = [key for key in self.subscribers if key[0] == base_key[0] and key != base_key
+                       and key in self.cache and self._resample_base(key) == base_key]
+        if not targets:
+            return
+        
+        timestamps, values = CandleBuffer.frame_arrays(update)
+        for target in targets:
             try:
-                data = self._fetch_from_binance(symbol, timeframe)
-                with self.lock:
-                    self.cache[key] = (data, datetime.now())
-                print(f"✅ Datos iniciales cargados: {symbol}/{timeframe}")
+                with self.resample_lock:
+                    with self.lock:
+                        entry = self.resamplers.get(target)
+                    if replace or entry is None or entry[0] != base_key:
+                        self._seed_resampler(target, base_key)
+                    else:
+                        self._publish_resampled(target, entry[1].apply(timestamps, values))
             except Exception as e:
-                print(f"❌ Error en carga inicial {symbol}/{timeframe}: {e}")
-            
-            # Loop de actualización
-            update_interval = self._get_update_interval(timeframe)
+                logger.error("❌ Error agregando %s/%s desde %s: %s", target[0], target[1], base_key[1], e)
+    
+    def _seed_resampler(self, key: Tuple[str, str], base_key: Tuple[str, str]):
+        """
+        Empezar a agregar `key` desde `base_key` (llamar con resample_lock tomado)
+        
+        La vela mayor en formación se recalcula con las velas base desde su
+        apertura: las del buffer base o, si no llega tan atrás (ej: 1d desde
+        500 velas de 1m), descargadas una vez por REST.
+        """
+        symbol, timeframe = key
+        with self.lock:
+            start = self.cache[key][0].last_timestamp if key in self.cache else None
+            base = self.cache.get(base_key)
+            base_first = int(base[0].view('timestamp')[0]) if base and len(base[0]) else None
+        if start is None or base_first is None:
+            return
+        
+        head = self._klines_to_frame([])
+        if base_first > start:
+            # Poner al día el timeframe mayor y traer las velas base que faltan de su vela en formación
+            self._refresh(key)
+            with self.lock:
+                cached = self.cache.get(key)
+            if cached is None:
+                return
+            start = cached[0].last_timestamp
+            if base_first > start:
+                head = self._fetch_range(symbol, base_key[1], start, base_first - 1)
+        
+        with self.lock:
+            base = self.cache.get(base_key)
+            if base is None:
+                return
+            buffer = base[0]
+            keep = buffer.view('timestamp') >= start
+            timestamps = np.concatenate([CandleBuffer.frame_arrays(head)[0], buffer.view('timestamp')[keep]])
+            values = np.concatenate([CandleBuffer.frame_arrays(head)[1],
+                                     np.column_stack([buffer.view(name)[keep] for name in
+                                                      ('open', 'high', 'low', 'close', 'volume')])])
+        
+        period = timeframe_to_seconds(timeframe) * 1000
+        resampler = CandleResampler(period, _WEEK_OFFSET * 1000 if timeframe == '1w' else 0)
+        rows = resampler.apply(timestamps, values)
+        with self.lock:
+            self.resamplers[key] = (base_key, resampler)
+        logger.info("🧮 %s/%s agregado localmente desde %s", symbol, timeframe, base_key[1])
+        self._publish_resampled(key, rows)
+    
+    def _publish_resampled(self, key: Tuple[str, str], rows: List[list]):
+        """Guardar velas agregadas (en modo alineado solo las cerradas)"""
+        if not rows:
+            return
+        update = self._klines_to_frame(rows)
+        if self.is_candle_aligned(key[1]):
+            update = self._closed_candles(update, key[1])
+        self._count_fetch('resampled')
+        self._publish(key, update, replace=False)
+    
+    def _on_stream_kline(self, symbol: str, timeframe: str, open_ms: int, values: tuple, closed: bool):
+        """
+        Vela recibida por WebSocket (thread del stream).
+        
+        Los cambios de la vela en formación se guardan como mucho cada
+        STREAM_UPDATE_THROTTLE segundos; los cierres, siempre. Si falta alguna
+        vela intermedia se rellena por REST.
+        """
+        key = (symbol, timeframe)
+        with self.lock:
+            cached = self.cache.get(key)
+            if cached is None:
+                return  # Aún sin historial: lo carga el worker por REST
+            if self._resample_base(key) is not None:
+                return  # Se agrega desde el timeframe base
+            last_open = cached[0].last_timestamp
+            now = time.monotonic()
+            if not closed:
+                if self.is_candle_aligned(timeframe):
+                    return  # Modo alineado: solo velas cerradas
+                if open_ms == last_open and now - self.stream_updates.get(key, 0.0) < STREAM_UPDATE_THROTTLE:
+                    return
+            self.stream_updates[key] = now
+        
+        period = timeframe_to_seconds(timeframe)
+        if last_open is not None and period is not None and open_ms > last_open + period * 1000:
+            logger.info("🧩 Hueco en el stream de %s/%s: rellenando por REST", symbol, timeframe)
+            self._backfill([key])
+            return
+        
+        self._publish(key, self._klines_to_frame([[open_ms, *values]]), replace=False)
+    
+    def _on_stream_connect(self):
+        """
+        Al (re)conectar: rellenar por REST lo que pudo perderse sin conexión.
+        Corre antes de leer el primer mensaje, así las velas del stream se
+        aplican después y no las pisa una respuesta REST más vieja.
+        """
+        with self.lock:
+            keys = [key for key in self.cache if self._resample_base(key) is None]
+        self._backfill(keys)
+    
+    def _on_stream_disconnect(self):
+        logger.warning("⚠️ Stream de velas caído: los workers vuelven a consultar REST")
+    
+    def _backfill(self, keys: List[Tuple[str, str]]):
+        """Descarga incremental por REST de varios pares (desde su última vela guardada)"""
+        for key in keys:
+            try:
+                self._refresh(key)
+            except Exception as e:
+                logger.error("❌ Error rellenando %s/%s: %s", key[0], key[1], e)
+    
+    def _closed_candles(self, data: pd.DataFrame, timeframe: str) -> pd.DataFrame:
+        """Quitar la vela en formación (la que aún no llegó a su cierre)"""
+        period = timeframe_to_seconds(timeframe)
+        opens = data['timestamp'].to_numpy().astype('datetime64[ms]').astype('int64') / 1000.0
+        closed = opens + period <= time.time()
+        return data if closed.all() else data[closed].reset_index(drop=True)
+    
+    def _latest_open(self, key: Tuple[str, str], update: pd.DataFrame, replace: bool) -> Optional[int]:
+        """Apertura (ms) de la última vela que quedaría guardada tras aplicar `update`"""
+        if not update.empty:
+            return int(update['timestamp'].iloc[-1].value // 1_000_000)
+        if replace:
+            return None
+        with self.lock:
+            cached = self.cache.get(key)
+        return cached[0].last_timestamp if cached else None
+    
+    def _seconds_until_refresh(self, timeframe: str) -> float:
+        """Espera hasta la próxima descarga (cierre de vela o intervalo fijo)"""
+        if self.is_candle_aligned(timeframe):
+            return max(0.0, next_candle_close(timeframe) - time.time()) + CANDLE_CLOSE_DELAY
+        return self._get_update_interval(timeframe)
+    
+    def _store(self, key: Tuple[str, str], data: pd.DataFrame, replace: bool = True) -> int:
+        """
+        Guardar velas en el buffer del par y publicar la versión nueva.
+        Los indicadores compartidos del snapshot anterior se descartan.
+        
+        Args:
+            key: (símbolo, timeframe)
+            data: DataFrame con datos OHLCV
+            replace: True si `data` es el historial completo; False si solo
+                trae la vela en formación y las nuevas (se escriben en O(1) cada una)
+        
+        Returns:
+            Versión del snapshot guardado (la misma de antes si no cambió nada)
+        """
+        symbol, timeframe = key
+        timestamps, values = CandleBuffer.frame_arrays(data)
+        with self.lock:
+            cached = self.cache.get(key)
+            buffer = cached[0] if cached else CandleBuffer(MARKET_DATA_HISTORY)
+            if replace or cached is None:
+                buffer.load(timestamps, values)
+            elif not buffer.upsert(timestamps, values):
+                # Mismas velas que antes: sin versión nueva ni avisos
+                self.cache[key] = (buffer, datetime.now())
+                return self.versions.get(key, 0)
             
-            while not stop_flag.is_set():
-                try:
-                    # Verificar si aún hay suscriptores
-                    with self.lock:
-                        if key not in self.subscribers or len(self.subscribers[key]) == 0:
-                            break
-                        subscriber_count = len(self.subscribers[key])
-                    
-                    # Descargar datos de Binance
-                    data = self._fetch_from_binance(symbol, timeframe)
-                    
-                    # Guardar en cache
-                    with self.lock:
-                        self.cache[key] = (data, datetime.now())
-                    
-                    current_price = data['close'].iloc[-1]
-                    print(f"🔄 {symbol}/{timeframe} actualizado → ${current_price:,.2f} ({subscriber_count} bots)")
-                    
-                except Exception as e:
-                    print(f"❌ Error en worker {symbol}/{timeframe}: {e}")
-                
-                # Esperar antes de la próxima actualización
-                stop_flag.wait(timeout=update_interval)
+            version = self.versions.get(key, 0) + 1
+            self.versions[key] = version
+            self.cache[key] = (buffer, datetime.now())
+            self.update_condition.notify_all()
+            last_timestamp = buffer.last_timestamp
+            indicator_cache.on_snapshot(symbol, timeframe, version, last_timestamp)
             
-            print(f"🔴 Worker detenido para {symbol}/{timeframe}")
+            # Avanzar los indicadores incrementales solo con las velas nuevas
+            streams = self.streams.get(key)
+            if streams is not None:
+                streams.apply(data)
+                if streams.indicators:
+                    indicator_cache.publish_live(symbol, timeframe, version, last_timestamp, streams.results())
+        
+        return version
+    
+    def _notify_refresh(self, key: Tuple[str, str], data: pd.DataFrame, version: int):
+        """
+        Ejecutar los callbacks de actualización y avisar a los suscriptores
+        (un error no afecta al worker)
+        """
+        symbol, timeframe = key
+        last_open = snapshot_timestamp(data)
+        with self.lock:
+            listeners = list(self.refresh_listeners)
+            subscribers = list(self.subscriber_callbacks.get(key, {}).items())
+            new_candle = self.notified_opens.get(key) != last_open
+            self.notified_opens[key] = last_open
         
-        # Iniciar thread
-        thread = threading.Thread(target=worker_loop, daemon=True, name=f"Worker-{symbol}-{timeframe}")
-        thread.start()
-        self.workers[key] = thread
+        for callback in listeners:
+            try:
+                callback(symbol, timeframe, data, version)
+            except Exception as e:
+                logger.exception("❌ Error en listener de %s/%s: %s", symbol, timeframe, e)
+        
+        event = SnapshotEvent(symbol, timeframe, version, data, new_candle)
+        for bot_id, deliver in subscribers:
+            try:
+                deliver(event)
+            except Exception as e:
+                logger.exception("❌ Error avisando a %s de %s/%s: %s", bot_id, symbol, timeframe, e)
     
     def _stop_worker(self, symbol: str, timeframe: str):
         """
@@ -219,20 +838,120 @@ class MarketDataService:
         
         if key in self.workers:
             del self.workers[key]
+        self.scheduler.cancel(key)
         
         if key in self.cache:
             del self.cache[key]
         
-        print(f"🛑 Worker detenido: {symbol}/{timeframe}")
+        self.streams.pop(key, None)
+        self.stream_updates.pop(key, None)
+        self.resamplers.pop(key, None)
+        for target in [target for target, (base, _) in self.resamplers.items() if base == key]:
+            del self.resamplers[target]  # Vuelven a REST o a otro timeframe base
+        if self.stream is not None:
+            self.stream.remove(symbol, timeframe)
+        self.subscriber_callbacks.pop(key, None)
+        self.notified_opens.pop(key, None)
+        indicator_cache.evict(symbol, timeframe)
+        
+        logger.debug("🛑 Worker detenido: %s/%s", symbol, timeframe)
+    
+    def _fetch_update(self, key: Tuple[str, str]) -> Tuple[pd.DataFrame, bool]:
+        """
+        Descargar solo lo nuevo de un par.
+        
+        Con historial previo se piden las velas desde la apertura de la última
+        guardada: esa vela (aún en formación) se reemplaza y las nuevas se
+        agregan al final del buffer. Si el hueco es mayor que
+        INCREMENTAL_FETCH_LIMIT se recarga el historial completo.
+        
+        Args:
+            key: (símbolo, timeframe)
+            
+        Returns:
+            Tupla (DataFrame descargado, True si es el historial completo)
+        """
+        symbol, timeframe = key
+        with self.lock:
+            cached = self.cache.get(key)
+        last_open = cached[0].last_timestamp if cached else None
+        
+        if last_open is None:
+            restored = self._restore(key)
+            if restored is not None:
+                return restored, True
+            self._count_fetch('full')
+            return self._fetch_history(symbol, timeframe, MARKET_DATA_HISTORY), True
+        
+        update = self._fetch_from_binance(symbol, timeframe, limit=INCREMENTAL_FETCH_LIMIT, start_time=last_open)
+        
+        if len(update) >= INCREMENTAL_FETCH_LIMIT:
+            # Hueco demasiado grande (p. ej. tras una caída): recargar todo
+            self._count_fetch('full')
+            return self._fetch_history(symbol, timeframe, MARKET_DATA_HISTORY), True
+        
+        self._count_fetch('incremental', len(update))
+        return update, False
+    
+    def _count_fetch(self, kind: str, rows: int = 0):
+        """Contar una descarga en fetch_stats (desde los workers del pool: con el lock)"""
+        with self.lock:
+            self.fetch_stats[kind] += 1
+            self.fetch_stats['rows'] += rows
+    
+    def _fetch_history(self, symbol: str, timeframe: str, depth: int) -> pd.DataFrame:
+        """
+        Descargar las últimas `depth` velas (paginando si supera el límite de Binance).
+        """
+        frames = []
+        end_time = None
+        remaining = depth
+        
+        while remaining > 0:
+            limit = min(remaining, BINANCE_KLINES_LIMIT)
+            page = self._fetch_from_binance(symbol, timeframe, limit=limit, end_time=end_time)
+            if page.empty:
+                break
+            frames.append(page)
+            remaining -= len(page)
+            if len(page) < limit:
+                break
+            end_time = int(page['timestamp'].iloc[0].value // 1_000_000) - 1
+        
+        if not frames:
+            return self._klines_to_frame([])
+        if len(frames) == 1:
+            return frames[0]
+        return pd.concat(reversed(frames), ignore_index=True)
+    
+    def _fetch_range(self, symbol: str, timeframe: str, start_time: int, end_time: int) -> pd.DataFrame:
+        """Descargar las velas con apertura entre start_time y end_time (ms, incluidos)"""
+        frames = []
+        while start_time <= end_time:
+            page = self._fetch_from_binance(symbol, timeframe, limit=BINANCE_KLINES_LIMIT,
+                                            start_time=start_time, end_time=end_time)
+            if page.empty:
+                break
+            frames.append(page)
+            if len(page) < BINANCE_KLINES_LIMIT:
+                break
+            start_time = int(page['timestamp'].iloc[-1].value // 1_000_000) + 1
+        
+        if not frames:
+            return self._klines_to_frame([])
+        return pd.concat(frames, ignore_index=True) if len(frames) > 1 else frames[0]
     
-    def _fetch_from_binance(self, symbol: str, timeframe: str, limit: int = 500) -> pd.DataFrame:
+    def _fetch_from_binance(self, symbol: str, timeframe: str, limit: int = 500,
+                            start_time: Optional[int] = None, end_time: Optional[int] = None) -> pd.DataFrame:
         """
         Descargar datos de Binance API.
         
         Args:
             symbol: Par de trading
             timeframe: Marco temporal
-            limit: Número de velas a descargar
+            limit: Número de velas a descargar (máximo 1000)
+            start_time: Apertura mínima en ms (incluida)
+            end_time: Apertura máxima en ms (incluida)
             
         Returns:
             DataFrame con datos OHLCV
@@ -243,28 +962,38 @@ class MarketDataService:
             'interval': timeframe,
             'limit': limit
         }
+        if start_time is not None:
+            params['startTime'] = start_time
+        if end_time is not None:
+            params['endTime'] = end_time
         
-        response = requests.get(url, params=params, timeout=10)
+        binance_rate_limiter.acquire(endpoint_weight('klines'), PRIORITY_LIVE)
+        response = http_client.get(url, params=params)
+        binance_rate_limiter.update_from_headers(response.headers, response.status_code)
         response.raise_for_status()
-        data = response.json()
-        
-        # Convertir a DataFrame
-        df = pd.DataFrame(data, columns=[
-            'timestamp', 'open', 'high', 'low', 'close', 'volume',
-            'close_time', 'quote_volume', 'trades', 'taker_buy_base',
-            'taker_buy_quote', 'ignore'
-        ])
-        
-        # Seleccionar y convertir columnas
-        df = df[['timestamp', 'open', 'high', 'low', 'close', 'volume']]
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-        df['open'] = pd.to_numeric(df['open'], errors='coerce')
-        df['high'] = pd.to_numeric(df['high'], errors='coerce')
-        df['low'] = pd.to_numeric(df['low'], errors='coerce')
-        df['close'] = pd.to_numeric(df['close'], errors='coerce')
-        df['volume'] = pd.to_numeric(df['volume'], errors='coerce')
-        
-        return df
+        
+        return self._klines_to_frame(response.json())
+    
+    @staticmethod
+    def _klines_to_frame(klines: List[list]) -> pd.DataFrame:
+        """
+        Convertir la respuesta de /klines a DataFrame OHLCV
+        
+        Solo se leen las 6 primeras columnas y se convierten en bloque con
+        NumPy (en lugar de pd.to_numeric columna por columna). Los timestamps
+        quedan en datetime64[ms], igual que CandleBuffer.snapshot().
+        """
+        timestamps = np.array([k[0] for k in klines], dtype='int64')
+        values = np.array([k[1:6] for k in klines], dtype=float).reshape(len(klines), 5)
+        
+        return pd.DataFrame({
+            'timestamp': timestamps.astype('datetime64[ms]'),
+            'open': values[:, 0],
+            'high': values[:, 1],
+            'low': values[:, 2],
+            'close': values[:, 3],
+            'volume': values[:, 4],
+        })
     
     def _get_update_interval(self, timeframe: str) -> int:
         """
@@ -304,11 +1033,14 @@ class MarketDataService:
             Edad máxima en segundos
         """
         # El cache debe ser válido por al menos 2x el intervalo de actualización
+        if self.is_candle_aligned(timeframe):
+            # Alineado: los datos se renuevan una vez por vela
+            return timeframe_to_seconds(timeframe) + self._get_update_interval(timeframe) * 2
         return self._get_update_interval(timeframe) * 2
     
     def shutdown(self):
         """Detener todos los workers y limpiar recursos"""
-        print("🛑 Deteniendo Market Data Service...")
+        logger.info("🛑 Deteniendo Market Data Service...")
         
         with self.lock:
             # Detener todos los workers
@@ -322,7 +1054,10 @@ class MarketDataService:
             self.workers.clear()
             self.worker_stop_flags.clear()
         
-        print("✅ Market Data Service detenido")
+        self.disable_streaming()
+        self.scheduler.stop()
+        
+        logger.info("✅ Market Data Service detenido")
 
 
 # Instancia global singleton
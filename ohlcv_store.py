@@ -0,0 +1,162 @@
+"""
+OHLCV Store - Velas guardadas en disco, compartidas entre los bots y el backtest
+Un archivo binario por par (data/ohlcv/BTCUSDT_1h.ohlcv) con registros de
+tamaño fijo que se leen con np.memmap sin parsear nada
+"""
+
+import os
+import threading
+from typing import Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+OHLCV_STORE_DIR = os.getenv('OHLCV_STORE_DIR', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ohlcv'))
+
+# Un registro por vela: apertura en ms + OHLCV (48 bytes, little-endian)
+RECORD = np.dtype([('timestamp', '<i8'), ('open', '<f8'), ('high', '<f8'), ('low', '<f8'),
+                   ('close', '<f8'), ('volume', '<f8')])
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+
+
+class OHLCVStore:
+    """
+    Velas por par en disco
+
+    - Los registros están ordenados por apertura: leer desde una fecha es
+      un searchsorted sobre el archivo mapeado en memoria
+    - write() reemplaza desde la primera vela recibida en adelante y agrega
+      al final (trunca + append): guardar velas nuevas cuesta O(velas nuevas)
+    - El archivo siempre es continuo: si las velas recibidas empiezan después
+      de un hueco, las guardadas se descartan (quien lee de bounds()[0] a
+      bounds()[1] no ve huecos silenciosos)
+    - Un registro incompleto al final (corte durante una escritura) se descarta
+    - Con max_records, write() recorta el archivo a las últimas max_records
+      velas cuando llega al doble (una copia cada max_records velas nuevas)
+    """
+
+    def __init__(self, root: str = OHLCV_STORE_DIR):
+        self.root = root
+        self.lock = threading.Lock()
+
+    def path(self, symbol: str, timeframe: str) -> str:
+        return os.path.join(self.root, f"{symbol.replace('/', '').upper()}_{timeframe}.ohlcv")
+
+    def bounds(self, symbol: str, timeframe: str) -> Optional[Tuple[int, int]]:
+        """Apertura (ms) de la primera y la última vela guardadas, o None si no hay"""
+        with self.lock:
+            records = self._map(symbol, timeframe)
+            if records is None:
+                return None
+            return int(records['timestamp'][0]), int(records['timestamp'][-1])
+
+    def read(self, symbol: str, timeframe: str, start_time: Optional[int] = None,
+             limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Leer velas guardadas
+
+        Args:
+            symbol: Par de trading (BTCUSDT o BTC/USDT)
+            timeframe: Marco temporal
+            start_time: Apertura mínima en ms (incluida)
+            limit: Como mucho las últimas `limit` velas
+
+        Returns:
+            (aperturas en ms, valores (n, 5)): copias, no dependen del archivo
+        """
+        with self.lock:
+            records = self._map(symbol, timeframe)
+            if records is None:
+                return np.empty(0, dtype=np.int64), np.empty((0, len(COLUMNS)))
+            start = 0 if start_time is None else int(np.searchsorted(records['timestamp'], start_time))
+            if limit is not None:
+                start = max(start, len(records) - limit)
+            chunk = np.array(records[start:])
+        return chunk['timestamp'].astype(np.int64), np.column_stack([chunk[name] for name in COLUMNS])
+
+    def read_frame(self, symbol: str, timeframe: str, start_time: Optional[int] = None,
+                   limit: Optional[int] = None) -> pd.DataFrame:
+        """Como read(), en el formato OHLCV del MarketDataService"""
+        timestamps, values = self.read(symbol, timeframe, start_time, limit)
+        frame = {'timestamp': timestamps.astype('datetime64[ms]')}  # Mismo formato que CandleBuffer.snapshot()
+        for i, name in enumerate(COLUMNS):
+            frame[name] = values[:, i]
+        return pd.DataFrame(frame)
+
+    def write(self, symbol: str, timeframe: str, timestamps, values, period_ms: Optional[int] = None,
+              max_records: Optional[int] = None) -> int:
+        """
+        Guardar velas ordenadas: las guardadas desde la primera de ellas se reemplazan
+
+        Args:
+            timestamps: Aperturas en ms
+            values: Filas [open, high, low, close, volume]
+            period_ms: Duración de una vela; si la primera recibida abre más de
+                un periodo después de la última guardada, el archivo se
+                reemplaza (None = sin control de huecos)
+            max_records: Retención del par; al superar el doble se conservan
+                solo las últimas max_records velas (None = sin límite)
+
+        Returns:
+            Número de velas en el archivo
+        """
+        timestamps = np.asarray(timestamps, dtype=np.int64)
+        if len(timestamps) == 0:
+            return 0
+        values = np.asarray(values, dtype=float).reshape(len(timestamps), len(COLUMNS))
+        records = np.empty(len(timestamps), dtype=RECORD)
+        records['timestamp'] = timestamps
+        for i, name in enumerate(COLUMNS):
+            records[name] = values[:, i]
+
+        with self.lock:
+            existing = self._map(symbol, timeframe)
+            position = 0 if existing is None else int(np.searchsorted(existing['timestamp'], timestamps[0]))
+            if (period_ms is not None and existing is not None
+                    and timestamps[0] > int(existing['timestamp'][-1]) + period_ms):
+                position = 0  # Hueco entre lo guardado y lo nuevo: empezar de nuevo
+            del existing
+            os.makedirs(self.root, exist_ok=True)
+            path = self.path(symbol, timeframe)
+            with open(path, 'r+b' if os.path.exists(path) else 'w+b') as f:
+                f.truncate(position * RECORD.itemsize)
+                f.seek(position * RECORD.itemsize)
+                f.write(records.tobytes())
+            count = position + len(records)
+            if max_records is not None and count > 2 * max_records:
+                self._trim(path, count, max_records)
+                count = max_records
+            return count
+
+    def delete(self, symbol: str, timeframe: str):
+        """Borrar las velas guardadas de un par"""
+        with self.lock:
+            try:
+                os.remove(self.path(symbol, timeframe))
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _trim(path: str, count: int, keep: int):
+        """Dejar solo las últimas `keep` velas (archivo nuevo + rename atómico; llamar con lock tomado)"""
+        with open(path, 'rb') as f:
+            f.seek((count - keep) * RECORD.itemsize)
+            tail = f.read(keep * RECORD.itemsize)
+        with open(path + '.tmp', 'wb') as f:
+            f.write(tail)
+        os.replace(path + '.tmp', path)
+
+    def _map(self, symbol: str, timeframe: str) -> Optional[np.memmap]:
+        """Archivo mapeado en memoria (solo lectura) o None si no hay velas (llamar con lock tomado)"""
+        path = self.path(symbol, timeframe)
+        try:
+            count = os.path.getsize(path) // RECORD.itemsize
+        except OSError:
+            return None
+        if count == 0:
+            return None
+        return np.memmap(path, dtype=RECORD, mode='r', shape=(count,))
+
+
+# Instancia global (data/ohlcv)
+ohlcv_store = OHLCVStore()
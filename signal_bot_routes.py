@@ -7,13 +7,15 @@ from flask import Blueprint, request, jsonify, session
 from database import get_db_connection
 import json
 import requests
+from http_client import http_client
 from datetime import datetime
-from bot_engine import BotEngine
+from bot_engine_owner import get_bot_engine
+from strategy_compiler import compile_strategy, StrategyCompileError
 
 signal_bot_bp = Blueprint('signal_bot', __name__)
 
 # Instancia global del motor de bots
-bot_engine = BotEngine()
+bot_engine = get_bot_engine()
 
 @signal_bot_bp.route('/api/signal-bots/create', methods=['POST'])
 def create_bot():
@@ -31,6 +33,12 @@ def create_bot():
             if field not in data:
                 return jsonify({'error': f'Missing required field: {field}'}), 400
         
+        # Validar la estrategia antes de guardarla
+        try:
+            compile_strategy(data['strategy'])
+        except StrategyCompileError as e:
+            return jsonify({'error': f'Invalid strategy: {e}'}), 400
+        
         # Bot token y chat_id son opcionales
         bot_token = data.get('bot_token', '')
         chat_id = data.get('chat_id', '')
@@ -211,6 +219,12 @@ def update_bot(bot_id):
         user_id = session['user_id']
         data = request.get_json()
         
+        # Validar la estrategia antes de guardarla
+        try:
+            compile_strategy(data['strategy'])
+        except StrategyCompileError as e:
+            return jsonify({'error': f'Invalid strategy: {e}'}), 400
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
@@ -329,9 +343,10 @@ def activate_bot(bot_id):
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Verificar que el bot existe y obtener su configuración
+        # Verificar que el bot existe y obtener su configuración (con las posiciones guardadas)
         cursor.execute('''
-            SELECT id, name, bot_token, chat_id, symbol, timeframe, check_interval, strategy
+            SELECT id, name, bot_token, chat_id, symbol, timeframe, check_interval, strategy,
+                   ignore_position_tracking, position_state, last_signal_type
             FROM signal_bots
             WHERE id = ? AND user_id = ?
         ''', (numeric_id, user_id))
@@ -355,7 +370,11 @@ def activate_bot(bot_id):
             'symbol': row[4],
             'timeframe': row[5],
             'check_interval': row[6],
-            'strategy': json.loads(row[7]) if row[7] else {}
+            'strategy': json.loads(row[7]) if row[7] else {},
+            'ignore_position_tracking': bool(row[8]),
+            # Igual que load_active_bots: el bot sigue con las posiciones guardadas
+            'position_state': row[9] or 0,
+            'last_signal_type': row[10]
         }
         
         success = bot_engine.start_bot(bot_config)
@@ -462,8 +481,7 @@ def toggle_bot_tracking(bot_id):
         
         # Actualizar el bot en ejecución si existe
         full_bot_id = f'bot_{numeric_id}'
-        if full_bot_id in bot_engine.bots:
-            bot_engine.bots[full_bot_id].toggle_position_tracking(ignore_tracking)
+        bot_engine.set_position_tracking(full_bot_id, ignore_tracking)
         
         mode = "Prueba (ignora tracking)" if ignore_tracking else "Profesional (respeta tracking)"
         print(f"🎚️ Bot {full_bot_id} cambió a modo: {mode}")
@@ -519,9 +537,7 @@ def health_check():
                     'signals': signal_count
                 }
             },
-            'bot_engine': {
-                'active_bots': len(bot_engine.bots)
-            }
+            'bot_engine': bot_engine.get_stats()
         }), 200
         
     except Exception as e:
@@ -548,7 +564,7 @@ def get_telegram_chat_id():
         # Llamar a la API de Telegram para obtener actualizaciones
         url = f"https://api.telegram.org/bot{bot_token}/getUpdates"
         
-        response = requests.get(url, timeout=10)
+        response = http_client.get(url)
         response.raise_for_status()
         
         result = response.json()
@@ -632,7 +648,7 @@ You will receive trading signals here when the bot is active.
             'parse_mode': 'HTML'
         }
         
-        response = requests.post(url, json=payload, timeout=10)
+        response = http_client.post(url, json=payload)
         response.raise_for_status()
         
         result = response.json()
@@ -793,6 +809,63 @@ def force_check_now(bot_id):
         return jsonify({'error': str(e)}), 500
 
 
+@signal_bot_bp.route('/api/signal-bots/trace/<bot_id>', methods=['GET', 'POST'])
+def bot_trace(bot_id):
+    """
+    Traza de depuración de un bot
+    
+    GET: devuelve las entradas registradas
+    POST {"enabled": true|false}: activa o desactiva la traza
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    try:
+        user_id = session['user_id']
+        
+        try:
+            if bot_id.startswith('bot_'):
+                numeric_part = bot_id.replace('bot_', '').split('_')[0]
+                numeric_id = int(numeric_part)
+            else:
+                numeric_id = int(bot_id)
+        except (ValueError, AttributeError):
+            return jsonify({'error': 'Bot not found in database'}), 404
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            SELECT id FROM signal_bots
+            WHERE id = ? AND user_id = ?
+        ''', (numeric_id, user_id))
+        
+        row = cursor.fetchone()
+        conn.close()
+        
+        if not row:
+            return jsonify({'error': 'Bot not found'}), 404
+        
+        engine_id = f'bot_{numeric_id}'
+        
+        if request.method == 'POST':
+            data = request.get_json(silent=True) or {}
+            enabled = bool(data.get('enabled', True))
+            if not bot_engine.set_trace(engine_id, enabled):
+                return jsonify({'error': 'Bot is not running'}), 400
+            return jsonify({'success': True, 'bot_id': engine_id, 'trace_enabled': enabled}), 200
+        
+        trace = bot_engine.get_trace(engine_id)
+        if trace is None:
+            return jsonify({'error': 'Bot is not running'}), 400
+        
+        return jsonify({'success': True, 'bot_id': engine_id, 'entries': trace}), 200
+        
+    except Exception as e:
+        print(f"Error handling bot trace: {e}")
+        return jsonify({'error': str(e)}), 500
+
+
 @signal_bot_bp.route('/api/signal-bots/status/<bot_id>', methods=['GET'])
 def get_bot_status_detailed(bot_id):
     """Obtener estado detallado del bot"""
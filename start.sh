@@ -32,11 +32,64 @@ pip install -q -r requirements.txt
 # Crear directorio de base de datos si no existe
 mkdir -p database
 
+# Modo del motor: variable de entorno o BOT_ENGINE_MODE en .env
+if [ -z "$BOT_ENGINE_MODE" ] && [ -f ".env" ]; then
+    BOT_ENGINE_MODE=$(grep -E '^BOT_ENGINE_MODE=' .env | tail -n 1 | cut -d= -f2- | tr -d '"'"'"'\r ')
+fi
+
+GUNICORN_CMD="gunicorn --workers 3 --bind 0.0.0.0:5000 --timeout 120 --access-logfile - --error-logfile - app:app"
+
 # Iniciar aplicación con Gunicorn (producción)
 echo "✅ Iniciando servidor con Gunicorn..."
 echo "   Modo: Producción"
 echo "   Workers: 3"
 echo "   Puerto: 5000"
+echo "   Motor de bots: ${BOT_ENGINE_MODE:-local}"
 echo "=================================================="
 
-gunicorn --workers 3 --bind 0.0.0.0:5000 --timeout 120 --access-logfile - --error-logfile - app:app
+if [ "$BOT_ENGINE_MODE" != "daemon" ]; then
+    exec $GUNICORN_CMD
+fi
+
+# Motor de bots en un proceso propio, supervisado junto a Gunicorn:
+# se reinicia si cae y el script termina (con error) si cae Gunicorn,
+# para que el supervisor externo (systemd, screen...) lo vea.
+STOPPING=0
+ENGINE_PID=""
+
+supervise_engine() {
+    trap 'kill -TERM "$ENGINE_PID" 2>/dev/null; wait "$ENGINE_PID"; exit 0' TERM INT
+    while true; do
+        python bot_engine_owner.py &
+        ENGINE_PID=$!
+        wait "$ENGINE_PID"
+        echo "⚠️ Motor de bots terminó (código $?), reiniciando en 5s..."
+        sleep 5
+    done
+}
+
+shutdown() {
+    STOPPING=1
+    echo "🛑 Deteniendo servidor y motor de bots..."
+    kill -TERM "$SUPERVISOR_PID" "$GUNICORN_PID" 2>/dev/null
+    wait "$SUPERVISOR_PID" "$GUNICORN_PID" 2>/dev/null
+    exit 0
+}
+
+echo "✅ Iniciando motor de bots..."
+supervise_engine &
+SUPERVISOR_PID=$!
+
+$GUNICORN_CMD &
+GUNICORN_PID=$!
+
+trap shutdown TERM INT
+
+wait "$GUNICORN_PID"
+STATUS=$?
+if [ "$STOPPING" -eq 0 ]; then
+    echo "❌ Gunicorn terminó (código $STATUS), deteniendo motor de bots..."
+    kill -TERM "$SUPERVISOR_PID" 2>/dev/null
+    wait "$SUPERVISOR_PID" 2>/dev/null
+    exit "$STATUS"
+fi
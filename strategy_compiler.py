@@ -0,0 +1,421 @@
+"""
+Strategy Compiler
+Compila la estrategia de bloques visuales en un plan de evaluación inmutable
+"""
+
+from types import MappingProxyType
+from typing import Dict, List, Any, Optional, Tuple, NamedTuple
+
+# Zonas que puede tener una estrategia
+ZONES = ('entry_long', 'exit_long', 'entry_short', 'exit_short')
+
+# Parámetros soportados por indicador: (nombre, tipo, valor por defecto, alias)
+INDICATOR_PARAMS = {
+    'EMA': (('period', int, 20, ()),),
+    'SMA': (('period', int, 20, ()),),
+    'RSI': (('period', int, 14, ()),),
+    'MACD': (
+        ('fast', int, 12, ()),
+        ('slow', int, 26, ()),
+        ('signal', int, 9, ()),
+        ('component', str, 'macd', ()),
+    ),
+    'BBands': (
+        ('period', int, 20, ()),
+        ('std_dev', float, 2.0, ('std',)),
+        ('band', str, 'middle', ()),
+    ),
+    'ATR': (('period', int, 14, ()),),
+    'Swing': (
+        ('lookback', int, 5, ()),
+        ('type', str, 'high', ()),
+    ),
+}
+
+# Valores permitidos para parámetros de tipo texto
+PARAM_CHOICES = {
+    'component': ('macd', 'signal', 'histogram'),
+    'band': ('upper', 'middle', 'lower'),
+    'type': ('high', 'low'),
+}
+
+VALUE_NAMES = ('Price', 'Number', 'Percentage')
+
+COMPARISON_OPERATORS = (
+    'GreaterThan', 'LessThan', 'GreaterOrEqual', 'LessOrEqual',
+    'Equal', 'NotEqual', 'Crosses', 'CrossesAbove', 'CrossesBelow'
+)
+
+LOGIC_OPERATORS = ('AND', 'OR', 'NOT', 'XOR', 'NAND', 'NOR')
+
+# Tipos de bloque aceptados (el frontend envía 'operator' y 'condition')
+COMPARISON_TYPES = ('comparison', 'operator')
+LOGIC_TYPES = ('logic', 'condition')
+
+# Comparadores de cruce con dirección explícita
+CROSS_OPERATORS = {
+    'CrossesAbove': 'above',
+    'CrossesBelow': 'below',
+}
+
+# Dirección de un cruce según el comparador que le sigue: "Crosses" + ">"
+CROSS_DIRECTIONS = {
+    'GreaterThan': 'above',
+    'GreaterOrEqual': 'above',
+    'LessThan': 'below',
+    'LessOrEqual': 'below',
+}
+
+# Precedencias para el parser infijo: NOT niega la comparación completa
+# ("NOT Precio > EMA" = NOT (Precio > EMA)) y se aplica antes que AND/OR
+_PREC_LOGIC = 1
+_PREC_NOT = 2
+_PREC_COMPARISON = 3
+
+
+class StrategyCompileError(ValueError):
+    """Error de validación al compilar una estrategia"""
+
+
+class Instruction(NamedTuple):
+    """
+    Instrucción del plan (notación postfija)
+
+    op:
+        'indicator'  → apila el valor de un indicador (arg = (nodo, componente))
+        'price'      → apila el precio de cierre actual
+        'percentage' → apila un porcentaje del precio actual (arg = porcentaje)
+        'const'      → apila una constante (arg = valor)
+        'compare'    → compara los dos últimos valores (arg = dirección de cruce)
+        'logic'      → aplica un operador lógico
+    """
+    op: str
+    name: str
+    params: Any = None
+    arg: Any = None
+    arity: int = 0
+
+
+class CompiledStrategy:
+    """
+    Plan de evaluación inmutable de una estrategia
+
+    Además de las instrucciones por zona, guarda el grafo de indicadores
+    (nodes) de todas las zonas en orden topológico y sin duplicados, para
+    calcular cada (indicador, parámetros) una sola vez por snapshot de velas.
+    """
+
+    __slots__ = ('_zones', '_nodes', '_roots')
+
+    def __init__(self, zones: Dict[str, Tuple[Instruction, ...]]):
+        object.__setattr__(self, '_zones', MappingProxyType(dict(zones)))
+        object.__setattr__(self, '_nodes', _collect_nodes(self._zones.values()))
+        used = {i.arg[0] for program in self._zones.values() for i in program if i.op == 'indicator'}
+        object.__setattr__(self, '_roots', tuple(node for node in self._nodes if node in used))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CompiledStrategy es inmutable")
+
+    @property
+    def zones(self) -> MappingProxyType:
+        """Instrucciones por zona (solo zonas con bloques)"""
+        return self._zones
+
+    @property
+    def nodes(self) -> Tuple[tuple, ...]:
+        """Nodos de indicadores usados por todas las zonas (dependencias primero)"""
+        return self._nodes
+
+    @property
+    def roots(self) -> Tuple[tuple, ...]:
+        """Nodos leídos directamente por los bloques (sin dependencias internas)"""
+        return self._roots
+
+    def get(self, zone: str) -> Tuple[Instruction, ...]:
+        """Instrucciones de una zona (tupla vacía si no tiene bloques)"""
+        return self._zones.get(zone, ())
+
+    def __repr__(self):
+        sizes = {zone: len(program) for zone, program in self._zones.items()}
+        return f"CompiledStrategy({sizes}, nodes={len(self._nodes)})"
+
+
+def indicator_output(name: str, params: Dict[str, Any]) -> Tuple[tuple, Optional[str]]:
+    """
+    Nodo del grafo y componente que produce un bloque de indicador
+
+    Ejemplo: MACD(12, 26, 9) componente 'signal' → (('MACD', 12, 26, 9), 'signal')
+    """
+    if name == 'MACD':
+        return ('MACD', params['fast'], params['slow'], params['signal']), params['component']
+    if name == 'BBands':
+        return ('BBands', params['period'], params['std_dev']), params['band']
+    if name == 'Swing':
+        return ('Swing', params['lookback'], params['type']), None
+    return (name, params['period']), None
+
+
+def node_dependencies(node: tuple) -> Tuple[tuple, ...]:
+    """Nodos de los que depende un nodo del grafo de indicadores"""
+    kind = node[0]
+    if kind == 'MACD':
+        return (('EMA', node[1]), ('EMA', node[2]))
+    if kind == 'BBands':
+        return (('SMA', node[1]), ('STD', node[1]))
+    return ()
+
+
+def _collect_nodes(programs) -> Tuple[tuple, ...]:
+    """Ordenar topológicamente los nodos usados por los programas"""
+    ordered = []
+    seen = set()
+
+    def visit(node):
+        if node in seen:
+            return
+        seen.add(node)
+        for dependency in node_dependencies(node):
+            visit(dependency)
+        ordered.append(node)
+
+    for program in programs:
+        for instruction in program:
+            if instruction.op == 'indicator':
+                visit(instruction.arg[0])
+
+    return tuple(ordered)
+
+
+def compile_strategy(strategy: Optional[Dict[str, List[Dict]]]) -> CompiledStrategy:
+    """
+    Compilar una estrategia de bloques en un plan inmutable
+
+    Args:
+        strategy: Configuración de la estrategia (bloques por zona)
+
+    Returns:
+        CompiledStrategy listo para ejecutar
+
+    Raises:
+        StrategyCompileError: si la estrategia está mal formada
+    """
+    if strategy is None:
+        strategy = {}
+    if not isinstance(strategy, dict):
+        raise StrategyCompileError("La estrategia debe ser un objeto con zonas")
+
+    zones = {}
+    for zone in ZONES:
+        blocks = strategy.get(zone)
+        if not blocks:
+            continue
+        if not isinstance(blocks, list):
+            raise StrategyCompileError(f"Zona '{zone}': se esperaba una lista de bloques")
+        try:
+            zones[zone] = compile_blocks(blocks)
+        except StrategyCompileError as e:
+            raise StrategyCompileError(f"Zona '{zone}': {e}") from None
+
+    return CompiledStrategy(zones)
+
+
+def compile_blocks(blocks: List[Dict]) -> Tuple[Instruction, ...]:
+    """
+    Compilar una secuencia de bloques (notación infija) a notación postfija
+
+    Soporta la forma infija del constructor visual
+    ([Valor, Operador, Valor, AND, Valor, Operador, Valor]) y la forma
+    postfija heredada para operadores lógicos ([Cond, Cond, AND]).
+    """
+    tokens = _merge_crosses([_compile_block(i, block) for i, block in enumerate(blocks)])
+
+    program: List[Instruction] = []
+    pending: List[Tuple[int, Instruction]] = []
+    depth = 0
+
+    def emit(instruction: Instruction):
+        nonlocal depth
+        if depth < instruction.arity:
+            raise StrategyCompileError(
+                f"'{instruction.name}' necesita {instruction.arity} valor(es) y hay {depth}"
+            )
+        depth += 1 - instruction.arity
+        program.append(instruction)
+
+    def flush(min_prec: int = 0):
+        while pending and pending[-1][0] >= min_prec:
+            emit(pending.pop()[1])
+
+    expect_operand = True
+    for i, token in enumerate(tokens):
+        next_token = tokens[i + 1] if i + 1 < len(tokens) else None
+        # Un operador sin operando a continuación se aplica en forma postfija
+        postfix = next_token is None or (next_token.arity > 0 and next_token.name != 'NOT')
+
+        if token.arity == 0:
+            if not expect_operand:
+                # Yuxtaposición heredada: empieza una nueva expresión
+                flush()
+            emit(token)
+            expect_operand = False
+
+        elif token.name == 'NOT':
+            if expect_operand:
+                pending.append((_PREC_NOT, token))
+            else:
+                flush()
+                emit(token)
+
+        else:
+            if expect_operand:
+                raise StrategyCompileError(f"'{token.name}' no tiene valor a la izquierda")
+            prec = _PREC_COMPARISON if token.op == 'compare' else _PREC_LOGIC
+            if postfix:
+                flush()
+                emit(token)
+            else:
+                flush(prec)
+                pending.append((prec, token))
+                expect_operand = True
+
+    if tokens and expect_operand:
+        raise StrategyCompileError("La expresión termina en un operador")
+    flush()
+
+    if depth < 1:
+        raise StrategyCompileError("La zona no produce ningún valor")
+
+    return tuple(program)
+
+
+def _compile_block(index: int, block: Dict) -> Instruction:
+    """Validar un bloque y convertirlo en instrucción"""
+    if not isinstance(block, dict):
+        raise StrategyCompileError(f"Bloque {index + 1}: formato inválido")
+
+    block_type = block.get('type', '')
+    name = block.get('name', '')
+    params = block.get('params') or {}
+    if not isinstance(params, dict):
+        raise StrategyCompileError(f"Bloque {index + 1}: parámetros inválidos")
+
+    if block_type == 'indicator':
+        if name not in INDICATOR_PARAMS:
+            raise StrategyCompileError(f"Bloque {index + 1}: indicador desconocido '{name}'")
+        normalized = _normalize_params(index, name, params)
+        return Instruction('indicator', name, params=MappingProxyType(normalized),
+                           arg=indicator_output(name, normalized))
+
+    if block_type == 'value':
+        if name == 'Price':
+            return Instruction('price', name)
+        if name == 'Number':
+            return Instruction('const', name, arg=_parse_number(index, params))
+        if name == 'Percentage':
+            return Instruction('percentage', name, arg=_parse_percentage(index, params))
+        raise StrategyCompileError(f"Bloque {index + 1}: valor desconocido '{name}'")
+
+    if block_type in COMPARISON_TYPES:
+        if name not in COMPARISON_OPERATORS:
+            raise StrategyCompileError(f"Bloque {index + 1}: comparador desconocido '{name}'")
+        if name in CROSS_OPERATORS:
+            return Instruction('compare', 'Crosses', arg=CROSS_OPERATORS[name], arity=2)
+        return Instruction('compare', name, arity=2)
+
+    if block_type in LOGIC_TYPES:
+        if name not in LOGIC_OPERATORS:
+            raise StrategyCompileError(f"Bloque {index + 1}: operador lógico desconocido '{name}'")
+        return Instruction('logic', name, arity=1 if name == 'NOT' else 2)
+
+    raise StrategyCompileError(f"Bloque {index + 1}: tipo de bloque desconocido '{block_type}'")
+
+
+def _merge_crosses(tokens: List[Instruction]) -> List[Instruction]:
+    """
+    Fusionar "Crosses" con el comparador que le sigue
+    Ejemplo: [MACD, Crosses, GreaterThan, Number] → [MACD, Crosses(above), Number]
+    """
+    merged = []
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token.op == 'compare' and token.name == 'Crosses' and token.arg is None:
+            following = tokens[i + 1] if i + 1 < len(tokens) else None
+            if following is not None and following.op == 'compare' and following.name in CROSS_DIRECTIONS:
+                merged.append(token._replace(arg=CROSS_DIRECTIONS[following.name]))
+                i += 2
+                continue
+        merged.append(token)
+        i += 1
+    return merged
+
+
+def find_param(params: Dict, name: str, aliases: Tuple[str, ...] = ()) -> Any:
+    """
+    Buscar un parámetro por nombre
+
+    El constructor visual guarda los parámetros con el id del input como clave
+    (ej: 'block_5_period'), por lo que también se aceptan claves con ese sufijo.
+    """
+    for key in (name,) + aliases:
+        if key in params:
+            return params[key]
+    for key in (name,) + aliases:
+        suffix = f"_{key}"
+        for param_key, value in params.items():
+            if param_key.endswith(suffix):
+                return value
+    return None
+
+
+def _normalize_params(index: int, name: str, params: Dict) -> Dict[str, Any]:
+    """Normalizar y validar los parámetros de un indicador"""
+    normalized = {}
+    for param_name, param_type, default, aliases in INDICATOR_PARAMS[name]:
+        raw = find_param(params, param_name, aliases)
+        if raw is None or raw == '':
+            normalized[param_name] = default
+            continue
+        try:
+            value = param_type(float(raw)) if param_type is int else param_type(raw)
+        except (TypeError, ValueError):
+            raise StrategyCompileError(
+                f"Bloque {index + 1}: parámetro '{param_name}' inválido para {name}: {raw!r}"
+            ) from None
+        if param_type is int and value < 1:
+            raise StrategyCompileError(
+                f"Bloque {index + 1}: '{param_name}' de {name} debe ser mayor que 0"
+            )
+        if param_name in PARAM_CHOICES and value not in PARAM_CHOICES[param_name]:
+            raise StrategyCompileError(
+                f"Bloque {index + 1}: '{param_name}' de {name} debe ser uno de {PARAM_CHOICES[param_name]}"
+            )
+        normalized[param_name] = value
+    return normalized
+
+
+def _parse_number(index: int, params: Dict) -> float:
+    """Valor de un bloque Number (acepta claves tipo 'block_2_value')"""
+    for key, val in params.items():
+        if 'value' in key.lower():
+            # Eliminar separadores de miles (puntos o comas)
+            val_str = str(val).replace('.', '').replace(',', '.')
+            try:
+                return float(val_str)
+            except ValueError:
+                pass
+    try:
+        return float(params.get('value', 0))
+    except (TypeError, ValueError):
+        raise StrategyCompileError(f"Bloque {index + 1}: número inválido") from None
+
+
+def _parse_percentage(index: int, params: Dict) -> float:
+    """Porcentaje de un bloque Percentage"""
+    raw = find_param(params, 'value')
+    if raw is None:
+        raw = 0
+    try:
+        return float(raw)
+    except (TypeError, ValueError):
+        raise StrategyCompileError(f"Bloque {index + 1}: porcentaje inválido: {raw!r}") from None
@@ -3,21 +3,31 @@ Strategy Evaluator
 Evalúa estrategias de trading basadas en bloques visuales
 """
 
-from typing import Dict, List, Any, Optional
+from typing import Dict, List, Any, Optional, Tuple
+import numpy as np
 import pandas as pd
 from market_data import MarketDataProvider
+from bot_logging import get_logger
+from indicator_cache import indicator_cache, snapshot_timestamp
+from strategy_compiler import (compile_strategy, node_dependencies, CompiledStrategy, Instruction,
+                               StrategyCompileError, ZONES)
+
+logger = get_logger('strategy_evaluator')
 
 class StrategyEvaluator:
     """Evaluador de estrategias de trading"""
     
     def __init__(self):
         self.market_data = MarketDataProvider()
-        self.indicator_cache = {}
+        self.indicator_cache = indicator_cache  # Compartido por todos los bots del proceso
     
     def evaluate_strategy(self, df: pd.DataFrame, strategy: Dict[str, List[Dict]], zone: str) -> bool:
         """
         Evaluar una zona de estrategia (entry_long, exit_long, entry_short, exit_short)
         
+        Compila la estrategia en cada llamada; en el loop de los bots usar
+        compile_strategy() una vez y execute_plan() en cada chequeo.
+        
         Args:
             df: DataFrame con datos de mercado
             strategy: Configuración de la estrategia
@@ -29,212 +39,301 @@ class StrategyEvaluator:
         if zone not in strategy or not strategy[zone]:
             return False
         
-        blocks = strategy[zone]
+        try:
+            plan = compile_strategy({zone: strategy[zone]})
+        except StrategyCompileError as e:
+            logger.warning("Error compiling strategy for zone %s: %s", zone, e)
+            return False
+        
+        return self.execute_plan(df, plan, zone)
+    
+    def evaluate_plan(self, df: pd.DataFrame, plan: CompiledStrategy,
+                      snapshot: Optional[Tuple[str, str, int]] = None) -> Dict[str, bool]:
+        """
+        Evaluar las cuatro zonas de una estrategia compilada
+        
+        Los indicadores del grafo del plan se calculan una sola vez y se
+        comparten entre entry_long, exit_long, entry_short y exit_short.
+        
+        Args:
+            df: DataFrame con datos de mercado
+            plan: Estrategia compilada con compile_strategy()
+            snapshot: (símbolo, timeframe, versión) del MarketDataService; si
+                se indica, los indicadores se comparten con otros bots del par
+        
+        Returns:
+            Diccionario {zona: resultado}
+        """
+        indicators = self.compute_indicators(df, plan, snapshot)
+        return {zone: self.execute_plan(df, plan, zone, indicators) for zone in ZONES}
+    
+    def execute_plan(self, df: pd.DataFrame, plan: CompiledStrategy, zone: str,
+                     indicators: Optional[Dict[tuple, Any]] = None) -> bool:
+        """
+        Ejecutar el plan compilado de una zona sobre los datos de mercado
+        
+        Args:
+            df: DataFrame con datos de mercado
+            plan: Estrategia compilada con compile_strategy()
+            zone: Zona a evaluar
+            indicators: Indicadores ya calculados (compute_indicators); si es
+                None se calculan los del plan
+        
+        Returns:
+            True si se cumple la condición, False en caso contrario
+        """
+        program = plan.get(zone)
+        if not program:
+            return False
         
-        # Evaluar la cadena de bloques
         try:
-            result = self._evaluate_blocks(df, blocks)
-            return bool(result)
+            if indicators is None:
+                indicators = self.compute_indicators(df, plan)
+            # Vela anterior y actual: suficiente para detectar cruces
+            result = self._run_program(df, program, indicators, window=2)
+            return bool(np.asarray(result).reshape(-1)[-1])
         except Exception as e:
-            print(f"Error evaluating strategy for zone {zone}: {e}")
+            logger.error("Error evaluating strategy for zone %s: %s", zone, e)
             return False
     
-    def _reorder_blocks_to_rpn(self, blocks: List[Dict]) -> List[Dict]:
+    def evaluate_plan_series(self, df: pd.DataFrame, plan: CompiledStrategy,
+                             snapshot: Optional[Tuple[str, str, int]] = None) -> Dict[str, np.ndarray]:
         """
-        Reordenar bloques de notación infija a postfija (RPN)
-        Ejemplo: [Value, Operator, Value] → [Value, Value, Operator]
-        """
-        result = []
-        i = 0
+        Evaluar las cuatro zonas sobre todas las velas (modo vectorizado)
         
-        while i < len(blocks):
-            block = blocks[i]
-            block_type = block.get('type', '')
-            
-            # Si es un operador de comparación y hay bloques antes y después
-            if (block_type in ['operator', 'comparison']) and i > 0 and i < len(blocks) - 1:
-                # Patrón: [Value, Operator, Value]
-                # Ya tenemos el value anterior en result, agregar el siguiente value primero
-                if i + 1 < len(blocks):
-                    result.append(blocks[i + 1])  # Agregar el value de la derecha
-                result.append(block)  # Luego agregar el operador
-                i += 2  # Saltar el siguiente value porque ya lo agregamos
-            else:
-                result.append(block)
-                i += 1
+        Cada zona devuelve un vector booleano con una posición por vela: el
+        valor en la vela t es el que habría obtenido un bot evaluando con los
+        datos disponibles hasta t (sin mirar al futuro). El último elemento
+        coincide con evaluate_plan().
         
-        return result
+        Args:
+            df: DataFrame con datos de mercado
+            plan: Estrategia compilada con compile_strategy()
+            snapshot: (símbolo, timeframe, versión) para usar el cache compartido
+        
+        Returns:
+            Diccionario {zona: np.ndarray de bool}
+        """
+        indicators = self.compute_indicators(df, plan, snapshot, full_series=True)
+        return {zone: self.execute_plan_series(df, plan, zone, indicators) for zone in ZONES}
     
-    def _evaluate_blocks(self, df: pd.DataFrame, blocks: List[Dict]) -> Any:
+    def execute_plan_series(self, df: pd.DataFrame, plan: CompiledStrategy, zone: str,
+                            indicators: Optional[Dict[tuple, Any]] = None) -> np.ndarray:
         """
-        Evaluar una secuencia de bloques
+        Ejecutar el plan de una zona sobre todas las velas
         
-        Los bloques se evalúan de forma secuencial:
-        - Indicadores: retornan valores numéricos
-        - Operadores de comparación: comparan dos valores
-        - Operadores lógicos: combinan condiciones booleanas
+        Returns:
+            Vector booleano (todo False si la zona no tiene bloques o falla)
         """
-        if not blocks:
-            print("⚠️ No blocks to evaluate")
-            return False
+        program = plan.get(zone)
+        if not program:
+            return np.zeros(len(df), dtype=bool)
         
-        print(f"🔍 Evaluating {len(blocks)} blocks...")
+        try:
+            if indicators is None:
+                indicators = self.compute_indicators(df, plan, full_series=True)
+            result = self._run_program(df, program, indicators)
+            return np.broadcast_to(np.asarray(result).astype(bool), (len(df),)).copy()
+        except Exception as e:
+            logger.error("Error evaluating strategy series for zone %s: %s", zone, e)
+            return np.zeros(len(df), dtype=bool)
+    
+    def compute_indicators(self, df: pd.DataFrame, plan: CompiledStrategy,
+                           snapshot: Optional[Tuple[str, str, int]] = None,
+                           full_series: bool = False) -> Dict[tuple, Any]:
+        """
+        Calcular los nodos del grafo de indicadores en orden topológico
         
-        # Reordenar bloques para notación postfija (RPN)
-        # Convertir [Value, Operator, Value] a [Value, Value, Operator]
-        reordered_blocks = self._reorder_blocks_to_rpn(blocks)
+        Con snapshot, los indicadores que el MarketDataService mantiene de
+        forma incremental se leen directamente (sin recalcular la serie) y el
+        resto se comparte entre bots a través del cache.
         
-        # Stack para evaluar expresiones
-        values = []
+        Args:
+            df: DataFrame con datos de mercado
+            plan: Estrategia compilada (se calculan plan.nodes)
+            snapshot: (símbolo, timeframe, versión) para usar el cache compartido
+            full_series: Si es True no se usan los valores incrementales
+                (historial corto) y todos los nodos son series completas
         
-        for i, block in enumerate(reordered_blocks):
-            block_type = block.get('type', '')
-            block_name = block.get('name', '')
-            params = block.get('params', {})
-            
-            print(f"  Block {i+1}: type='{block_type}', name='{block_name}', params={params}")
-            
-            if block_type == 'indicator':
-                # Calcular indicador
-                value = self._calculate_indicator(df, block_name, params)
-                print(f"    → Indicator value: {value}")
-                values.append(value)
-                
-            elif block_type == 'value':
-                # Valor constante (Price, Number, Percentage)
-                value = self._get_constant_value(df, block_name, params)
-                print(f"    → Constant value: {value}")
-                values.append(value)
-                
-            elif block_type == 'comparison' or block_type == 'operator':
-                # Operador de comparación (>, <, >=, <=, =, !=, Crosses)
-                # Acepta tanto 'comparison' como 'operator' para compatibilidad
-                if len(values) < 2:
-                    print(f"    ⚠️ Not enough values in stack (need 2, have {len(values)})")
+        Returns:
+            Diccionario {nodo: Series o dict de Series}; None si el cálculo falló
+        """
+        results = {}
+        if snapshot:
+            symbol, timeframe, version = snapshot
+            last_timestamp = snapshot_timestamp(df)
+        if snapshot and not full_series:
+            for node in plan.roots:
+                live = self.indicator_cache.get_live(symbol, timeframe, version, last_timestamp, node)
+                if live is not None:
+                    results[node] = live
+        
+        for node in self._pending_nodes(plan, results):
+            if snapshot:
+                cached = self.indicator_cache.get(symbol, timeframe, version, last_timestamp, node)
+                if cached is not None:
+                    results[node] = cached
                     continue
-                
-                right = values.pop()
-                left = values.pop()
-                print(f"    → Comparing: {left} {block_name} {right}")
-                result = self._compare_values(left, right, block_name)
-                print(f"    → Result: {result}")
-                values.append(result)
-                
-            elif block_type == 'logic':
-                # Operador lógico (AND, OR, NOT, XOR, NAND, NOR)
-                result = self._apply_logic_operator(values, block_name)
-                print(f"    → Logic result: {result}")
-                values.append(result)
+            try:
+                results[node] = self._compute_node(df, node, results)
+            except Exception as e:
+                logger.error("Error calculating indicator %s: %s", node, e)
+                results[node] = None
+            if snapshot:
+                self.indicator_cache.put(symbol, timeframe, version, last_timestamp, node, results[node])
+        return results
+    
+    def _pending_nodes(self, plan: CompiledStrategy, results: Dict[tuple, Any]) -> List[tuple]:
+        """
+        Nodos que falta calcular, en orden topológico
         
-        # Retornar el último valor evaluado
-        final_result = values[-1] if values else False
-        print(f"✅ Final result: {final_result} (values stack: {values})")
-        return final_result
+        Los valores incrementales son historiales cortos: no sirven como
+        dependencia, así que un nodo resuelto así no arrastra sus dependencias.
+        """
+        needed = set()
+        
+        def visit(node):
+            if node in needed:
+                return
+            needed.add(node)
+            for dependency in node_dependencies(node):
+                visit(dependency)
+        
+        for node in plan.roots:
+            if node not in results:
+                visit(node)
+        return [node for node in plan.nodes if node in needed]
     
-    def _calculate_indicator(self, df: pd.DataFrame, indicator_name: str, params: Dict) -> float:
-        """Calcular un indicador técnico"""
-        try:
-            if indicator_name == 'EMA':
-                period = int(params.get('period', 20))
-                ema = self.market_data.calculate_ema(df, period)
-                return float(ema.iloc[-1])
-            
-            elif indicator_name == 'SMA':
-                period = int(params.get('period', 20))
-                sma = self.market_data.calculate_sma(df, period)
-                return float(sma.iloc[-1])
+    def _compute_node(self, df: pd.DataFrame, node: tuple, results: Dict[tuple, Any]) -> Any:
+        """Calcular un nodo usando los resultados de sus dependencias"""
+        kind = node[0]
+        
+        if kind == 'EMA':
+            return self.market_data.calculate_ema(df, node[1])
+        
+        elif kind == 'SMA':
+            return self.market_data.calculate_sma(df, node[1])
+        
+        elif kind == 'STD':
+            return self.market_data.calculate_std(df, node[1])
+        
+        elif kind == 'RSI':
+            return self.market_data.calculate_rsi(df, node[1])
+        
+        elif kind == 'ATR':
+            return self.market_data.calculate_atr(df, node[1])
+        
+        elif kind == 'MACD':
+            # Reutiliza las EMAs del grafo (compartidas con bloques EMA)
+            _, fast, slow, signal = node
+            macd_line = results[('EMA', fast)] - results[('EMA', slow)]
+            signal_line = macd_line.ewm(span=signal, adjust=False).mean()
+            return {
+                'macd': macd_line,
+                'signal': signal_line,
+                'histogram': macd_line - signal_line
+            }
+        
+        elif kind == 'BBands':
+            _, period, std_dev = node
+            sma = results[('SMA', period)]
+            std = results[('STD', period)]
+            return {
+                'upper': sma + (std * std_dev),
+                'middle': sma,
+                'lower': sma - (std * std_dev)
+            }
+        
+        elif kind == 'Swing':
+            _, lookback, swing_type = node
+            if swing_type == 'high':
+                return self.market_data.find_swing_high(df, lookback)
+            return self.market_data.find_swing_low(df, lookback)
+        
+        raise ValueError(f"Unknown indicator node: {node}")
+    
+    def _indicator_series(self, instruction: Instruction, indicators: Dict[tuple, Any]) -> np.ndarray:
+        """Valores de un bloque de indicador en cada vela"""
+        node, component = instruction.arg
+        result = indicators.get(node)
+        if result is None:
+            return np.array(0.0)
+        
+        values = np.asarray(result[component] if component else result, dtype=float)
+        
+        if node[0] == 'Swing':
+            # Un swing se confirma `lookback` velas después: en la vela t solo
+            # se conocen los swings hasta t - lookback (el último válido o 0.0)
+            lookback = node[1]
+            known = np.full(len(values), np.nan)
+            if lookback < len(values):
+                known[lookback:] = values[:len(values) - lookback] if lookback > 0 else values
+            positions = np.where(np.isnan(known), 0, np.arange(len(known)))
+            np.maximum.accumulate(positions, out=positions)
+            last_swing = known[positions]
+            return np.where(np.isnan(last_swing), 0.0, last_swing)
+        
+        return values
+    
+    def _run_program(self, df: pd.DataFrame, program: Tuple[Instruction, ...],
+                     indicators: Dict[tuple, Any], window: Optional[int] = None) -> Any:
+        """
+        Ejecutar una secuencia de instrucciones en notación postfija
+        
+        Los valores son vectores con una posición por vela, lo que permite a
+        los comparadores como Crosses mirar la vela anterior. El compilador
+        ya validó la aridad de cada operador, por lo que el stack nunca se
+        queda sin valores.
+        
+        Args:
+            window: Evaluar solo las últimas `window` velas (None = todas)
+        """
+        values = []
+        close = self._tail(df['close'].to_numpy(dtype=float), window)
+        
+        for instruction in program:
+            op = instruction.op
             
-            elif indicator_name == 'RSI':
-                period = int(params.get('period', 14))
-                rsi = self.market_data.calculate_rsi(df, period)
-                return float(rsi.iloc[-1])
+            if op == 'indicator':
+                values.append(self._tail(self._indicator_series(instruction, indicators), window))
             
-            elif indicator_name == 'MACD':
-                fast = int(params.get('fast', 12))
-                slow = int(params.get('slow', 26))
-                signal = int(params.get('signal', 9))
-                macd_data = self.market_data.calculate_macd(df, fast, slow, signal)
-                
-                component = params.get('component', 'macd')  # macd, signal, histogram
-                return float(macd_data[component].iloc[-1])
+            elif op == 'const':
+                values.append(np.array(instruction.arg))
             
-            elif indicator_name == 'BBands':
-                period = int(params.get('period', 20))
-                std_dev = float(params.get('std_dev', 2))
-                bb_data = self.market_data.calculate_bollinger_bands(df, period, std_dev)
-                
-                band = params.get('band', 'middle')  # upper, middle, lower
-                return float(bb_data[band].iloc[-1])
+            elif op == 'price':
+                values.append(close)
             
-            elif indicator_name == 'ATR':
-                period = int(params.get('period', 14))
-                atr = self.market_data.calculate_atr(df, period)
-                return float(atr.iloc[-1])
+            elif op == 'percentage':
+                values.append(close * (instruction.arg / 100.0))
             
-            elif indicator_name == 'Swing':
-                lookback = int(params.get('lookback', 5))
-                swing_type = params.get('type', 'high')  # high or low
-                
-                if swing_type == 'high':
-                    swings = self.market_data.find_swing_high(df, lookback)
-                else:
-                    swings = self.market_data.find_swing_low(df, lookback)
-                
-                # Retornar el último swing válido
-                valid_swings = swings.dropna()
-                if len(valid_swings) > 0:
-                    return float(valid_swings.iloc[-1])
-                return 0.0
+            elif op == 'compare':
+                right = values.pop()
+                left = values.pop()
+                values.append(self._compare_values(left, right, instruction.name, instruction.arg))
             
-            else:
-                print(f"Unknown indicator: {indicator_name}")
-                return 0.0
-                
-        except Exception as e:
-            print(f"Error calculating indicator {indicator_name}: {e}")
-            return 0.0
+            elif op == 'logic':
+                values.append(self._apply_logic_series(values, instruction.name))
+        
+        # Retornar el último valor evaluado
+        return values[-1] if values else False
     
-    def _get_constant_value(self, df: pd.DataFrame, value_name: str, params: Dict) -> float:
-        """Obtener un valor constante"""
-        try:
-            if value_name == 'Price':
-                # Precio actual (close de la última vela)
-                return float(df['close'].iloc[-1])
-            
-            elif value_name == 'Number':
-                # Número fijo - buscar cualquier key que contenga "value"
-                # Puede ser 'value', 'block_2_value', 'block_8_value', etc.
-                for key, val in params.items():
-                    if 'value' in key.lower():
-                        # Eliminar separadores de miles (puntos o comas)
-                        val_str = str(val).replace('.', '').replace(',', '.')
-                        try:
-                            return float(val_str)
-                        except:
-                            pass
-                return float(params.get('value', 0))
-            
-            elif value_name == 'Percentage':
-                # Porcentaje del precio actual
-                for key, val in params.items():
-                    if 'value' in key.lower():
-                        percentage = float(val)
-                        current_price = float(df['close'].iloc[-1])
-                        return current_price * (percentage / 100.0)
-                percentage = float(params.get('value', 0))
-                current_price = float(df['close'].iloc[-1])
-                return current_price * (percentage / 100.0)
-            
-            else:
-                print(f"Unknown value type: {value_name}")
-                return 0.0
-                
-        except Exception as e:
-            print(f"Error getting constant value {value_name}: {e}")
-            return 0.0
+    @staticmethod
+    def _tail(values: np.ndarray, window: Optional[int]) -> np.ndarray:
+        """Últimas `window` posiciones (rellenando con NaN si faltan velas)"""
+        if window is None or values.ndim == 0:
+            return values
+        if len(values) >= window:
+            return values[-window:]
+        return np.concatenate((np.full(window - len(values), np.nan), values))
     
-    def _compare_values(self, left: float, right: float, operator: str) -> bool:
-        """Comparar dos valores"""
+    def _compare_values(self, left: Any, right: Any, operator: str, direction: Optional[str] = None) -> Any:
+        """
+        Comparar dos valores (escalares o vectores por vela)
+        
+        Crosses compara la vela anterior con la actual: 'above' cuando left
+        pasa a estar por encima de right, 'below' cuando pasa por debajo y
+        sin dirección en cualquiera de los dos sentidos.
+        """
         try:
             if operator == 'GreaterThan':
                 return left > right
@@ -256,69 +355,60 @@ class StrategyEvaluator:
                 return abs(left - right) >= 0.0001
             
             elif operator == 'Crosses':
-                # Cruce: necesitaríamos valores históricos para detectarlo
-                # Por ahora, simplificado: left > right
-                return left > right
+                return self._crosses(left, right, direction)
             
             else:
-                print(f"Unknown comparison operator: {operator}")
+                logger.warning("Unknown comparison operator: %s", operator)
                 return False
                 
         except Exception as e:
-            print(f"Error comparing values: {e}")
+            logger.error("Error comparing values: %s", e)
             return False
     
-    def _apply_logic_operator(self, values: List[Any], operator: str) -> bool:
-        """Aplicar operador lógico"""
-        try:
-            if operator == 'AND':
-                if len(values) < 2:
-                    return False
-                right = bool(values.pop())
-                left = bool(values.pop())
-                return left and right
-            
-            elif operator == 'OR':
-                if len(values) < 2:
-                    return False
-                right = bool(values.pop())
-                left = bool(values.pop())
-                return left or right
-            
-            elif operator == 'NOT':
-                if len(values) < 1:
-                    return False
-                value = bool(values.pop())
-                return not value
-            
-            elif operator == 'XOR':
-                if len(values) < 2:
-                    return False
-                right = bool(values.pop())
-                left = bool(values.pop())
-                return left != right
-            
-            elif operator == 'NAND':
-                if len(values) < 2:
-                    return False
-                right = bool(values.pop())
-                left = bool(values.pop())
-                return not (left and right)
-            
-            elif operator == 'NOR':
-                if len(values) < 2:
-                    return False
-                right = bool(values.pop())
-                left = bool(values.pop())
-                return not (left or right)
-            
-            else:
-                print(f"Unknown logic operator: {operator}")
-                return False
-                
-        except Exception as e:
-            print(f"Error applying logic operator: {e}")
-            return False
+    @staticmethod
+    def _crosses(left: Any, right: Any, direction: Optional[str]) -> np.ndarray:
+        """Cruce entre la vela anterior y la actual (False en la primera vela)"""
+        left, right = np.broadcast_arrays(np.asarray(left, dtype=float), np.asarray(right, dtype=float))
+        if left.ndim == 0:
+            # Dos constantes nunca se cruzan
+            return np.array(False)
+        
+        crossed = np.zeros(left.shape, dtype=bool)
+        if direction in (None, 'above'):
+            crossed[1:] |= (left[1:] > right[1:]) & (left[:-1] <= right[:-1])
+        if direction in (None, 'below'):
+            crossed[1:] |= (left[1:] < right[1:]) & (left[:-1] >= right[:-1])
+        return crossed
+    
+    def _apply_logic_series(self, values: List[Any], operator: str) -> np.ndarray:
+        """
+        Aplicar operador lógico a vectores
+        
+        Cualquier valor distinto de cero cuenta como verdadero; si faltan
+        operandos el resultado es False.
+        """
+        arity = 1 if operator == 'NOT' else 2
+        if len(values) < arity:
+            return np.array(False)
+        
+        right = np.asarray(values.pop()).astype(bool)
+        if operator == 'NOT':
+            return ~right
+        left = np.asarray(values.pop()).astype(bool)
+        
+        if operator == 'AND':
+            return left & right
+        elif operator == 'OR':
+            return left | right
+        elif operator == 'XOR':
+            return left != right
+        elif operator == 'NAND':
+            return ~(left & right)
+        elif operator == 'NOR':
+            return ~(left | right)
+        
+        logger.warning("Unknown logic operator: %s", operator)
+        return np.array(False)
     
     def generate_signal_message(self, symbol: str, signal_type: str, price: float, strategy_info: str = "") -> str:
         """Generar mensaje de señal para Telegram"""
@@ -6,6 +6,8 @@ Envía mensajes y señales a canales/grupos de Telegram
 import requests
 from typing import Optional
 
+from http_client import http_client
+
 class TelegramSender:
     """Manejador de envío de mensajes a Telegram"""
     
@@ -43,7 +45,7 @@ class TelegramSender:
                 'disable_notification': disable_notification
             }
             
-            response = requests.post(url, json=payload, timeout=10)
+            response = http_client.post(url, json=payload)
             response.raise_for_status()
             
             result = response.json()
@@ -85,7 +87,7 @@ class TelegramSender:
                 payload['caption'] = caption
                 payload['parse_mode'] = 'HTML'
             
-            response = requests.post(url, json=payload, timeout=10)
+            response = http_client.post(url, json=payload)
             response.raise_for_status()
             
             result = response.json()
@@ -114,7 +116,7 @@ class TelegramSender:
         try:
             # Primero verificar que el bot token sea válido
             url = f"{self.base_url}/getMe"
-            response = requests.get(url, timeout=5)
+            response = http_client.get(url, timeout=5)
             response.raise_for_status()
             
             result = response.json()
@@ -0,0 +1,87 @@
+"""
+Tests del limitador de peso de Binance
+Verifica el presupuesto por minuto, la prioridad de los bots y la sincronización con los headers
+"""
+
+import threading
+import time
+
+import pytest
+
+from binance_rate_limiter import (PRIORITY_BACKTEST, PRIORITY_LIVE, binance_rate_limiter,
+                                  endpoint_weight)
+
+
+@pytest.fixture
+def limiter():
+    binance_rate_limiter.configure(600, safety=1.0, backtest_share=0.5)  # 10 de peso por segundo
+    yield binance_rate_limiter
+    binance_rate_limiter.configure(6000)
+
+
+def test_budget_blocks_until_weight_recovers(limiter):
+    assert endpoint_weight('klines') == 2 and endpoint_weight('/api/v3/exchangeInfo') == 20
+
+    assert limiter.acquire(600)
+    assert not limiter.acquire(2, timeout=0.05)
+
+    started = time.monotonic()
+    assert limiter.acquire(2)
+    assert 0.1 <= time.monotonic() - started < 1
+    stats = limiter.get_stats()
+    assert stats['requests'] == 2 and stats['weight'] == 602 and stats['waits'] == 1
+
+
+def test_backtest_keeps_reserve_and_yields_to_live(limiter):
+    # Las descargas de backtest solo usan la mitad del presupuesto
+    assert limiter.acquire(300, PRIORITY_BACKTEST)
+    assert not limiter.acquire(10, PRIORITY_BACKTEST, timeout=0.05)
+    assert limiter.acquire(290, PRIORITY_LIVE)
+
+    # Con el presupuesto agotado, el bot que espera pasa antes que la descarga
+    limiter.configure(600, safety=1.0, backtest_share=1.0)
+    assert limiter.acquire(600)
+    order = []
+    backtest = threading.Thread(target=lambda: limiter.acquire(5, PRIORITY_BACKTEST) and order.append('backtest'))
+    live = threading.Thread(target=lambda: limiter.acquire(5, PRIORITY_LIVE) and order.append('live'))
+    live.start()
+    time.sleep(0.02)
+    backtest.start()
+    live.join(timeout=5)
+    assert order == ['live']
+    backtest.join(timeout=5)
+    assert order == ['live', 'backtest']
+
+
+def test_headers_sync_used_weight_and_bans(limiter):
+    limiter.update_from_headers({'X-MBX-USED-WEIGHT-1M': '500'}, 200)
+    stats = limiter.get_stats()
+    assert stats['server_used_weight'] == 500 and stats['available'] <= 101
+
+    limiter.update_from_headers({'x-mbx-used-weight-1m': '600', 'Retry-After': '0.2'}, 429)
+    assert limiter.get_stats()['bans'] == 1
+    assert not limiter.acquire(1, timeout=0.1)
+    assert limiter.acquire(1, timeout=1)
+
+
+def test_service_fetches_go_through_the_limiter(limiter, monkeypatch):
+    from market_data_service import market_data_service as service
+    from test_market_data_service import fake_klines
+
+    class Response:
+        status_code = 200
+        headers = {'X-MBX-USED-WEIGHT-1M': '42'}
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return fake_klines(10)
+
+    from http_client import http_client
+
+    monkeypatch.setattr(http_client, 'get', lambda url, params=None, timeout=None: Response())
+    assert len(service._fetch_from_binance('LIMUSDT', '1m', limit=10)) == 10
+
+    stats = service.get_stats()['rate_limit']
+    assert stats['requests'] == 1 and stats['weight'] == 2 and stats['server_used_weight'] == 42
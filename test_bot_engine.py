@@ -0,0 +1,361 @@
+"""
+Tests del motor de bots
+Verifica la evaluación en lote de los bots de un par tras cada actualización
+"""
+
+import pytest
+
+from bot_engine import BotEngine
+from strategy_compiler import compile_strategy
+from market_data import MarketDataProvider
+from market_data_service import market_data_service
+from telegram_sender import TelegramSender
+from test_strategy_compiler import make_df, block
+
+SYMBOL, TIMEFRAME = 'TESTUSDT', '15m'
+
+
+def bot_config(bot_id, strategy):
+    return {
+        'id': bot_id, 'name': bot_id, 'bot_token': 'token', 'chat_id': 'chat',
+        'symbol': SYMBOL, 'timeframe': TIMEFRAME, 'check_interval': 60,
+        'strategy': strategy,
+    }
+
+
+@pytest.fixture
+def sent(monkeypatch):
+    """Mensajes de Telegram enviados (sin red)"""
+    messages = []
+    monkeypatch.setattr(TelegramSender, 'send_message',
+                        lambda self, text, *args, **kwargs: messages.append((self.chat_id, text)) or True)
+    return messages
+
+
+@pytest.fixture
+def engine():
+    engine = BotEngine(batch_evaluation=True)
+    yield engine
+    engine.stop_all_bots()
+    market_data_service.remove_refresh_listener(engine._on_refresh)
+    for bot_id in ('bot_901', 'bot_902'):
+        market_data_service.unsubscribe(bot_id, SYMBOL, TIMEFRAME)
+
+
+def refresh(df):
+    key = (SYMBOL, TIMEFRAME)
+    version = market_data_service._store(key, df)
+    market_data_service._notify_refresh(key, df, version)
+
+
+def settle(engine, timeout=5):
+    """Esperar a que el pool de chequeos termine los lotes pendientes"""
+    import time
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        jobs = [engine.scheduler.jobs.get(key) for key in engine.batch_jobs]
+        if not engine.batch_snapshots and not any(job and job.running for job in jobs):
+            return
+        time.sleep(0.01)
+
+
+def test_refresh_evaluates_every_bot_of_the_pair_once(engine, sent, monkeypatch):
+    calls = []
+    original = MarketDataProvider.calculate_rsi
+    monkeypatch.setattr(MarketDataProvider, 'calculate_rsi',
+                        lambda self, *args: calls.append(args) or original(self, *args))
+
+    strategy = {'entry_long': [
+        block('indicator', 'RSI', period='14'), block('operator', 'GreaterThan'),
+        block('value', 'Number', value='0'),
+    ]}
+    assert engine.start_bot(bot_config('bot_901', strategy))
+    assert engine.start_bot(bot_config('bot_902', strategy))
+    assert all(bot_id not in engine.scheduler.jobs for bot_id in engine.bots)
+
+    df = make_df(200)
+    refresh(df)
+    settle(engine)
+
+    signals = [text for _, text in sent if 'SEÑAL' in text]
+    assert len(signals) == 2
+    # Indicador calculado como mucho una vez para los dos bots (incremental o cache)
+    assert len(calls) <= 1
+    assert all(bot.last_check is not None for bot in engine.bots.values())
+
+    # Con posición abierta, la siguiente actualización no repite la señal
+    refresh(df)
+    settle(engine)
+    assert len([text for _, text in sent if 'SEÑAL' in text]) == 2
+
+
+def test_batch_evaluation_does_not_block_the_data_thread(engine, sent, monkeypatch):
+    import time
+
+    monkeypatch.setattr(TelegramSender, 'send_message',
+                        lambda self, text, *args, **kwargs: time.sleep(0.5) or sent.append((self.chat_id, text)) or True)
+    strategy = {'entry_long': [block('value', 'Price'), block('operator', 'GreaterThan'),
+                               block('value', 'Number', value='0')]}
+    assert engine.start_bot(bot_config('bot_901', strategy))
+
+    # Telegram lento: el listener vuelve sin esperar a la evaluación ni al envío
+    started = time.perf_counter()
+    refresh(make_df(100))
+    assert time.perf_counter() - started < 0.3
+    settle(engine)
+    assert len([text for _, text in sent if 'SEÑAL' in text]) == 1
+
+
+def test_refresh_ignores_other_pairs(engine, sent):
+    strategy = {'entry_long': [block('value', 'Price'), block('operator', 'GreaterThan'),
+                               block('value', 'Number', value='0')]}
+    engine.start_bot(bot_config('bot_901', strategy))
+
+    engine._on_refresh('OTHERUSDT', TIMEFRAME, make_df(50), 1)
+    settle(engine)
+    assert not [text for _, text in sent if 'SEÑAL' in text]
+
+
+def test_scheduled_bot_wakes_on_push_and_skips_unchanged_data(sent, monkeypatch):
+    import time
+    from bot_engine import TradingBot
+
+    monkeypatch.setattr(TradingBot, '_update_stats', lambda self: None)
+    evaluated = []
+    original = TradingBot._evaluate_snapshot
+    monkeypatch.setattr(TradingBot, '_evaluate_snapshot',
+                        lambda self, df, version: evaluated.append(version) or original(self, df, version))
+
+    strategy = {'entry_long': [block('value', 'Price'), block('operator', 'GreaterThan'),
+                               block('value', 'Number', value='0')]}
+    bot = TradingBot(dict(bot_config('bot_903', strategy), check_interval=0))
+    bot.start()
+    try:
+        df = make_df(100)
+        for _ in range(2):
+            refresh(df)
+            deadline = time.time() + 5
+            while bot.last_version != market_data_service.get_version(SYMBOL, TIMEFRAME) and time.time() < deadline:
+                time.sleep(0.01)
+
+        # Una evaluación por versión publicada, sin chequeos periódicos intermedios
+        assert evaluated == [bot.last_version - 1, bot.last_version]
+    finally:
+        bot.stop()
+    assert 'bot_903' not in bot.scheduler.jobs
+    assert 'bot_903' not in market_data_service.subscribers.get((SYMBOL, TIMEFRAME), [])
+
+
+def test_check_interval_is_the_minimum_time_between_evaluations(sent, monkeypatch):
+    import time
+    from bot_engine import TradingBot
+
+    monkeypatch.setattr(TradingBot, '_update_stats', lambda self: None)
+    evaluated = []
+    original = TradingBot._evaluate_snapshot
+    monkeypatch.setattr(TradingBot, '_evaluate_snapshot',
+                        lambda self, df, version: evaluated.append(version) or original(self, df, version))
+
+    strategy = {'entry_long': [block('value', 'Price'), block('operator', 'GreaterThan'),
+                               block('value', 'Number', value='0')]}
+    bot = TradingBot(dict(bot_config('bot_904', strategy), check_interval=0.5))
+    df = make_df(100)
+    refresh(df)
+    bot.start()
+    try:
+        deadline = time.time() + 5
+        while not evaluated and time.time() < deadline:
+            time.sleep(0.01)
+        # Versiones de la vela en formación antes de cumplirse el intervalo: no se evalúan una por una
+        for _ in range(5):
+            refresh(df)
+            time.sleep(0.02)
+        assert len(evaluated) == 1
+
+        latest = market_data_service.get_version(SYMBOL, TIMEFRAME)
+        while bot.last_version != latest and time.time() < deadline:
+            time.sleep(0.01)
+        # Al cumplirse el intervalo se evalúa una vez, con la última versión
+        assert evaluated[1:] == [latest]
+        assert any('como máximo una vez cada 0.5s' in text for _, text in sent)
+    finally:
+        bot.stop()
+
+
+def test_engine_runs_bots_without_a_thread_per_bot_and_stops_them_at_once(sent, monkeypatch):
+    import threading
+    import time
+    from bot_engine import BOT_NOTIFY_WORKERS, TradingBot
+
+    monkeypatch.setattr(TradingBot, '_update_stats', lambda self: None)
+    monkeypatch.setattr(market_data_service, '_start_worker', lambda symbol, timeframe: None)
+    engine = BotEngine(batch_evaluation=False)
+    strategy = {'entry_long': [block('value', 'Price'), block('operator', 'GreaterThan'),
+                               block('value', 'Number', value='0')]}
+    bot_ids = [f'bot_{950 + i}' for i in range(30)]
+    threads_before = threading.active_count()
+    try:
+        for bot_id in bot_ids:
+            assert engine.start_bot(dict(bot_config(bot_id, strategy), check_interval=0))
+        refresh(make_df(100))
+        version = market_data_service.get_version(SYMBOL, TIMEFRAME)
+        deadline = time.time() + 5
+        while (any(bot.last_version != version for bot in engine.bots.values())
+               or engine.get_stats()['scheduler']['idle'] < 30) and time.time() < deadline:
+            time.sleep(0.01)
+        assert all(bot.last_version == version for bot in engine.bots.values())
+        # Pool de chequeos + despachador + pool de mensajes de inicio
+        assert threading.active_count() - threads_before <= engine.scheduler.max_workers + 1 + BOT_NOTIFY_WORKERS
+
+        stats = engine.get_stats()
+        assert stats['active_bots'] == 30 and stats['scheduler']['idle'] >= 30
+
+        started = time.perf_counter()
+        assert engine.stop_bot(bot_ids[0])
+        assert time.perf_counter() - started < 1
+        assert bot_ids[0] not in engine.scheduler.jobs
+    finally:
+        engine.stop_all_bots()
+    assert not any(bot_id in engine.scheduler.jobs for bot_id in bot_ids)
+    assert not market_data_service.subscribers.get((SYMBOL, TIMEFRAME))
+
+
+def test_restart_restores_positions_and_does_not_repeat_entry_signals(sent, tmp_path, monkeypatch):
+    import json
+    import database
+    from bot_engine import POSITION_LONG
+
+    monkeypatch.setattr(database, 'DB_FILE', tmp_path / 'bots.db')
+    monkeypatch.setattr(market_data_service, '_start_worker', lambda symbol, timeframe: None)
+    conn = database.get_db_connection()
+    conn.execute('''
+        CREATE TABLE signal_bots (id INTEGER PRIMARY KEY, name TEXT, bot_token TEXT, chat_id TEXT, symbol TEXT,
+                                  timeframe TEXT, check_interval INTEGER, strategy TEXT, status TEXT,
+                                  ignore_position_tracking INTEGER DEFAULT 0, signals_sent INTEGER DEFAULT 0,
+                                  uptime INTEGER DEFAULT 0, last_signal REAL, last_signal_text TEXT)
+    ''')
+    conn.execute('CREATE TABLE bot_signals (bot_id INTEGER, signal_type TEXT, signal_text TEXT, created_at TEXT)')
+    conn.commit()
+    # Base anterior a position_state: la migración corre al inicializar (dos veces sin error)
+    database.init_database()
+    database.init_database()
+
+    strategy = {'entry_long': [block('value', 'Price'), block('operator', 'GreaterThan'),
+                               block('value', 'Number', value='0')],
+                'exit_long': [block('value', 'Price'), block('operator', 'LessThan'),
+                              block('value', 'Number', value='0')]}
+    conn.execute('''
+        INSERT INTO signal_bots (id, name, bot_token, chat_id, symbol, timeframe, check_interval, strategy,
+                                 status, position_state, last_signal_type)
+        VALUES (904, 'restored', 'token', 'chat', ?, ?, 60, ?, 'active', ?, 'ENTRY_LONG')
+    ''', (SYMBOL, TIMEFRAME, json.dumps(strategy), POSITION_LONG))
+    conn.commit()
+
+    engine = BotEngine(batch_evaluation=True)
+    try:
+        assert engine.load_active_bots() == 1
+        bot = engine.bots['bot_904']
+        assert bot.in_long_position and bot.last_signal_type == 'ENTRY_LONG'
+
+        # La posición ya estaba abierta antes del reinicio: sin señal de entrada repetida
+        refresh(make_df(100))
+        settle(engine)
+        assert not [text for _, text in sent if 'SEÑAL' in text]
+
+        # La salida cambia el estado guardado en la misma escritura de la señal
+        bot.plan = compile_strategy({'exit_long': strategy['entry_long']})
+        refresh(make_df(101))
+        settle(engine)
+        assert len([text for _, text in sent if 'SEÑAL' in text]) == 1
+        row = conn.execute('SELECT position_state, last_signal_type FROM signal_bots WHERE id = 904').fetchone()
+        assert tuple(row) == (0, 'EXIT_LONG')
+    finally:
+        engine.stop_all_bots()
+        market_data_service.remove_refresh_listener(engine._on_refresh)
+        conn.close()
+
+
+def test_bulk_start_compiles_once_per_strategy_and_waits_for_pair_data(sent, monkeypatch):
+    import time
+    import bot_engine
+    from bot_engine import TradingBot
+
+    compiled = []
+    monkeypatch.setattr(bot_engine, 'BOT_STARTUP_SPREAD', 2)
+    monkeypatch.setattr(bot_engine, 'compile_strategy', lambda strategy: compiled.append(strategy) or compile_strategy(strategy))
+    started_workers = []
+    monkeypatch.setattr(market_data_service, '_start_worker', lambda symbol, timeframe: started_workers.append(symbol))
+    monkeypatch.setattr(TradingBot, '_update_stats', lambda self: None)
+    # Mensajes de inicio lentos: no deben retrasar el arranque
+    monkeypatch.setattr(TelegramSender, 'send_message',
+                        lambda self, text, *args, **kwargs: time.sleep(0.01) or sent.append((self.chat_id, text)) or True)
+
+    strategies = [{'entry_long': [block('value', 'Price'), block('operator', 'GreaterThan'),
+                                  block('value', 'Number', value=str(value))]} for value in (0, 1)]
+    configs = [dict(bot_config(f'bot_{2000 + i}', strategies[i % 2]),
+                    symbol=SYMBOL if i % 2 else 'BULKUSDT') for i in range(1000)]
+    configs.append(bot_config('bot_3000', {'entry_long': [block('operator', 'GreaterThan')]}))
+
+    engine = BotEngine(batch_evaluation=False)
+    try:
+        started = time.perf_counter()
+        assert engine.start_bots(configs) == 1000
+        assert time.perf_counter() - started < 5
+        assert len(compiled) == 3 and sorted(started_workers) == ['BULKUSDT', SYMBOL]
+
+        # Sin datos del par: ningún chequeo hasta la primera descarga
+        time.sleep(0.1)
+        assert all(bot.iterations == 0 for bot in engine.bots.values())
+
+        refresh(make_df(100))
+        deadline = time.time() + 10
+        pair_bots = [bot for bot in engine.bots.values() if bot.symbol == SYMBOL]
+        while any(bot.last_check is None for bot in pair_bots) and time.time() < deadline:
+            time.sleep(0.01)
+        assert all(bot.iterations == 1 for bot in pair_bots)
+        assert all(bot.iterations == 0 for bot in engine.bots.values() if bot.symbol == 'BULKUSDT')
+        # Arranque en frío: los chequeos se reparten desde la llegada de los datos, no todos juntos
+        first_checks = sorted(bot.last_check for bot in pair_bots)
+        assert (first_checks[-1] - first_checks[0]).total_seconds() > 1.5
+    finally:
+        engine.stop_all_bots()
+        for config in configs:
+            market_data_service.unsubscribe(config['id'], config['symbol'], config['timeframe'])
+
+
+def test_activation_starts_the_bot_with_its_stored_positions(tmp_path, monkeypatch):
+    import json
+    import database
+    import signal_bot_routes
+    from flask import Flask
+    from bot_engine import POSITION_SHORT
+
+    monkeypatch.setattr(database, 'DB_FILE', tmp_path / 'bots.db')
+    conn = database.get_db_connection()
+    conn.execute('''
+        CREATE TABLE signal_bots (id INTEGER PRIMARY KEY, user_id INTEGER, name TEXT, bot_token TEXT, chat_id TEXT,
+                                  symbol TEXT, timeframe TEXT, check_interval INTEGER, strategy TEXT, status TEXT,
+                                  ignore_position_tracking INTEGER DEFAULT 0)
+    ''')
+    conn.commit()
+    database.init_database()
+    conn.execute('''
+        INSERT INTO signal_bots (id, user_id, name, bot_token, chat_id, symbol, timeframe, check_interval, strategy,
+                                 status, ignore_position_tracking, position_state, last_signal_type)
+        VALUES (905, 7, 'paused', 'token', 'chat', ?, ?, 60, ?, 'paused', 1, ?, 'ENTRY_SHORT')
+    ''', (SYMBOL, TIMEFRAME, json.dumps({}), POSITION_SHORT))
+    conn.commit()
+    conn.close()
+
+    started = []
+    monkeypatch.setattr(signal_bot_routes.bot_engine, 'start_bot', lambda config: started.append(config) or True)
+    app = Flask(__name__)
+    app.secret_key = 'test'
+    app.register_blueprint(signal_bot_routes.signal_bot_bp)
+    client = app.test_client()
+    with client.session_transaction() as flask_session:
+        flask_session['user_id'] = 7
+
+    assert client.post('/api/signal-bots/activate/bot_905').status_code == 200
+    assert started[0]['position_state'] == POSITION_SHORT
+    assert started[0]['last_signal_type'] == 'ENTRY_SHORT' and started[0]['ignore_position_tracking']
@@ -0,0 +1,112 @@
+"""
+Tests del dueño único del motor de bots
+Verifica el lease en SQLite y los comandos reenviados por la tabla
+"""
+
+import threading
+import time
+
+import pytest
+
+import database
+from bot_engine import BotEngine, TradingBot
+from bot_engine_owner import EngineLease, EngineOwner, RemoteBotEngine
+from market_data_service import market_data_service
+from telegram_sender import TelegramSender
+
+
+@pytest.fixture
+def db_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, 'DB_FILE', tmp_path / 'engine.db')
+
+
+def test_lease_has_a_single_owner_until_it_expires(db_file):
+    first, second = EngineLease('web-1', ttl=0.3), EngineLease('web-2', ttl=0.3)
+    assert first.acquire() and first.acquire()
+    assert not second.acquire()
+    assert second.holder() == 'web-1'
+
+    time.sleep(0.4)
+    assert second.holder() is None
+    assert second.acquire()
+    assert not first.acquire()
+
+    first.release()  # No es suyo: no lo libera
+    assert first.holder() == 'web-2'
+    second.release()
+    assert first.holder() is None
+
+
+def test_web_worker_commands_run_in_the_lease_owner(db_file, monkeypatch):
+    monkeypatch.setattr(market_data_service, '_start_worker', lambda symbol, timeframe: None)
+    monkeypatch.setattr(TradingBot, '_update_stats', lambda self: None)
+    monkeypatch.setattr(TelegramSender, 'send_message', lambda self, text, *args, **kwargs: True)
+    monkeypatch.setattr(BotEngine, 'load_active_bots', lambda self: 0)
+
+    engines = []
+    owner = EngineOwner(engine_factory=lambda: engines.append(BotEngine(batch_evaluation=False)) or engines[-1],
+                        lease=EngineLease('engine', ttl=1), poll_interval=0.02)
+    thread = threading.Thread(target=owner.run, daemon=True)
+    thread.start()
+    web = RemoteBotEngine(lease=EngineLease('web'), timeout=5)
+    config = {'id': 'bot_990', 'name': 'remote', 'bot_token': 'token', 'chat_id': 'chat',
+              'symbol': 'OWNUSDT', 'timeframe': '1h', 'check_interval': 3600, 'strategy': {}}
+    try:
+        deadline = time.time() + 5
+        while not engines and time.time() < deadline:
+            time.sleep(0.01)
+
+        assert web.start_bot(config)
+        assert 'bot_990' in engines[0].bots and not web.bots
+        assert web.get_bot_status('bot_990')['name'] == 'remote'
+        assert web.get_bot_status('bot_missing') is None
+        stats = web.get_stats()
+        assert stats['owner'] == 'engine' and stats['active_bots'] == 1
+        assert web.stop_bot('bot_990')
+        assert not engines[0].bots
+    finally:
+        owner.stop_event.set()
+        thread.join(timeout=5)
+
+    # Sin dueño el worker web no espera al timeout
+    started = time.monotonic()
+    assert web.get_bot_status('bot_990') is None
+    assert time.monotonic() - started < 1
+    assert web.get_stats() == {'active_bots': 0, 'mode': 'local', 'owner': None}
+
+
+def test_owner_renews_during_slow_work_and_steps_down_when_the_lease_is_taken(db_file, monkeypatch):
+    monkeypatch.setattr(BotEngine, 'load_active_bots', lambda self: time.sleep(0.6) or 0)
+
+    engines = []
+    owner = EngineOwner(engine_factory=lambda: engines.append(BotEngine(batch_evaluation=False)) or engines[-1],
+                        lease=EngineLease('engine', ttl=0.3), poll_interval=0.02)
+    thread = threading.Thread(target=owner.run, daemon=True)
+    thread.start()
+    rival = EngineLease('rival', ttl=0.3)
+    try:
+        deadline = time.time() + 5
+        while not engines and time.time() < deadline:
+            time.sleep(0.01)
+        # La carga de los bots tarda el doble del ttl: el lease se sigue renovando
+        loading_until = time.time() + 0.5
+        while time.time() < loading_until:
+            assert not rival.acquire()
+            time.sleep(0.05)
+        while owner.engine is None and time.time() < deadline:
+            time.sleep(0.01)
+        assert owner.engine is engines[0]
+
+        # Otro proceso se queda con el lease: el dueño baja el motor sin esperar al loop de comandos
+        conn = database.get_db_connection()
+        conn.execute("UPDATE bot_engine_lease SET owner = 'rival', expires_at = ?", (time.time() + 60,))
+        conn.commit()
+        conn.close()
+        deadline = time.time() + 2
+        while owner.engine is not None and time.time() < deadline:
+            time.sleep(0.01)
+        assert owner.engine is None and not owner.holds_lease()
+    finally:
+        owner.stop_event.set()
+        thread.join(timeout=5)
+    assert rival.holder() == 'rival'
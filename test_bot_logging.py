@@ -0,0 +1,67 @@
+"""
+Tests del logging de bots
+Verifica niveles, formateo perezoso, muestreo y la traza por bot
+"""
+
+import logging
+
+import pytest
+
+from bot_logging import BotLogger
+
+
+@pytest.fixture(autouse=True)
+def restore_level():
+    yield
+    logging.getLogger('draglab.bot').setLevel(logging.NOTSET)
+
+
+class CountingValue:
+    """Cuenta cuántas veces se formatea"""
+
+    def __init__(self):
+        self.formatted = 0
+
+    def __str__(self):
+        self.formatted += 1
+        return 'value'
+
+
+def test_disabled_levels_are_not_formatted():
+    log = BotLogger('bot_1', 'Test')
+    log.logger.setLevel(logging.INFO)
+    value = CountingValue()
+
+    log.debug("debug %s", value)
+    assert value.formatted == 0
+
+
+def test_sampled_messages_emit_one_in_n(caplog):
+    log = BotLogger('bot_1', 'Test', sample_every=5)
+    log.logger.setLevel(logging.INFO)
+
+    with caplog.at_level(logging.INFO, logger='draglab.bot'):
+        for i in range(12):
+            log.sampled('iteration', logging.INFO, "Iteration #%d", i)
+
+    assert [r.getMessage() for r in caplog.records] == [
+        '[Test] Iteration #0', '[Test] Iteration #5', '[Test] Iteration #10',
+    ]
+
+
+def test_trace_records_everything_in_a_bounded_buffer():
+    log = BotLogger('bot_1', 'Test', sample_every=100)
+    log.logger.setLevel(logging.WARNING)
+
+    log.info("before trace")
+    assert log.get_trace() == []
+
+    log.enable_trace(True, size=3)
+    for i in range(5):
+        log.sampled('iteration', logging.DEBUG, "tick %d", i)
+
+    assert [entry['message'] for entry in log.get_trace()] == ['tick 2', 'tick 3', 'tick 4']
+    assert log.get_trace()[0]['level'] == 'DEBUG'
+
+    log.enable_trace(False)
+    assert not log.trace_enabled and log.get_trace() == []
@@ -0,0 +1,99 @@
+"""
+Tests del motor de bots en varios procesos
+Verifica el hashing consistente y la recuperación de un proceso caído
+"""
+
+import multiprocessing
+import threading
+import time
+
+import pytest
+
+from bot_shards import HashRing, ShardError, ShardedBotEngine, _Shard, shard_key
+
+PAIRS = [(f'T{i}USDT', timeframe) for i in range(40) for timeframe in ('1m', '1h')]
+
+
+def test_hash_ring_spreads_pairs_and_moves_only_the_removed_node():
+    ring = HashRing(['shard-0', 'shard-1', 'shard-2'])
+    placement = {pair: ring.get_node(shard_key(*pair)) for pair in PAIRS}
+    counts = {node: list(placement.values()).count(node) for node in ring.nodes}
+    assert len(counts) == 3 and min(counts.values()) >= len(PAIRS) // 6
+
+    ring.remove('shard-1')
+    assert ring.nodes == ['shard-0', 'shard-2']
+    for pair, node in placement.items():
+        if node != 'shard-1':
+            assert ring.get_node(shard_key(*pair)) == node
+    assert HashRing().get_node('BTCUSDT/1h') is None
+
+
+def test_resampling_keeps_every_timeframe_of_a_symbol_together():
+    ring = HashRing(['shard-0', 'shard-1', 'shard-2'])
+    for symbol in {symbol for symbol, _ in PAIRS}:
+        nodes = {ring.get_node(shard_key(symbol, timeframe, resample=True)) for timeframe in ('1m', '5m', '1h')}
+        assert len(nodes) == 1
+    assert shard_key('BTCUSDT', '1h', resample=False) == 'BTCUSDT/1h'
+
+
+def test_late_reply_of_a_timed_out_command_is_dropped():
+    parent, child = multiprocessing.Pipe()
+    shard = _Shard('shard-x', None, parent)
+
+    def slow_shard():
+        request_id, method, args = child.recv()
+        time.sleep(0.3)
+        child.send((request_id, 'ok', 'late'))
+        request_id, method, args = child.recv()
+        child.send((request_id, 'ok', [method, *args]))
+
+    thread = threading.Thread(target=slow_shard, daemon=True)
+    thread.start()
+    with pytest.raises(ShardError):
+        shard.call('get_stats', timeout=0.1)
+    # La respuesta vencida llega primero: no se toma como la del comando siguiente
+    assert shard.call('get_trace', 'bot_1', timeout=5) == ['get_trace', 'bot_1']
+    thread.join(timeout=5)
+
+
+def test_sharded_engine_routes_bots_and_recovers_a_dead_process():
+    engine = ShardedBotEngine(processes=2)
+    strategy = {}
+    configs = [{'id': f'bot_{980 + i}', 'name': f'bot_{980 + i}', 'bot_token': 'token', 'chat_id': 'chat',
+                'symbol': symbol, 'timeframe': timeframe, 'check_interval': 3600, 'strategy': strategy}
+               for i, (symbol, timeframe) in enumerate(PAIRS[:6])]
+    # Mismo par que un bot válido pero sin nombre: falla dentro del proceso
+    broken = dict(configs[3], id='bot_979')
+    del broken['name']
+    try:
+        for config in configs[:3]:
+            assert engine.start_bot(config)
+        assert engine.start_bots(configs[3:] + [broken]) == 3
+        assert 'bot_979' not in engine.bots and 'bot_979' not in engine.configs
+        for config in configs:
+            assert engine.bots[config['id']] == engine.ring.get_node(shard_key(config['symbol'], config['timeframe']))
+            assert engine.get_bot_status(config['id'])['name'] == config['name']
+        assert engine.get_bot_status('bot_missing') is None
+
+        stats = engine.get_stats()
+        assert stats['active_bots'] == 6 and stats['processes'] == 2
+        assert sum(shard['bots'] for shard in stats['shards'].values()) == 6
+
+        # Un proceso muere: se relanza con el mismo nombre y sus bots vuelven a arrancar
+        victim = engine.bots[configs[0]['id']]
+        dead_pid = engine.shards[victim].process.pid
+        engine.shards[victim].process.kill()
+        deadline = time.time() + 60
+        while time.time() < deadline:
+            shard = engine.shards[victim]
+            if shard.process.pid != dead_pid and all(engine.get_bot_status(config['id']) for config in configs):
+                break
+            time.sleep(0.1)
+        assert engine.shards[victim].process.pid != dead_pid
+        assert all(engine.get_bot_status(config['id'])['running'] for config in configs)
+
+        assert engine.stop_bot(configs[0]['id'])
+        assert engine.get_bot_status(configs[0]['id']) is None
+    finally:
+        engine.shutdown()
+    assert not any(shard.process.is_alive() for shard in engine.shards.values())
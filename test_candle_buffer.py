@@ -0,0 +1,59 @@
+"""
+Tests del buffer columnar de velas
+Verifica el orden de la ventana, las escrituras in-place y la versión
+"""
+
+import numpy as np
+import pandas as pd
+
+from candle_buffer import CandleBuffer
+
+
+def rows(start, n):
+    timestamps = np.arange(start, start + n, dtype=np.int64) * 60000
+    values = np.column_stack([np.arange(start, start + n, dtype=float)] * 5)
+    return timestamps, values
+
+
+def test_window_stays_contiguous_after_wrapping():
+    buffer = CandleBuffer(capacity=4)
+    for i in range(7):
+        buffer.append(i * 60000, i, i + 1, i - 1, i + 0.5, 10)
+
+    closes = buffer.view('close')
+    assert len(buffer) == 4
+    assert list(closes) == [3.5, 4.5, 5.5, 6.5]
+    assert closes.flags['C_CONTIGUOUS'] and closes.base is buffer.columns['close']
+    assert list(buffer.view('timestamp')) == [i * 60000 for i in range(3, 7)]
+    assert buffer.last_timestamp == 6 * 60000
+
+
+def test_upsert_amends_forming_candle_and_appends_new_ones():
+    buffer = CandleBuffer(capacity=5)
+    buffer.load(*rows(0, 8))
+    assert list(buffer.view('open')) == [3, 4, 5, 6, 7]
+    version = buffer.version
+
+    timestamps, values = rows(6, 3)    # 6 (vieja, se ignora), 7 (en formación) y 8 (nueva)
+    values[1, 3] = 99.0
+    assert buffer.upsert(timestamps, values) == 2
+    assert buffer.version == version + 1
+    assert list(buffer.view('close')) == [4, 5, 6, 99, 8]
+    assert buffer.upsert(*rows(0, 2)) == 0 and buffer.version == version + 1
+
+    buffer.update_last(1, 2, 0, 1.5, 3)
+    assert buffer.view('close')[-1] == 1.5 and buffer.last_timestamp == 8 * 60000
+
+
+def test_frame_round_trip():
+    df = pd.DataFrame({
+        'timestamp': pd.to_datetime([1704067200000, 1704067260000], unit='ms'),
+        'open': [1.0, 2.0], 'high': [1.5, 2.5], 'low': [0.5, 1.5], 'close': [1.2, 2.2], 'volume': [10.0, 20.0],
+    })
+    buffer = CandleBuffer(capacity=10)
+    buffer.load(*CandleBuffer.frame_arrays(df))
+
+    frame = buffer.to_frame()
+    pd.testing.assert_frame_equal(frame, df, check_dtype=False)
+    frame.loc[0, 'close'] = -1.0
+    assert buffer.view('close')[0] == 1.2
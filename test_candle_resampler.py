@@ -0,0 +1,33 @@
+"""
+Tests del agregador de velas
+Verifica límites de vela, vela en formación y agregación OHLCV
+"""
+
+from candle_resampler import CandleResampler
+from market_data_service import _WEEK_OFFSET, candle_open_time
+
+MINUTE = 60000
+
+
+def test_forming_candle_is_updated_and_buckets_close_on_boundaries():
+    resampler = CandleResampler(5 * MINUTE)
+
+    # Vela de 1m en formación modificada dos veces: no se suma dos veces
+    assert resampler.apply([0], [[10, 12, 9, 11, 1]]) == [[0, 10, 12, 9, 11, 1]]
+    assert resampler.apply([0], [[10, 13, 9, 12, 2]]) == [[0, 10, 13, 9, 12, 2]]
+
+    rows = resampler.apply([MINUTE * m for m in (1, 4, 5, 6)],
+                           [[12, 14, 11, 13, 3], [13, 13, 8, 9, 1], [9, 10, 9, 10, 5], [10, 11, 7, 8, 1]])
+    assert rows == [[0, 10, 14, 8, 9, 6], [5 * MINUTE, 9, 11, 7, 8, 6]]
+
+    # Velas anteriores a la vela en formación se ignoran
+    assert resampler.apply([3 * MINUTE], [[1, 1, 1, 1, 1]]) == []
+
+
+def test_weekly_buckets_open_on_monday():
+    week = 7 * 86400 * 1000
+    resampler = CandleResampler(week, _WEEK_OFFSET * 1000)
+    monday = 1704067200000  # 2024-01-01, lunes
+    for timestamp in (monday, monday + week - 1, monday + 3 * 86400 * 1000):
+        assert resampler.bucket_open(timestamp) == candle_open_time('1w', timestamp / 1000) * 1000
+    assert resampler.bucket_open(monday - 1) == monday - week
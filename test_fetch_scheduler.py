@@ -0,0 +1,87 @@
+"""
+Tests del programador de descargas
+Verifica concurrencia acotada, reparto de ráfagas y reprogramación
+"""
+
+import threading
+import time
+
+from fetch_scheduler import FetchScheduler
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_due_jobs_run_with_bounded_concurrency_and_spacing():
+    scheduler = FetchScheduler(max_workers=2, spacing=0.02)
+    lock = threading.Lock()
+    state = {'running': 0, 'max_running': 0}
+    starts = []
+
+    def task(name):
+        with lock:
+            starts.append((name, time.monotonic()))
+            state['running'] += 1
+            state['max_running'] = max(state['max_running'], state['running'])
+        time.sleep(0.05)
+        with lock:
+            state['running'] -= 1
+        return None  # Una sola ejecución
+
+    try:
+        for i in range(6):
+            scheduler.schedule(f'pair{i}', lambda i=i: task(f'pair{i}'))
+        assert wait_until(lambda: scheduler.get_stats()['executed'] == 6)
+    finally:
+        scheduler.stop()
+
+    assert state['max_running'] == 2
+    times = sorted(t for _, t in starts)
+    assert all(b - a >= 0.015 for a, b in zip(times, times[1:]))
+    assert scheduler.get_stats()['jobs'] == 0
+
+
+def test_jobs_are_rescheduled_until_cancelled():
+    scheduler = FetchScheduler(max_workers=1, spacing=0)
+    runs = []
+    try:
+        scheduler.schedule('a', lambda: runs.append('a') or 0.01)
+        scheduler.schedule('b', lambda: runs.append('b') or 0.01, delay=10)
+        assert wait_until(lambda: runs.count('a') >= 3)
+
+        scheduler.cancel('a')
+        time.sleep(0.05)
+        count = runs.count('a')
+        time.sleep(0.05)
+        assert runs.count('a') == count and 'b' not in runs
+        assert scheduler.get_stats()['jobs'] == 1
+    finally:
+        scheduler.stop()
+
+
+def test_service_runs_every_pair_without_a_thread_per_pair(monkeypatch):
+    from market_data_service import market_data_service as service
+    from test_market_data_service import fake_klines
+
+    monkeypatch.setattr(service, '_fetch_from_binance',
+                        lambda symbol, timeframe, limit=500, start_time=None, end_time=None:
+                        service._klines_to_frame(fake_klines(50)))
+    pairs = [(f'SCH{i}USDT', '1m') for i in range(20)]
+    threads_before = threading.active_count()
+
+    try:
+        for symbol, timeframe in pairs:
+            service.subscribe('bot_sched', symbol, timeframe)
+        assert wait_until(lambda: all(service.get_data(*pair) is not None for pair in pairs))
+
+        stats = service.get_stats()
+        assert stats['active_workers'] >= len(pairs) and stats['scheduler']['jobs'] >= len(pairs)
+        assert threading.active_count() - threads_before <= service.scheduler.max_workers + 1
+    finally:
+        for symbol, timeframe in pairs:
+            service.unsubscribe('bot_sched', symbol, timeframe)
+    assert all(pair not in service.scheduler.jobs for pair in pairs)
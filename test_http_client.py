@@ -0,0 +1,75 @@
+"""
+Tests del cliente HTTP compartido
+Usa un servidor HTTP local (sin red) para verificar keep-alive y reintentos
+"""
+
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import http_client as hc
+from http_client import http_client
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # Keep-alive
+
+    def _reply(self):
+        server = self.server
+        with server.lock:
+            server.hits.append((self.command, self.path))
+            status = server.statuses.pop(0) if server.statuses else 200
+        length = int(self.headers.get('Content-Length', 0))
+        if length:
+            self.rfile.read(length)
+        body = b'{"ok": true}'
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = _reply
+
+    def setup(self):
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server(monkeypatch):
+    monkeypatch.setattr(hc, 'HTTP_BACKOFF', 0)
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.lock = threading.Lock()
+    server.hits, server.statuses, server.connections = [], [], 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    http_client.close()
+
+
+def test_requests_to_a_host_reuse_one_connection(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    for i in range(5):
+        assert http_client.get(f"{url}/klines", params={'n': i}).json() == {'ok': True}
+    assert http_client.post(f"{url}/sendMessage", json={'text': 'hola'}).status_code == 200
+
+    assert server.connections == 1 and len(server.hits) == 6
+    assert http_client.get_stats()['127.0.0.1']['requests'] >= 6
+
+
+def test_server_errors_are_retried_only_for_get(server):
+    url = f"http://127.0.0.1:{server.server_address[1]}"
+    server.statuses = [503, 502]
+    assert http_client.get(f"{url}/klines").status_code == 200
+    assert len(server.hits) == 3
+
+    # Un POST no se repite: el mensaje podría haberse enviado
+    server.statuses = [503]
+    assert http_client.post(f"{url}/sendMessage", json={}).status_code == 503
+    assert len(server.hits) == 4
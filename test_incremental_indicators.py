@@ -0,0 +1,196 @@
+"""
+Tests de indicadores incrementales
+Verifica que coinciden con los cálculos de MarketDataProvider (pandas)
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from incremental_indicators import (
+    IncrementalEMA, IncrementalSMA, IncrementalRSI, IncrementalMACD,
+    IncrementalBollinger, IncrementalATR, IncrementalSwing, IndicatorStreamSet,
+)
+from market_data import MarketDataProvider
+from strategy_compiler import compile_strategy
+from strategy_evaluator import StrategyEvaluator
+from test_strategy_compiler import make_df, block
+
+provider = MarketDataProvider()
+
+
+def candle(df, i, scale=1.0):
+    row = df.iloc[i]
+    return {name: float(row[name]) * scale for name in ('open', 'high', 'low', 'close')}
+
+
+def feed(indicator, df, amend=False):
+    """Alimentar vela a vela; con amend cada vela llega primero en formación"""
+    for i in range(len(df)):
+        if amend:
+            indicator.update(candle(df, i, scale=1.01), is_new=True)
+            indicator.update(candle(df, i), is_new=False)
+        else:
+            indicator.update(candle(df, i))
+    return indicator
+
+
+def assert_tail_equal(history, series):
+    expected = np.asarray(series, dtype=float)[-len(history):]
+    np.testing.assert_allclose(history, expected, rtol=1e-9, atol=1e-9, equal_nan=True)
+
+
+@pytest.mark.parametrize('amend', [False, True])
+@pytest.mark.parametrize('factory, reference', [
+    (lambda: IncrementalEMA(21), lambda df: provider.calculate_ema(df, 21)),
+    (lambda: IncrementalSMA(20), lambda df: provider.calculate_sma(df, 20)),
+    (lambda: IncrementalRSI(14), lambda df: provider.calculate_rsi(df, 14)),
+    (lambda: IncrementalATR(14), lambda df: provider.calculate_atr(df, 14)),
+])
+def test_single_value_indicators_match_pandas(factory, reference, amend):
+    df = make_df(400)
+    indicator = feed(factory(), df, amend)
+
+    assert_tail_equal(indicator.series(), reference(df))
+    assert indicator.count == len(df)
+
+
+@pytest.mark.parametrize('amend', [False, True])
+def test_macd_and_bollinger_match_pandas(amend):
+    df = make_df(400)
+    macd = feed(IncrementalMACD(12, 26, 9), df, amend)
+    bbands = feed(IncrementalBollinger(20, 2), df, amend)
+
+    expected_macd = provider.calculate_macd(df)
+    for component in IncrementalMACD.components:
+        assert_tail_equal(macd.series(component), expected_macd[component])
+
+    expected_bbands = provider.calculate_bollinger_bands(df, 20, 2)
+    for component in IncrementalBollinger.components:
+        assert_tail_equal(bbands.series(component), expected_bbands[component])
+
+
+def test_large_prices_do_not_drift():
+    df = make_df(3000)
+    df['close'] = df['close'] * 1000 + 60000
+    bbands = feed(IncrementalBollinger(20, 2), df)
+
+    expected = provider.calculate_bollinger_bands(df, 20, 2)
+    assert_tail_equal(bbands.series('upper'), expected['upper'])
+
+
+def test_stream_set_only_processes_new_candles():
+    df = make_df(300)
+    streams = IndicatorStreamSet()
+    streams.track([('EMA', 50), ('RSI', 14), ('Swing', 5, 'high'), ('STD', 20)])
+    assert set(streams.indicators) == {('EMA', 50), ('RSI', 14), ('Swing', 5, 'high')}
+
+    # Snapshot inicial con la última vela en formación
+    partial = df.iloc[:250].copy()
+    partial.loc[249, 'close'] += 3
+    streams.apply(partial)
+
+    # Snapshots sucesivos: la vela en formación se cierra y aparecen nuevas
+    streams.apply(df.iloc[10:260].reset_index(drop=True))
+    streams.apply(df.iloc[50:300].reset_index(drop=True))
+
+    results = streams.results()
+    assert streams.indicators[('EMA', 50)].count == 300
+    assert_tail_equal(results[('EMA', 50)], provider.calculate_ema(df, 50))
+    assert_tail_equal(results[('RSI', 14)], provider.calculate_rsi(df, 14))
+    assert_tail_equal(results[('Swing', 5, 'high')][-50:], provider.find_swing_high(df, 5))
+
+    # Indicador agregado después: se inicializa con el historial disponible
+    streams.track([('SMA', 20)])
+    assert_tail_equal(streams.results()[('SMA', 20)], provider.calculate_sma(df.iloc[50:300], 20))
+
+
+def test_evaluator_reads_live_values_from_cache():
+    from indicator_cache import indicator_cache, snapshot_timestamp
+
+    df = make_df()
+    plan = compile_strategy({'entry_long': [
+        block('value', 'Price'), block('operator', 'GreaterThan'), block('indicator', 'EMA', period='50'),
+        block('condition', 'AND'),
+        block('indicator', 'MACD', component='histogram'), block('operator', 'GreaterThan'),
+        block('value', 'Number', value='0'),
+    ]})
+    evaluator = StrategyEvaluator()
+    expected = evaluator.evaluate_plan(df, plan)
+
+    streams = IndicatorStreamSet()
+    streams.track(plan.roots)
+    streams.apply(df)
+    indicator_cache.clear()
+    indicator_cache.on_snapshot('LIVEUSDT', '15m', 1, snapshot_timestamp(df))
+    indicator_cache.publish_live('LIVEUSDT', '15m', 1, snapshot_timestamp(df), streams.results())
+
+    calls = []
+    evaluator.market_data.calculate_ema = lambda *args: calls.append(args)
+    assert evaluator.evaluate_plan(df, plan, ('LIVEUSDT', '15m', 1)) == expected
+    assert calls == []
+    indicator_cache.clear()
+
+
+def loop_swings(values, lookback, swing_type):
+    """Implementación escalar original (referencia)"""
+    swings = np.full(len(values), np.nan)
+    for i in range(lookback, len(values) - lookback):
+        is_swing = True
+        for j in range(1, lookback + 1):
+            if swing_type == 'high':
+                blocked = values[i] <= values[i - j] or values[i] <= values[i + j]
+            else:
+                blocked = values[i] >= values[i - j] or values[i] >= values[i + j]
+            if blocked:
+                is_swing = False
+                break
+        if is_swing:
+            swings[i] = values[i]
+    return swings
+
+
+@pytest.mark.parametrize('lookback', [0, 1, 3, 5, 20])
+def test_vectorized_swings_match_scalar_loop(lookback):
+    df = make_df(500)
+    # Valores repetidos y NaN para cubrir empates y huecos
+    df.loc[100:104, 'high'] = df['high'].max()
+    df.loc[200, ['high', 'low']] = np.nan
+    df.loc[201:203, 'low'] = df['low'].min()
+
+    np.testing.assert_array_equal(
+        provider.find_swing_high(df, lookback).to_numpy(), loop_swings(df['high'].to_numpy(), lookback, 'high'))
+    np.testing.assert_array_equal(
+        provider.find_swing_low(df, lookback).to_numpy(), loop_swings(df['low'].to_numpy(), lookback, 'low'))
+
+
+@pytest.mark.parametrize('amend', [False, True])
+@pytest.mark.parametrize('swing_type', ['high', 'low'])
+def test_incremental_swings_match_vectorized(swing_type, amend):
+    df = make_df(400)
+    swing = feed(IncrementalSwing(5, swing_type), df, amend)
+
+    expected = provider.find_swing_high(df, 5) if swing_type == 'high' else provider.find_swing_low(df, 5)
+    history = swing.series()[-len(swing.history):]
+    assert_tail_equal(history, expected)
+
+    # El valor usado por el evaluador (último swing) coincide aunque salga del historial
+    valid = expected.dropna()
+    assert swing.series()[~np.isnan(swing.series())][-1] == valid.iloc[-1]
+
+
+def test_stream_set_appends_new_candles_and_rebuilds_after_a_gap():
+    df = make_df(120)
+    step = (df['timestamp'].iloc[1] - df['timestamp'].iloc[0]).total_seconds()
+    streams = IndicatorStreamSet(period=int(step))
+    streams.track([('EMA', 10)])
+    streams.apply(df.iloc[:100])
+
+    # Una fila con la vela siguiente: se agrega sin perder el historial
+    streams.apply(df.iloc[100:101].reset_index(drop=True))
+    assert streams.indicators[('EMA', 10)].count == 101
+    assert_tail_equal(streams.results()[('EMA', 10)], provider.calculate_ema(df.iloc[:101], 10))
+
+    # Faltan velas: se reconstruye con lo que llega
+    streams.apply(df.iloc[105:110].reset_index(drop=True))
+    assert streams.indicators[('EMA', 10)].count == 5
@@ -0,0 +1,126 @@
+"""
+Tests del stream de velas por WebSocket
+Usa FakeKlineServer (local, sin red) en lugar de stream.binance.com
+"""
+
+import queue
+import time
+
+import pytest
+
+from fake_kline_server import FakeKlineServer
+from kline_stream import KlineStream, stream_name
+
+
+@pytest.fixture
+def server():
+    server = FakeKlineServer().start()
+    yield server
+    server.stop()
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_stream_multiplexes_pairs_and_answers_pings(server):
+    received = queue.Queue()
+    stream = KlineStream(server.url, lambda *kline: received.put(kline))
+    try:
+        stream.add('BTCUSDT', '1m')
+        assert server.wait_for_streams({'btcusdt@kline_1m'})
+
+        server.send_kline('BTCUSDT', '1m', 60000, (1, 2, 0.5, 1.5, 10))
+        assert received.get(timeout=5) == ('BTCUSDT', '1m', 60000, (1.0, 2.0, 0.5, 1.5, 10.0), False)
+
+        # Par agregado con la conexión abierta: SUBSCRIBE sobre la misma conexión
+        stream.add('ETHUSDT', '5m')
+        assert server.wait_for_streams({stream_name('BTCUSDT', '1m'), stream_name('ETHUSDT', '5m')})
+        server.send_kline('ETHUSDT', '5m', 300000, (3, 3, 3, 3, 1), closed=True)
+        assert received.get(timeout=5)[1:3] == ('5m', 300000)
+        assert server.connections == 1
+
+        server.ping(b'hb')
+        assert wait_until(lambda: server.pongs() == [b'hb'])
+
+        stream.remove('BTCUSDT', '1m')
+        assert server.wait_for_streams({'ethusdt@kline_5m'})
+        assert wait_until(lambda: server.send_kline('BTCUSDT', '1m', 120000, (1, 1, 1, 1, 1)) == 0)
+    finally:
+        stream.stop()
+    assert not stream.connected
+
+
+def test_stream_reconnects_with_current_pairs(server):
+    connects = []
+    stream = KlineStream(server.url, lambda *kline: None, on_connect=lambda: connects.append(1),
+                         reconnect_delay=0.05)
+    try:
+        stream.add('BTCUSDT', '1m')
+        assert server.wait_for_streams({'btcusdt@kline_1m'})
+
+        server.drop_connections()
+        assert server.wait_for_connections(2)
+        assert server.wait_for_streams({'btcusdt@kline_1m'})
+        assert wait_until(lambda: len(connects) == 2)
+        assert stream.stats['disconnects'] == 1
+    finally:
+        stream.stop()
+
+
+def test_service_streams_candles_and_backfills_gaps_by_rest(server, monkeypatch):
+    import market_data_service as mds
+    from market_data_service import market_data_service as service
+    from test_market_data_service import fake_klines
+
+    rest = fake_klines(60)
+    available = {'n': 50}
+
+    def fake_fetch(symbol, timeframe, limit=500, start_time=None, end_time=None):
+        rows = [k for k in rest[:available['n']] if start_time is None or k[0] >= start_time]
+        return service._klines_to_frame(rows[-limit:] if start_time is None else rows[:limit])
+
+    monkeypatch.setattr(service, '_fetch_from_binance', fake_fetch)
+    monkeypatch.setattr(service, '_start_worker', lambda symbol, timeframe: None)
+    monkeypatch.setattr(mds, 'STREAM_UPDATE_THROTTLE', 0)
+    key = ('WSUSDT', '1m')
+    events = queue.Queue()
+    service.subscribe('bot_ws', *key, callback=events)
+    service._refresh(key)
+    events.get_nowait()
+
+    def last_open():
+        return service.cache[key][0].last_timestamp
+
+    try:
+        stream = service.enable_streaming(server.url)
+        stream.add(*key)
+        assert server.wait_for_streams({'wsusdt@kline_1m'})
+
+        # La vela en formación cambia, cierra y empieza otra: todo por WebSocket
+        server.send_kline(*key, rest[49][0], (149, 160, 148, 155, 20))
+        assert (events.get(timeout=5).new_candle, service.get_data(*key)['close'].iloc[-1]) == (False, 155.0)
+        server.send_kline(*key, rest[49][0], (149, 160, 148, 156, 25), closed=True)
+        server.send_kline(*key, rest[50][0], (156, 157, 155, 156.5, 1))
+        assert [events.get(timeout=5).new_candle for _ in range(2)] == [False, True]
+        assert last_open() == rest[50][0] and len(service.get_data(*key)) == 51
+
+        # Conexión caída: al reconectar se rellena por REST lo que se perdió
+        available['n'] = 55
+        server.drop_connections()
+        assert wait_until(lambda: last_open() == rest[54][0])
+
+        # Vela que llega salteando otras: también se rellena por REST
+        assert server.wait_for_streams({'wsusdt@kline_1m'})
+        available['n'] = 58
+        server.send_kline(*key, rest[57][0], (1, 1, 1, 1, 1))
+        assert wait_until(lambda: last_open() == rest[57][0])
+        opens = service.get_data(*key)['timestamp'].to_numpy().astype('datetime64[ms]').astype('int64')
+        assert list(opens[-8:]) == [k[0] for k in rest[50:58]]
+        assert service.get_stats()['stream']['connected']
+    finally:
+        service.disable_streaming()
+        service.unsubscribe('bot_ws', *key)
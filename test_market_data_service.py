@@ -160,5 +160,367 @@ def test_market_data_service():
     print()
 
 
+def test_candle_boundaries():
+    from market_data_service import candle_open_time, next_candle_close
+
+    # 2024-01-03 10:07:30 UTC (miércoles)
+    now = 1704276450.0
+    assert candle_open_time('15m', now) == 1704276000.0          # 10:00
+    assert next_candle_close('15m', now) == 1704276900.0         # 10:15
+    assert next_candle_close('1h', now) == 1704279600.0          # 11:00
+    assert next_candle_close('1d', now) == 1704326400.0          # 2024-01-04 00:00
+    assert candle_open_time('1w', now) == 1704067200.0           # lunes 2024-01-01
+    assert next_candle_close('1M', now) is None
+
+
+def test_aligned_mode_keeps_only_closed_candles_and_waits_for_close(monkeypatch):
+    import pandas as pd
+    import market_data_service as mds
+
+    service = mds.market_data_service
+    monkeypatch.setattr(service, 'candle_aligned', True)
+    now = 1704276450.0  # 10:07:30
+    monkeypatch.setattr(mds.time, 'time', lambda: now)
+
+    data = pd.DataFrame({
+        'timestamp': pd.to_datetime([1704275100, 1704276000], unit='s'),  # 09:45 (cerrada), 10:00 (en formación)
+        'open': [1.0, 2.0], 'high': [1.0, 2.0], 'low': [1.0, 2.0], 'close': [1.0, 2.0], 'volume': [1.0, 2.0],
+    })
+    closed = service._closed_candles(data, '15m')
+    assert list(closed['close']) == [1.0]
+
+    assert service._seconds_until_refresh('15m') == 450.0 + mds.CANDLE_CLOSE_DELAY
+    assert service._seconds_until_refresh('1M') == service._get_update_interval('1M')
+
+
+def test_wait_for_update_returns_on_new_snapshot():
+    import threading
+    import pandas as pd
+    from market_data_service import market_data_service as service
+
+    key = ('WAITUSDT', '1m')
+    data = pd.DataFrame({'timestamp': pd.to_datetime([0], unit='s'), 'open': [1.0], 'high': [1.0],
+                         'low': [1.0], 'close': [1.0], 'volume': [1.0]})
+    version = service.get_version(*key)
+
+    assert service.wait_for_update(*key, version, timeout=0.01) == version
+
+    timer = threading.Timer(0.05, service._store, args=(key, data))
+    timer.start()
+    assert service.wait_for_update(*key, version, timeout=5) == version + 1
+    timer.join()
+    service._stop_worker(*key)
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def fake_klines(n, start_ms=1704067200000, step_ms=60000):
+    """Velas en el formato de /api/v3/klines"""
+    return [[start_ms + i * step_ms, str(100 + i), str(101 + i), str(99 + i), str(100.5 + i), '10',
+             start_ms + (i + 1) * step_ms - 1, '0', 1, '0', '0', '0'] for i in range(n)]
+
+
+def test_incremental_fetch_only_downloads_new_candles(monkeypatch):
+    import market_data_service as mds
+    from market_data_service import market_data_service as service
+
+    server = fake_klines(1200)
+    available = {'n': 1100}
+    requests_made = []
+
+    def fake_fetch(symbol, timeframe, limit=500, start_time=None, end_time=None):
+        requests_made.append((limit, start_time, end_time))
+        rows = server[:available['n']]
+        if start_time is not None:
+            rows = [k for k in rows if k[0] >= start_time]
+        if end_time is not None:
+            rows = [k for k in rows if k[0] <= end_time]
+        rows = rows[:limit] if start_time is not None else rows[-limit:]
+        return service._klines_to_frame(rows)
+
+    monkeypatch.setattr(service, '_fetch_from_binance', fake_fetch)
+    monkeypatch.setattr(mds, 'MARKET_DATA_HISTORY', 1050)
+    key = ('INCUSDT', '1m')
+
+    # Historial inicial paginado (1050 > límite de 1000 por request)
+    first = service._refresh(key)
+    assert len(first) == 1050 and len(requests_made) == 2
+    assert first['timestamp'].is_monotonic_increasing
+    buffer = service.cache[key][0]
+    closes = buffer.columns['close']
+
+    # La vela en formación cambia y llegan 2 nuevas: se piden solo 3 velas
+    server[1099][4] = '999'
+    available['n'] = 1102
+    requests_made.clear()
+    data = service._refresh(key)
+
+    assert requests_made == [(mds.INCREMENTAL_FETCH_LIMIT, server[1099][0], None)]
+    assert len(data) == 1050
+    assert data['close'].iloc[-3] == 999.0
+    # Las velas nuevas se escriben en el mismo buffer (sin DataFrames intermedios)
+    assert service.cache[key][0] is buffer and buffer.columns['close'] is closes
+    assert list(data['timestamp'].to_numpy().astype('datetime64[ms]').astype('int64')) == [k[0] for k in server[52:1102]]
+    service._stop_worker(*key)
+
+
+def test_snapshots_are_shared_and_read_only():
+    import pytest
+    from market_data_service import market_data_service as service
+
+    key = ('SNAPUSDT', '1m')
+    service._store(key, service._klines_to_frame(fake_klines(50)))
+
+    df, version = service.get_snapshot(*key)
+    assert service.get_snapshot(*key)[0] is df and service.get_data(*key) is df
+    with pytest.raises(ValueError):
+        df.loc[0, 'close'] = 0.0
+    with pytest.raises(TypeError):
+        df['signal'] = 1
+
+    # Una versión nueva no modifica el snapshot que siguen leyendo otros bots
+    last_close = df['close'].iloc[-1]
+    service._store(key, service._klines_to_frame(fake_klines(52)[-3:]), replace=False)
+    new_df, new_version = service.get_snapshot(*key)
+    assert new_version == version + 1 and new_df is not df
+    assert df['close'].iloc[-1] == last_close and len(new_df) == 52
+    service._stop_worker(*key)
+
+
+def test_subscribers_are_notified_only_when_data_changes(monkeypatch):
+    import queue
+    from market_data_service import market_data_service as service
+
+    server = fake_klines(60)
+    available = {'n': 50}
+
+    def fake_fetch(symbol, timeframe, limit=500, start_time=None, end_time=None):
+        rows = [k for k in server[:available['n']] if start_time is None or k[0] >= start_time]
+        return service._klines_to_frame(rows[-limit:] if start_time is None else rows[:limit])
+
+    monkeypatch.setattr(service, '_fetch_from_binance', fake_fetch)
+    monkeypatch.setattr(service, '_start_worker', lambda symbol, timeframe: None)
+    key = ('PUSHUSDT', '1m')
+    events = queue.Queue()
+    service.subscribe('bot_push', *key, callback=events)
+
+    service._refresh(key)
+    first = events.get_nowait()
+    assert (first.symbol, first.timeframe, first.version, first.new_candle) == (*key, 1, True)
+    assert first.data is service.get_data(*key)
+
+    # Sin cambios en Binance: ni versión nueva ni aviso
+    service._refresh(key)
+    assert events.empty() and service.get_version(*key) == 1
+
+    # Cambia la vela en formación y luego llega una nueva
+    server[49][4] = '500'
+    service._refresh(key)
+    available['n'] = 51
+    service._refresh(key)
+    assert [(e.version, e.new_candle) for e in (events.get_nowait(), events.get_nowait())] == [(2, False), (3, True)]
+
+    service.unsubscribe('bot_push', *key)
+    assert key not in service.subscriber_callbacks
+
+
+def aggregate(klines, step_ms):
+    """Velas de `step_ms` a partir de velas menores (como las publica Binance)"""
+    buckets = {}
+    for k in klines:
+        o, h, l, c, v = (float(x) for x in k[1:6])
+        bucket = k[0] // step_ms * step_ms
+        if bucket not in buckets:
+            buckets[bucket] = [bucket, o, h, l, c, v]
+        else:
+            row = buckets[bucket]
+            row[2], row[3], row[4], row[5] = max(row[2], h), min(row[3], l), c, row[5] + v
+    return [[*row, 0, '0', 1, '0', '0', '0'] for row in buckets.values()]
+
+
+def test_higher_timeframes_are_resampled_from_the_base_stream(monkeypatch):
+    import threading
+    import market_data_service as mds
+    from market_data_service import market_data_service as service
+
+    minute = 60000
+    server = [[1704067200000 + i * minute, str(100 + i % 7), str(102 + i % 7 + i % 5), str(99 + i % 7 - i % 3),
+               str(100.5 + i % 7), str(1 + i % 4)] for i in range(720)]
+    available = {'n': 700}
+    calls = []
+
+    def fake_fetch(symbol, timeframe, limit=500, start_time=None, end_time=None):
+        calls.append(timeframe)
+        rows = aggregate(server[:available['n']], mds.timeframe_to_seconds(timeframe) * 1000)
+        rows = [k for k in rows if (start_time is None or k[0] >= start_time) and (end_time is None or k[0] <= end_time)]
+        return service._klines_to_frame(rows[-limit:] if start_time is None else rows[:limit])
+
+    def assert_consistent(timeframe):
+        expected = aggregate(server[:available['n']], mds.timeframe_to_seconds(timeframe) * 1000)
+        data = service.get_data('RSPUSDT', timeframe)
+        opens = data['timestamp'].to_numpy().astype('datetime64[ms]').astype('int64')
+        assert list(opens) == [k[0] for k in expected[-len(data):]]
+        assert data[['open', 'high', 'low', 'close', 'volume']].values.tolist() == \
+            [k[1:6] for k in expected[-len(data):]]
+
+    monkeypatch.setattr(service, '_fetch_from_binance', fake_fetch)
+    monkeypatch.setattr(service, '_start_worker', lambda symbol, timeframe: None)
+    monkeypatch.setattr(service, 'resample', True)
+    monkeypatch.setattr(mds, 'MARKET_DATA_HISTORY', 100)
+    timeframes = ['1m', '5m', '15m', '4h']
+    for timeframe in timeframes:
+        service.subscribe('bot_rsp', 'RSPUSDT', timeframe)
+
+    try:
+        # Cada timeframe se carga una vez por REST; al cargar 1m los mayores pasan a agregarse
+        for timeframe in timeframes[1:] + ['1m']:
+            service._refresh(('RSPUSDT', timeframe))
+        stats = service.get_stats()['pairs']
+        assert [stats[f"RSPUSDT/{tf}"]['resampled_from'] for tf in timeframes] == [None, '1m', '1m', '1m']
+        for timeframe in timeframes:
+            assert_consistent(timeframe)
+
+        # Vela de 4h abierta antes del historial de 1m: sus velas de 1m se bajaron una vez por REST
+        seeded = len(calls)
+        assert calls.count('1m') >= 2
+
+        # Vela en formación modificada y velas nuevas que cruzan límites de 5m y 15m
+        server[699][4] = '250'
+        service._refresh(('RSPUSDT', '1m'))
+        available['n'] = 706
+        service._refresh(('RSPUSDT', '1m'))
+        for timeframe in timeframes:
+            assert_consistent(timeframe)
+
+        # Los timeframes mayores ya no consultan Binance
+        assert service._run_worker(('RSPUSDT', '15m'), threading.Event()) is not None
+        assert calls[seeded:] == ['1m', '1m']
+    finally:
+        for timeframe in timeframes:
+            service.unsubscribe('bot_rsp', 'RSPUSDT', timeframe)
+    assert not service.resamplers
+
+
+def test_restart_reloads_candles_from_disk_and_backfills_the_gap(monkeypatch, tmp_path):
+    import market_data_service as mds
+    from market_data_service import market_data_service as service
+    from ohlcv_store import OHLCVStore
+
+    now_ms = int(time.time() // 60 * 60 * 1000)
+    server = fake_klines(600, start_ms=now_ms - 599 * 60000)
+    available = {'n': 590}
+    requests_made = []
+
+    def fake_fetch(symbol, timeframe, limit=500, start_time=None, end_time=None):
+        requests_made.append((limit, start_time))
+        rows = [k for k in server[:available['n']] if start_time is None or k[0] >= start_time]
+        return service._klines_to_frame(rows[-limit:] if start_time is None else rows[:limit])
+
+    monkeypatch.setattr(service, '_fetch_from_binance', fake_fetch)
+    monkeypatch.setattr(service, 'store', OHLCVStore(str(tmp_path)))
+    monkeypatch.setattr(mds, 'MARKET_DATA_HISTORY', 200)
+    key = ('DISKUSDT', '1m')
+
+    # Primera ejecución: historial completo, que queda en disco
+    service.subscribe('bot_disk', *key)
+    assert wait_until(lambda: service.get_data(*key) is not None)
+    service.unsubscribe('bot_disk', *key)
+    assert requests_made == [(200, None)]
+    assert service.store.bounds(*key) == (server[390][0], server[589][0])
+
+    # "Reinicio" con 8 velas nuevas en Binance: se carga de disco y solo se baja el hueco
+    available['n'] = 598
+    requests_made.clear()
+    service.subscribe('bot_disk', *key)
+    try:
+        assert wait_until(lambda: service.get_data(*key) is not None)
+        assert requests_made == [(mds.INCREMENTAL_FETCH_LIMIT, server[589][0])]
+        data = service.get_data(*key)
+        opens = data['timestamp'].to_numpy().astype('datetime64[ms]').astype('int64')
+        assert list(opens) == [k[0] for k in server[398:598]]
+        assert service.store.bounds(*key)[1] == server[597][0]
+        assert service.get_stats()['fetches']['restored'] >= 1
+    finally:
+        service.unsubscribe('bot_disk', *key)
+
+
 if __name__ == "__main__":
     test_market_data_service()
+
+
+def test_stream_new_candle_advances_live_indicators(monkeypatch):
+    from indicator_cache import indicator_cache, snapshot_timestamp
+    from market_data import MarketDataProvider
+    from market_data_service import market_data_service as service
+
+    server = fake_klines(60)
+    monkeypatch.setattr(service, '_fetch_from_binance',
+                        lambda symbol, timeframe, limit=500, start_time=None, end_time=None:
+                        service._klines_to_frame(server[-limit:]))
+    monkeypatch.setattr(service, '_start_worker', lambda symbol, timeframe: None)
+    key = ('LIVEUSDT', '1m')
+    node = ('EMA', 10)
+    service.subscribe('bot_live', *key)
+    try:
+        service._refresh(key)
+        service.track_indicators(*key, [node])
+
+        # El stream abre una vela nueva: llega una sola fila, posterior a la última
+        for values, closed in (((160.0, 162.0, 159.0, 161.0, 5.0), False), ((160.0, 163.0, 150.0, 151.0, 7.0), False)):
+            service._on_stream_kline(*key, server[-1][0] + 60000, values, closed)
+            service.stream_updates.clear()
+
+        data, version = service.get_snapshot(*key)
+        assert len(data) == 61
+        live = indicator_cache.get_live(*key, version, snapshot_timestamp(data), node)
+        expected = MarketDataProvider().calculate_ema(data, 10).to_numpy()[-len(live):]
+        assert len(live) > 1
+        assert all(abs(a - b) < 1e-9 for a, b in zip(live, expected))
+    finally:
+        service.unsubscribe('bot_live', *key)
+
+
+def test_resampled_indicators_keep_history_across_bucket_boundaries(monkeypatch):
+    import market_data_service as mds
+    from indicator_cache import indicator_cache, snapshot_timestamp
+    from market_data import MarketDataProvider
+    from market_data_service import market_data_service as service
+
+    server = fake_klines(720)
+    available = {'n': 700}
+
+    def fake_fetch(symbol, timeframe, limit=500, start_time=None, end_time=None):
+        rows = aggregate(server[:available['n']], mds.timeframe_to_seconds(timeframe) * 1000)
+        rows = [k for k in rows if (start_time is None or k[0] >= start_time) and (end_time is None or k[0] <= end_time)]
+        return service._klines_to_frame(rows[-limit:] if start_time is None else rows[:limit])
+
+    monkeypatch.setattr(service, '_fetch_from_binance', fake_fetch)
+    monkeypatch.setattr(service, '_start_worker', lambda symbol, timeframe: None)
+    monkeypatch.setattr(service, 'resample', True)
+    key = ('RSIMUSDT', '5m')
+    node = ('EMA', 10)
+    for timeframe in ('1m', '5m'):
+        service.subscribe('bot_rsim', 'RSIMUSDT', timeframe)
+    try:
+        service._refresh(key)
+        service._refresh(('RSIMUSDT', '1m'))
+        service.track_indicators(*key, [node])
+
+        # Velas de 1m del stream, una fila cada una: la 700 abre un bucket de 5m nuevo
+        for kline in server[700:708]:
+            service._on_stream_kline('RSIMUSDT', '1m', kline[0], tuple(float(x) for x in kline[1:6]), True)
+
+        data, version = service.get_snapshot(*key)
+        assert service.get_stats()['pairs']['RSIMUSDT/5m']['resampled_from'] == '1m'
+        live = indicator_cache.get_live(*key, version, snapshot_timestamp(data), node)
+        expected = MarketDataProvider().calculate_ema(data, 10).to_numpy()[-len(live):]
+        assert len(live) > 1
+        assert all(abs(a - b) < 1e-9 for a, b in zip(live, expected))
+    finally:
+        for timeframe in ('1m', '5m'):
+            service.unsubscribe('bot_rsim', 'RSIMUSDT', timeframe)
@@ -0,0 +1,72 @@
+"""
+Tests del almacenamiento de velas en disco
+"""
+
+import os
+
+import numpy as np
+
+from ohlcv_store import RECORD, OHLCVStore
+
+MINUTE = 60000
+
+
+def candles(first, count):
+    timestamps = np.arange(first, first + count) * MINUTE
+    values = np.column_stack([timestamps / MINUTE + offset for offset in (0, 1, -1, 0.5, 10)])
+    return timestamps, values
+
+
+def test_write_replaces_from_first_candle_and_appends(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    assert store.bounds('BTC/USDT', '1m') is None
+    assert len(store.read('BTCUSDT', '1m')[0]) == 0
+
+    assert store.write('BTCUSDT', '1m', *candles(0, 10)) == 10
+    # La última vela (en formación) cambia y llegan dos más
+    timestamps, values = candles(9, 3)
+    values[0, 3] = 99
+    assert store.write('BTC/USDT', '1m', timestamps, values) == 12
+
+    assert store.bounds('BTCUSDT', '1m') == (0, 11 * MINUTE)
+    timestamps, values = store.read('BTCUSDT', '1m', start_time=8 * MINUTE)
+    assert list(timestamps // MINUTE) == [8, 9, 10, 11] and values[1, 3] == 99
+    assert list(store.read('BTCUSDT', '1m', limit=2)[0] // MINUTE) == [10, 11]
+
+    frame = store.read_frame('BTCUSDT', '1m', limit=3)
+    assert list(frame.columns) == ['timestamp', 'open', 'high', 'low', 'close', 'volume']
+    assert frame['close'].tolist() == [99, 10.5, 11.5]
+
+
+def test_incomplete_trailing_record_is_ignored(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    store.write('ETHUSDT', '1h', *candles(0, 5))
+    with open(store.path('ETHUSDT', '1h'), 'ab') as f:
+        f.write(b'\0' * (RECORD.itemsize // 2))
+
+    assert len(store.read('ETHUSDT', '1h')[0]) == 5
+    assert store.write('ETHUSDT', '1h', *candles(5, 1)) == 6
+    assert os.path.getsize(store.path('ETHUSDT', '1h')) == 6 * RECORD.itemsize
+
+
+def test_write_after_a_gap_replaces_the_stored_candles(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    store.write('SOLUSDT', '1m', *candles(0, 10))
+    # Vela siguiente: se agrega
+    assert store.write('SOLUSDT', '1m', *candles(10, 1), period_ms=MINUTE) == 11
+    # Tras un apagado largo llegan velas posteriores a un hueco: el archivo no debe quedar con él
+    assert store.write('SOLUSDT', '1m', *candles(20, 5), period_ms=MINUTE) == 5
+
+    assert store.bounds('SOLUSDT', '1m') == (20 * MINUTE, 24 * MINUTE)
+    assert list(store.read('SOLUSDT', '1m')[0] // MINUTE) == [20, 21, 22, 23, 24]
+
+
+def test_write_trims_the_file_when_it_doubles_the_retention(tmp_path):
+    store = OHLCVStore(str(tmp_path))
+    assert store.write('ADAUSDT', '1m', *candles(0, 20), period_ms=MINUTE, max_records=10) == 20
+    # Supera el doble de la retención: quedan las últimas 10
+    assert store.write('ADAUSDT', '1m', *candles(20, 1), period_ms=MINUTE, max_records=10) == 10
+    assert store.bounds('ADAUSDT', '1m') == (11 * MINUTE, 20 * MINUTE)
+    assert store.write('ADAUSDT', '1m', *candles(21, 1), period_ms=MINUTE, max_records=10) == 11
+    assert list(store.read('ADAUSDT', '1m', limit=2)[0] // MINUTE) == [20, 21]
+    assert not os.path.exists(store.path('ADAUSDT', '1m') + '.tmp')
@@ -0,0 +1,319 @@
+"""
+Tests del compilador de estrategias
+Verifica la compilación de bloques a plan y su ejecución sobre datos sintéticos
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from strategy_compiler import compile_strategy, StrategyCompileError
+from strategy_evaluator import StrategyEvaluator
+
+
+def make_df(n: int = 300, seed: int = 7) -> pd.DataFrame:
+    """Velas sintéticas reproducibles"""
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(0, 1, n))
+    high = close + rng.uniform(0.1, 1.5, n)
+    low = close - rng.uniform(0.1, 1.5, n)
+    open_ = close + rng.normal(0, 0.3, n)
+    return pd.DataFrame({
+        'timestamp': pd.date_range('2026-01-01', periods=n, freq='15min'),
+        'open': open_,
+        'high': high,
+        'low': low,
+        'close': close,
+        'volume': rng.uniform(10, 100, n),
+    })
+
+
+def block(block_type, name, **params):
+    return {'type': block_type, 'name': name, 'params': params}
+
+
+def test_compile_normalizes_builder_param_keys():
+    strategy = {'entry_long': [
+        block('value', 'Price'),
+        block('operator', 'GreaterThan', block_2_left='', block_2_right=''),
+        block('indicator', 'EMA', block_3_period='50'),
+    ]}
+    plan = compile_strategy(strategy)
+
+    program = plan.get('entry_long')
+    assert [i.op for i in program] == ['price', 'indicator', 'compare']
+    assert program[1].params['period'] == 50
+    assert plan.get('exit_long') == ()
+
+
+def test_plan_matches_manual_evaluation():
+    df = make_df()
+    evaluator = StrategyEvaluator()
+    strategy = {
+        'entry_long': [
+            block('value', 'Price'),
+            block('operator', 'GreaterThan'),
+            block('indicator', 'EMA', period='50'),
+            block('condition', 'AND'),
+            block('indicator', 'RSI', period='14'),
+            block('operator', 'LessThan'),
+            block('value', 'Number', value='70'),
+        ],
+    }
+    plan = compile_strategy(strategy)
+
+    close = df['close'].iloc[-1]
+    ema = evaluator.market_data.calculate_ema(df, 50).iloc[-1]
+    rsi = evaluator.market_data.calculate_rsi(df, 14).iloc[-1]
+    assert evaluator.execute_plan(df, plan, 'entry_long') == bool(close > ema and rsi < 70)
+
+
+def test_legacy_postfix_logic_is_supported():
+    plan = compile_strategy({'exit_short': [
+        block('value', 'Price'),
+        block('comparison', 'GreaterThan'),
+        block('value', 'Number', value='1'),
+        block('value', 'Price'),
+        block('comparison', 'LessThan'),
+        block('value', 'Number', value='2'),
+        block('logic', 'AND'),
+    ]})
+
+    assert [i.name for i in plan.get('exit_short')][-1] == 'AND'
+
+
+def test_crosses_followed_by_comparator_is_merged():
+    plan = compile_strategy({'entry_short': [
+        block('indicator', 'MACD'),
+        block('operator', 'Crosses'),
+        block('operator', 'LessThan'),
+        block('value', 'Number', value='0'),
+    ]})
+
+    compare = plan.get('entry_short')[-1]
+    assert compare.name == 'Crosses'
+    assert compare.arg == 'below'
+
+
+@pytest.mark.parametrize('blocks', [
+    [block('indicator', 'FOO')],
+    [block('operator', 'GreaterThan'), block('value', 'Price')],
+    [block('value', 'Price'), block('operator', 'GreaterThan')],
+    [block('indicator', 'MACD', component='nope')],
+    [block('indicator', 'EMA', period='abc')],
+    [block('mystery', 'Price')],
+])
+def test_malformed_strategies_are_rejected(blocks):
+    with pytest.raises(StrategyCompileError):
+        compile_strategy({'entry_long': blocks})
+
+
+def test_plan_is_immutable():
+    plan = compile_strategy({'entry_long': [block('value', 'Price')]})
+
+    with pytest.raises(AttributeError):
+        plan.extra = 1
+    with pytest.raises(TypeError):
+        plan.zones['entry_long'] = ()
+
+
+def test_indicator_graph_is_shared_between_zones():
+    plan = compile_strategy({
+        'entry_long': [
+            block('value', 'Price'), block('operator', 'GreaterThan'), block('indicator', 'EMA', period='12'),
+        ],
+        'exit_long': [
+            block('value', 'Price'), block('operator', 'LessThan'), block('indicator', 'EMA', period='12'),
+        ],
+        'entry_short': [
+            block('indicator', 'MACD', fast='12', slow='26', signal='9', component='histogram'),
+            block('operator', 'LessThan'),
+            block('value', 'Number', value='0'),
+        ],
+        'exit_short': [
+            block('indicator', 'MACD', fast='12', slow='26', signal='9', component='signal'),
+            block('operator', 'GreaterThan'),
+            block('indicator', 'BBands', period='20', std='2', band='lower'),
+        ],
+    })
+
+    assert plan.nodes == (
+        ('EMA', 12), ('EMA', 26), ('MACD', 12, 26, 9),
+        ('SMA', 20), ('STD', 20), ('BBands', 20, 2.0),
+    )
+
+
+def test_evaluate_plan_matches_per_zone_evaluation():
+    df = make_df()
+    evaluator = StrategyEvaluator()
+    strategy = {
+        'entry_long': [
+            block('indicator', 'EMA', period='12'), block('operator', 'GreaterThan'),
+            block('indicator', 'EMA', period='26'),
+        ],
+        'exit_long': [
+            block('indicator', 'MACD', component='histogram'), block('operator', 'LessThan'),
+            block('value', 'Number', value='0'),
+        ],
+        'entry_short': [
+            block('value', 'Price'), block('operator', 'LessThan'),
+            block('indicator', 'BBands', band='lower'),
+        ],
+        'exit_short': [
+            block('indicator', 'Swing', lookback='3', type='low'), block('operator', 'LessThan'),
+            block('value', 'Price'),
+        ],
+    }
+
+    results = evaluator.evaluate_plan(df, compile_strategy(strategy))
+
+    for zone, result in results.items():
+        assert result == evaluator.evaluate_strategy(df, strategy, zone)
+
+    macd = evaluator.market_data.calculate_macd(df)
+    assert results['exit_long'] == bool(macd['histogram'].iloc[-1] < 0)
+
+
+def test_indicators_are_shared_through_the_snapshot_cache():
+    from indicator_cache import indicator_cache, snapshot_timestamp
+
+    df = make_df()
+    strategy = {'entry_long': [
+        block('value', 'Price'), block('operator', 'GreaterThan'), block('indicator', 'EMA', period='50'),
+    ]}
+    plan = compile_strategy(strategy)
+    first, second = StrategyEvaluator(), StrategyEvaluator()
+    indicator_cache.clear()
+    indicator_cache.on_snapshot('TESTUSDT', '15m', 1, snapshot_timestamp(df))
+
+    calls = []
+    original = second.market_data.calculate_ema
+    second.market_data.calculate_ema = lambda *args: calls.append(args) or original(*args)
+
+    result = first.evaluate_plan(df, plan, ('TESTUSDT', '15m', 1))
+    assert second.evaluate_plan(df, plan, ('TESTUSDT', '15m', 1)) == result
+    assert calls == []
+
+    # Un snapshot nuevo descarta los indicadores del anterior
+    indicator_cache.on_snapshot('TESTUSDT', '15m', 2, snapshot_timestamp(df))
+    second.evaluate_plan(df, plan, ('TESTUSDT', '15m', 2))
+    assert len(calls) == 1
+    indicator_cache.clear()
+
+
+SERIES_STRATEGY = {
+    'entry_long': [
+        block('indicator', 'EMA', period='12'), block('operator', 'GreaterThan'),
+        block('indicator', 'EMA', period='26'),
+        block('condition', 'AND'),
+        block('indicator', 'RSI', period='14'), block('operator', 'LessThan'),
+        block('value', 'Number', value='70'),
+    ],
+    'exit_long': [
+        block('value', 'Price'), block('operator', 'LessThan'),
+        block('indicator', 'Swing', lookback='3', type='low'),
+        block('condition', 'OR'),
+        block('indicator', 'MACD', component='histogram'), block('operator', 'LessThan'),
+        block('value', 'Number', value='0'),
+    ],
+    'entry_short': [
+        block('condition', 'NOT'),
+        block('value', 'Price'), block('operator', 'GreaterThan'),
+        block('indicator', 'BBands', band='lower'),
+    ],
+    'exit_short': [
+        block('value', 'Price'), block('operator', 'GreaterThan'),
+        block('indicator', 'Swing', lookback='5', type='high'),
+    ],
+}
+
+
+def test_series_evaluation_matches_scalar_on_every_prefix():
+    df = make_df(120)
+    evaluator = StrategyEvaluator()
+    plan = compile_strategy(SERIES_STRATEGY)
+
+    signals = evaluator.evaluate_plan_series(df, plan)
+
+    for zone, values in signals.items():
+        assert values.dtype == bool and len(values) == len(df)
+    # Sin mirar al futuro: cada vela coincide con la evaluación escalar hasta esa vela
+    for t in range(0, len(df), 7):
+        expected = evaluator.evaluate_plan(df.iloc[:t + 1], plan)
+        assert {zone: bool(values[t]) for zone, values in signals.items()} == expected
+    assert {zone: bool(values[-1]) for zone, values in signals.items()} == evaluator.evaluate_plan(df, plan)
+
+
+def test_not_negates_the_whole_comparison():
+    df = make_df(300)
+    price_above_band = [block('value', 'Price'), block('operator', 'GreaterThan'),
+                        block('indicator', 'BBands', band='lower')]
+    rsi_below = [block('indicator', 'RSI', period='14'), block('operator', 'LessThan'),
+                 block('value', 'Number', value='60')]
+    plan = compile_strategy({
+        'entry_long': price_above_band,
+        'exit_long': rsi_below,
+        'entry_short': [block('condition', 'NOT'), *price_above_band],
+        'exit_short': [block('condition', 'NOT'), *price_above_band, block('condition', 'AND'), *rsi_below],
+    })
+
+    signals = StrategyEvaluator().evaluate_plan_series(df, plan)
+    assert signals['entry_short'].any() and signals['entry_long'].any()
+    np.testing.assert_array_equal(signals['entry_short'], ~signals['entry_long'])
+    np.testing.assert_array_equal(signals['exit_short'], ~signals['entry_long'] & signals['exit_long'])
+
+
+def test_series_evaluation_of_empty_zone_is_all_false():
+    df = make_df(50)
+    plan = compile_strategy({'entry_long': [block('value', 'Price')]})
+
+    signals = StrategyEvaluator().evaluate_plan_series(df, plan)
+    assert signals['entry_long'].all()
+    assert not signals['exit_short'].any()
+
+
+def crossing_df():
+    """Cierre que cruza 100 hacia arriba en la vela 3 y hacia abajo en la 6"""
+    df = make_df(8)
+    df['close'] = [98.0, 99.0, 99.5, 101.0, 102.0, 101.5, 97.0, 96.0]
+    return df
+
+
+@pytest.mark.parametrize('blocks, expected', [
+    ([block('operator', 'CrossesAbove')], [3]),
+    ([block('operator', 'CrossesBelow')], [6]),
+    ([block('operator', 'Crosses'), block('operator', 'GreaterThan')], [3]),
+    ([block('operator', 'Crosses'), block('operator', 'LessThan')], [6]),
+    ([block('operator', 'Crosses')], [3, 6]),
+])
+def test_crosses_compare_previous_and_current_bar(blocks, expected):
+    df = crossing_df()
+    evaluator = StrategyEvaluator()
+    plan = compile_strategy({'entry_long': [
+        block('value', 'Price'), *blocks, block('value', 'Number', value='100'),
+    ]})
+
+    signals = evaluator.evaluate_plan_series(df, plan)['entry_long']
+    assert list(np.flatnonzero(signals)) == expected
+
+    # El camino en vivo solo dispara en la vela del cruce, no mientras se mantiene
+    live = [evaluator.execute_plan(df.iloc[:t + 1], plan, 'entry_long') for t in range(len(df))]
+    assert [t for t, fired in enumerate(live) if fired] == expected
+
+
+def test_crosses_between_indicators_matches_manual_detection():
+    df = make_df(300)
+    evaluator = StrategyEvaluator()
+    plan = compile_strategy({'entry_long': [
+        block('indicator', 'EMA', period='12'), block('operator', 'CrossesAbove'),
+        block('indicator', 'EMA', period='26'),
+    ]})
+
+    fast = evaluator.market_data.calculate_ema(df, 12).to_numpy()
+    slow = evaluator.market_data.calculate_ema(df, 26).to_numpy()
+    manual = np.zeros(len(df), dtype=bool)
+    manual[1:] = (fast[1:] > slow[1:]) & (fast[:-1] <= slow[:-1])
+
+    signals = evaluator.evaluate_plan_series(df, plan)['entry_long']
+    np.testing.assert_array_equal(signals, manual)
+    assert manual.sum() > 0